@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+
+"""
+Auto-discovery of the dongles and of the sensors connected to them,
+instead of the hand-edited activation in main.
+
+All serial ports and all IO-Warriors are probed at the same time, each
+dongle is identified by its handshake (ELV banner, ISS module ID, IOW
+product ID); then the buses of all dongles are swept at the same time for
+the known sensors, identified by their chip ID where they have one.
+"""
+
+import concurrent.futures
+import serial.tools.list_ports
+
+from i2cusbdongles import glob
+from i2cusbdongles import util
+from i2cusbdongles.dongles import ELV
+from i2cusbdongles.dongles import ISS
+try:
+    from i2cusbdongles.dongles import IOW
+except ImportError:
+    IOW = None
+
+
+def probePort(usbport, timeout=0.2):
+    """ identifies the dongle at the serial port usbport
+    returns "ISSdongle", "ELVdongle" or None"""
+
+    # the ELV first: its text has no ISS command byte, while the 'Z' of the
+    # ISS version command starts an ELV reset command
+    if ELV.ELVprobe(usbport, timeout=timeout): return "ELVdongle"
+    if ISS.ISSprobe(usbport, timeout=timeout): return "ISSdongle"
+
+    return None
+
+
+def openDongle(kind, usbport=None, serial=None, iowlib=None):
+    """ opens a dongle identified by probePort or an IO-Warrior;
+    returns the dongle, None if it failed """
+
+    try:
+        if   kind == "ELVdongle":   return ELV.ELVdongle(usbport=usbport)
+        elif kind == "ISSdongle":   return ISS.ISSdongle(busclock=glob.iss_busclock, hardware=glob.iss_hardware, usbport=usbport)
+        elif kind == "IOW-DG":      return IOW.IOWdongle(disable_pullups=glob.disable_pullups, i2ctimeout=glob.iow_i2ctimeout,
+                                                         lib=iowlib, serial=serial)
+    except (Exception, SystemExit) as e:    # the dongles exit on failures
+        util.ecprint("{} at {} could not be opened: {}".format(kind, usbport or serial, e))
+
+    return None
+
+
+def discoverDongles(ports=None, iowlib=None, timeout=0.2):
+    """ probes all serial ports and IO-Warriors in parallel and opens the
+    dongles found
+    ports:  list of serial ports, default is all ports of the system
+    iowlib: a stand-in for the iowkit library (like SIM.SIMiowkit)
+    returns a list of (key, dongle); key is as in glob.dongles for the
+    1st dongle of each kind, further ones get the port or serial appended"""
+
+    if ports is None: ports = [p.device for p in serial.tools.list_ports.comports()]
+    iows = []
+    if IOW is not None:
+        iows = [sno for num, handle, sno, pid in IOW.IOWdevices(iowlib) if pid in IOW.IOWKIT_PRODUCT_IDS_I2C]
+
+    def probeAndOpen(usbport):
+        kind = probePort(usbport, timeout=timeout)
+        return (kind, usbport, openDongle(kind, usbport=usbport)) if kind else None
+
+    # probing waits mostly for the timeout of silent ports; one thread each
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(ports)), thread_name_prefix="discovery") as pool:
+        found = [f for f in pool.map(probeAndOpen, ports) if f is not None]
+
+    # the IO-Warriors share the library, they are opened one after the other
+    found += [("IOW-DG", sno, openDongle("IOW-DG", serial=sno, iowlib=iowlib)) for sno in iows]
+
+    dongles = []
+    for kind, where, dongle in found:
+        if dongle is None: continue
+        key = kind if kind not in (k for k, d in dongles) else "{}:{}".format(kind, where)
+        dongles.append((key, dongle))
+        util.fncprint("Discovered {:12s} at {}".format(key, where))
+
+    return dongles
+
+
+def isLM75(answ):
+    """ the LM75 has no ID: a temperature within -55 ... 125 °C and not the
+    0xFF, 0xFF of a floating bus or the 0x00, 0x00 of a missing answer """
+
+    if answ is None or len(answ) < 2 or tuple(answ[:2]) in ((0xFF, 0xFF), (0x00, 0x00)): return False
+
+    return -55 <= int.from_bytes(bytes(answ[:2]), "big", signed=True) / 256 <= 125
+
+
+def isSCD4x(answ):
+    """ the serial number of the SCD4x: 3 words, each followed by its CRC """
+
+    if answ is None or len(answ) < 9: return False
+
+    return all(crc8(answ[i:i + 2]) == answ[i + 2] for i in (0, 3, 6))
+
+
+def crc8(data, crc=0xFF):
+    """ CRC-8 of the Sensirion sensors, polynomial 0x31 """
+
+    for byte in data:
+        crc ^= byte
+        for bit in range(8): crc = ((crc << 1) ^ 0x31) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+
+    return crc
+
+
+# the sensors found by discoverSensors:
+# (sensors in order of preference, addresses, data to write, no of bytes to read, check of the answer)
+# HT16K33 (no ID) and SHT7x (not I2C compliant) are not discovered
+KNOWN_SENSORS = [
+    ((glob.BME280,),            (0x77, 0x76),       [0xD0],         1, lambda a: a is not None and a[0] == glob.BME280["type"]),
+    ((glob.TSL2591,),           (0x29,),            [0xA0 + 0x12],  1, lambda a: a is not None and a[0] == glob.TSL2591["type"]),
+    ((glob.LM75,),              range(0x48, 0x50),  [0x00],         2, isLM75),
+    ((glob.SCD41, glob.SCD40),  (0x62,),            [0x36, 0x82],   9, isSCD4x), # types can't be told apart
+]
+
+
+def sweepBus(dongle):
+    """ asks the addresses of KNOWN_SENSORS on the bus of dongle; only those
+    which ACK if the dongle can scan its bus (see Dongle.scanBus)
+    returns the list of (sensors, addr) found"""
+
+    acked = dongle.scanBus(doPrint=False)
+    found = []
+    for sensors, addrs, data, rbytes, check in KNOWN_SENSORS:
+        for addr in addrs:
+            if acked is not NotImplemented and addr not in acked: continue
+            try:
+                answ = dongle.askDongle(addr, data, rbytes, name="discover", info="0x{:02X}".format(addr), doPrint=False)
+            except Exception:
+                answ = None
+            if check(answ):
+                found.append((sensors, addr))
+                break
+
+    return found
+
+
+def discoverSensors(dongles):
+    """ sweeps the buses of all dongles at the same time, each on the worker
+    of its dongle; the sensors found get their "dngl" and "addr" set
+    dongles: list of (key, dongle) as from discoverDongles
+    returns the topology {key: [(sensor name, addr), ...]}"""
+
+    futures  = [(key, dongle, dongle.submit(sweepBus, dongle)) for key, dongle in dongles]
+
+    topology = {}
+    for key, dongle, future in futures:
+        topology[key] = []
+        for sensors, addr in future.result():
+            free = [s for s in sensors if s["dngl"] is None]
+            if not free:
+                util.ecprint("{} at 0x{:02X} on {} ignored, already connected".format(sensors[0]["name"], addr, key))
+                continue
+            free[0]["dngl"] = dongle
+            free[0]["addr"] = addr
+            topology[key].append((free[0]["name"], addr))
+            util.fncprint("Discovered {:12s} at 0x{:02X} on {}".format(free[0]["name"], addr, key))
+
+    return topology
+
+
+def discover(ports=None, iowlib=None, timeout=0.2):
+    """ discovers dongles and sensors; the dongles are put into glob.dongles
+    returns the topology as from discoverSensors """
+
+    dongles = discoverDongles(ports=ports, iowlib=iowlib, timeout=timeout)
+    for key, dongle in dongles: glob.dongles[key] = dongle
+
+    return discoverSensors(dongles)
@@ -5,11 +5,23 @@
 Code for a Generic Dongle
 """
 
+import asyncio
+import concurrent.futures
+
+from i2cusbdongles.dongles.Trace import Trace
+from i2cusbdongles.dongles.Stats import Stats
+from i2cusbdongles.dongles.Retry import RetryPolicy
+
 class Dongle:
     """Code for a genereic Dongle"""
 
     name        = "Genericdongle"
     short       = "dongle"
+    worker      = None                  # started with the 1st submit
+    trace       = Trace()               # the transfers of all dongles, see Trace.py
+    stats       = Stats()               # the latencies of all dongles, see Stats.py
+    retryPolicy = RetryPolicy()         # for failed transactions, see Retry.py
+    retryPolicies = {}                  # the policies of single sensors, by their name
 
     def __init__(self):
         """Initializes the dongle"""
@@ -22,8 +34,132 @@ class Dongle:
         return NotImplemented
 
 
+    def askDongleBatch(self, transactions, name="no name", info="no info", doPrint=True, end="\n"):
+        """ Asks the dongle for several transactions in one call.
+        transactions: list of (addr, data, rbytes, wait_time), with the same
+        meaning as the arguments of askDongle
+        returns the list of answers, one per transaction (None if rbytes == 0,
+        or if the transaction failed, as for askDongle)
+
+        This generic version asks one transaction after the other; dongles
+        overwrite it to send the whole batch in as few USB round trips as possible"""
+
+        answers = []
+        for addr, data, rbytes, wait_time in transactions:
+            answers.append(self.askDongle(addr, data, rbytes, wait_time=wait_time, name=name, info=info, doPrint=doPrint, end=end))
+
+        return answers
+
+
+    def retries(self, name):
+        """ The attempts of a transaction for the sensor name, by its retry
+        policy; use as: for attempt in self.retries(name): ... break if ok """
+
+        return self.retryPolicies.get(name, self.retryPolicy).tries()
+
+
+    def ident(self):
+        """ Identifies the dongle across restarts (e.g. for the calibration
+        cache of sensors): its name with its serial number, USB port or device """
+
+        for attr in ("serial", "usbport", "device"):
+            value = getattr(self, attr, None)
+            if value is not None and str(value) in self.name: return self.name     # like IOW, named by it
+            if value is not None: return "{} {}".format(self.name, value)
+
+        return self.name
+
+
+    def scanBus(self, first=0x03, last=0x77, doPrint=True):
+        """ Probes the 7bit addresses first ... last with the cheapest probe
+        of the dongle; prints the map of the bus (see showBusMap)
+        returns the list of addresses, which ACK """
+
+        return NotImplemented
+
+
+    def showBusMap(self, addrs, first=0x03, last=0x77):
+        """ Prints the addresses found by scanBus as a map, 16 per row like
+        i2cdetect: the address where found, -- where not, blank if not probed """
+
+        print("\n---- Bus Map {}".format(self.name))
+        print("    " + "".join(" {:2x}".format(col) for col in range(16)))
+        for row in range(0, 0x80, 16):
+            line = "{:02x}: ".format(row)
+            for addr in range(row, row + 16):
+                if   addr in addrs:                 line += " {:02x}".format(addr)
+                elif first <= addr <= last:         line += " --"
+                else:                               line += "   "
+            print(line)
+
+
+    def submit(self, func, *args, **kwargs):
+        """ Queues func(*args, **kwargs) for the worker thread of this dongle;
+        the requests to one dongle run one after the other, those to
+        different dongles at the same time. func is anything using the
+        dongle, like askDongle or the read function of a sensor on it
+        returns a concurrent.futures.Future with the result of func """
+
+        if self.worker is None:
+            self.worker = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.name)
+
+        return self.worker.submit(func, *args, **kwargs)
+
+
+    def askDongleFuture(self, addr, data, rbytes, wait_time=0, name="no name", info="no info", doPrint=True, end="\n"):
+        """ askDongle on the worker thread; returns a Future with the answer """
+
+        return self.submit(self.askDongle, addr, data, rbytes, wait_time=wait_time, name=name, info=info, doPrint=doPrint, end=end)
+
+
+    def askDongleBatchFuture(self, transactions, name="no name", info="no info", doPrint=True, end="\n"):
+        """ askDongleBatch on the worker thread; returns a Future with the answers """
+
+        return self.submit(self.askDongleBatch, transactions, name=name, info=info, doPrint=doPrint, end=end)
+
+
+    async def askDongleAsync(self, addr, data, rbytes, wait_time=0, name="no name", info="no info", doPrint=True, end="\n"):
+        """ askDongle for an asyncio event loop; the USB I/O runs on the
+        worker thread. The wait after a write only (rbytes == 0) is an
+        asyncio.sleep, so that other requests may use the dongle meanwhile;
+        the wait between write and read stays in askDongle, as the dongles
+        keep the bus between both """
+
+        if rbytes > 0 or wait_time <= 2:
+            return await asyncio.wrap_future(self.askDongleFuture(addr, data, rbytes, wait_time=wait_time, name=name, info=info, doPrint=doPrint, end=end))
+
+        await asyncio.wrap_future(self.askDongleFuture(addr, data, 0, name=name, info=info, doPrint=doPrint, end=end))
+        await asyncio.sleep(wait_time / 1000)
+
+
+    async def askDongleBatchAsync(self, transactions, name="no name", info="no info", doPrint=True, end="\n"):
+        """ askDongleBatch for an asyncio event loop; the batch is split after
+        each write only transaction with a wait_time, which becomes an
+        asyncio.sleep (see askDongleAsync) """
+
+        answers = []
+        start   = 0
+        for i, (addr, data, rbytes, wait_time) in enumerate(transactions):
+            if rbytes > 0 or wait_time <= 2: continue
+            part     = list(transactions[start:i]) + [(addr, data, 0, 0)]
+            answers += await asyncio.wrap_future(self.askDongleBatchFuture(part, name=name, info=info, doPrint=doPrint, end=end))
+            await asyncio.sleep(wait_time / 1000)
+            start    = i + 1
+        if start < len(transactions):
+            answers += await asyncio.wrap_future(self.askDongleBatchFuture(transactions[start:], name=name, info=info, doPrint=doPrint, end=end))
+
+        return answers
+
+
+    def stopWorker(self):
+        """ Waits for the queued requests, then stops the worker thread """
+
+        if self.worker is not None: self.worker.shutdown()
+        self.worker = None
+
+
     def close(self):
         """ Closes the dongle """
 
+        self.stopWorker()
         print(self.name + " is closed")
-
@@ -5,11 +5,62 @@
 Code for the ELV USB-I2C Dongle
 """
 
-import sys, serial, time
+import sys, serial, time, math, itertools
+import binascii
 
 #from I2Cpytools import glob
 from i2cusbdongles import util
 from i2cusbdongles.dongles.Dongle import Dongle
+from i2cusbdongles.dongles.Trace import TRACE_NOADDR, TRACE_OK, TRACE_NACK, TRACE_TIMEOUT
+
+
+# hex codec of the ELV ASCII protocol -----------------------------------------
+# the data bytes travel as upper case hex pairs, separated by a space
+#
+
+def ELVencodeHex(data):
+    """ bulk hex encoding of the data bytes for a command
+    [0xF4, 0xD6] -> b'F4 D6' """
+
+    return binascii.hexlify(bytes(data), b" ").upper()
+
+
+def ELVdecodeHex(rec):
+    """ bulk hex decoding of a reply line, surrounding blanks are ignored
+    b'BE 6E 9A ' -> bytes, indexing gives int: 190, 110, 154
+    only the complete hex pairs of a truncated line are decoded:
+    b'BE 6E 9' -> b'\\xbe\\x6e' """
+
+    rec = rec.strip()
+
+    return bytes.fromhex(rec[:3*(len(rec + b" ")//3)].decode("ASCII"))
+
+
+def ELVisError(rec):
+    """ True if the reply line is an error msg from the dongle """
+
+    rec = rec.strip()
+
+    return rec.startswith(b"Solve ") or rec.startswith(b"Err: ")
+
+#
+# end hex codec ---------------------------------------------------------------
+
+
+def ELVprobe(usbport, timeout=0.2):
+    """ True if an ELV dongle answers at the serial port usbport with its
+    banner; the port is closed again, nothing is printed """
+
+    try:
+        with serial.Serial(usbport, ELVdongle.baudrate, timeout=timeout) as ser:
+            ser.write(b'<Y30?')         # as in ELVdongle.__init__
+            rec = ser.read_until(ELVdongle.terminator)
+    except Exception:
+        return False
+
+    return rec.strip().startswith(b"ELV")
+
+
 
 class ELVdongle(Dongle):
     """Code for the ELV USB-I2C Dongle"""
@@ -19,16 +70,33 @@ class ELVdongle(Dongle):
 
     # Serial port
     ser         = None                  # serial port handle
+    macro_rlist = []                    # no of bytes of each transaction of the uploaded macro
     baudrates   = [1200, 2400, 4800, 9600, 14400, 19200, 28800, 38400, 57600, 115200]
     baudrate    = baudrates[9]          # 115200
     usbport     = '/dev/ttyUSB0'        #
     timeout     = 0.2                   # what is needed?
+    terminator  = b"\r\n"               # every reply line ends with CR, LF
+    quiet       = 0.01                  # sec without new bytes to end a multi-line reply
 
     #              ELV name    xX   time   reqB   wrt/rec   info     rec
     pTemplate   = "ELV {:7s} {:2s} {:10s} [{:3d}] [{:3d}]  {:20s} == {}"
 
-    def __init__(self):
-        """opening the serial port and testing for correct dongle"""
+    # Macro memory (shown with ELVshowMacro); an uploaded macro is read
+    # back and compared, so that the dongle confirms these commands
+    macroSize   = 255                   # bytes of macro memory
+    macroWrite  = b'W'                  # stores the following text up to macroEnd as macro
+    macroEnd    = b'\r'                 # ends the macro text
+    macroStart  = b'>'                  # runs the macro
+    macroStop   = b'<'                  # stops a running macro
+    macroWait   = "L{:02X}"             # wait for n ms (n <= 255)
+
+    scanChunk   = 16                    # reads per command string of scanBus
+
+    def __init__(self, usbport=None):
+        """opening the serial port and testing for correct dongle
+        usbport: serial port of the dongle, default see class (or ELVprobe)"""
+
+        if usbport is not None: self.usbport = usbport
 
         # open serial port
         try:
@@ -83,112 +151,338 @@ class ELVdongle(Dongle):
         print(rd[2])
 
 
+    def ELVreadMacro(self):
+        """ The text in the macro memory, as dumped by 'U' """
+
+        self.ELVwriteAdmin(b'U', name=self.short, info="Read Macrocode")
+        rec = self.ELVreadAdmin(self.macroSize + 26, name=self.short, info="")
+        rd  = rec.split(b"\r\n")
+
+        return rd[1] if len(rd) > 1 else b""
+
+
+    def ELVcompileMacro(self, transactions):
+        """ Compile a cycle of transactions (as for askDongleBatch) into the
+        text of a macro; a wait_time becomes a wait command in the macro.
+        Returns the macro and the no of bytes of each transaction"""
+
+        commands = []
+        rlist    = []
+        for addr, data, rbytes, wait_time in transactions:
+            commands.append(self.__writeCommand(addr, data))
+            wait = math.ceil(wait_time)
+            while wait > 0:
+                commands.append(bytes(self.macroWait.format(min(wait, 255)), 'ASCII'))
+                wait -= min(wait, 255)
+            if rbytes > 0: commands.append(self.__readCommand(addr, rbytes))
+            rlist.append(rbytes)
+        macro = b" ".join(commands)
+
+        if len(macro) > self.macroSize:
+            util.fecprint("Macro of {} bytes is too long for the macro memory of {} bytes".format(len(macro), self.macroSize))
+            return None, rlist
+
+        return macro, rlist
+
+
+    def ELVuploadMacro(self, transactions):
+        """ Compile the transactions and store them as macro in the dongle;
+        afterwards ELVrunMacro does a whole cycle. The macro memory is read
+        back, a macro not stored as sent is not used
+        returns True if the macro is stored """
+
+        macro, rlist = self.ELVcompileMacro(transactions)
+        if macro is None: return False
+
+        self.ELVwriteAdmin(self.macroStop + self.macroWrite + macro + self.macroEnd, name=self.short, info="Upload Macro")
+        self.ELVreadAdmin(name=self.short, info="")
+        if not self.ELVreadMacro().strip().upper().startswith(macro):
+            util.fecprint("ELV Macro not stored by the dongle - not used")
+            self.macro_rlist = []
+            return False
+
+        self.macro_rlist = rlist
+        util.fncprint("ELV Macro of {} bytes uploaded".format(len(macro)))
+
+        return True
+
+
+    def ELVrunMacro(self, name="macro", info="run Macro", doPrint=True, end="\n"):
+        """ Start the uploaded macro and parse its combined reply;
+        returns the list of answers like askDongleBatch """
+
+        wrt = self.ser.write(self.macroStart)
+        self.trace.record(self.name, TRACE_NOADDR, "TM", self.macroStart)
+        if doPrint and self.trace.echo: print(self.pTemplate.format(name, "TM", util.strtime()[11:], len(self.macroStart), wrt, info, self.macroStart))
+
+        lines = self.ELVreadBatch([r for r in self.macro_rlist if r > 0], name=name, doPrint=doPrint)
+        if doPrint and self.trace.echo: print(end=end)
+
+        lines   = iter(lines)
+
+        return [next(lines) if rbytes > 0 else None for rbytes in self.macro_rlist]
+
+
     def ELVwriteAdmin (self, command, name= "-", info = "no info"):
         """write to the ELV USB-I2C - only for its interal admin functions"""
 
         command = command.upper()
         wrt     = self.ser.write(command)  # wrt = no of bytes written
+        self.trace.record(self.name, TRACE_NOADDR, "TA", command)
         print( self.pTemplate.format(name, "TA", util.strtime()[11:], len(command), wrt, info, command))
 
 
     def ELVreadAdmin (self, length = 100, name = "-", info = "no info"):
         """read from the ELV USB-I2C - only for its internal admin functions"""
 
-        rec = self.ser.read(length)
-        cnt = self.ser.in_waiting
-        if cnt > 0:
-            util.bell()
-            print("Bytes waiting:", cnt)
-            while True:            # read single byte until nothing is returned
-                x = self.ser.read(1)
-                if len(x) == 0: break
-                rec += x
+        rec = self.ELVreadLine()
+        while len(rec) < length:   # more lines, until dongle is quiet
+            time.sleep(self.quiet)
+            x = self.ELVdrain()
+            if len(x) == 0: break
+            rec += x
         print("ELVreadAdmin: len(rec), rec:", len(rec), rec)
         rec = rec.strip()
+        self.trace.record(self.name, TRACE_NOADDR, "RA", rec)
         print( self.pTemplate.format(name, "RA", util.strtime()[11:], length, len(rec), info, rec))
 
         return rec
 
 
     def askDongle(self, addr, data, rbytes, wait_time=0, name="no name", info="no info", doPrint=True, end="\n"):
-        """ Function doc """
+        """ Writes data, then reads rbytes; a read answered with an error msg
+        or incomplete is repeated by the retry policy (see Retry.py)
+        returns None when the policy gave up """
 
+        t0 = self.stats.clock()
         self.ELVwriteData(addr, data, name=name, info=info, doPrint=doPrint)
+        t1 = t2 = self.stats.clock()
         if rbytes > 0:
             if wait_time>2: time.sleep(wait_time/1000)
-            self.ELVinitializeRead(addr, rbytes, name=name, doPrint=doPrint)
-            answ = self.ELVreadData(length=rbytes, name=name, doPrint=doPrint)
-            if doPrint: print(end=end)
+            t2 = self.stats.clock()
+            for attempt in self.retries(name):     # only the read is repeated
+                self.ELVinitializeRead(addr, rbytes, name=name, doPrint=doPrint)
+                answ = self.ELVreadData(length=rbytes, addr=addr, name=name, doPrint=doPrint)
+                if doPrint and self.trace.echo: print(end=end)
+                if not ELVisError(answ) and len(answ) == rbytes: break
+                self.stats.failure(self.name, name, "NoACK" if ELVisError(answ) else "no data")
+                self.ELVdrain()                 # the late rest of an incomplete line
+            else:
+                self.stats.failure(self.name, name, "given up")
+                answ = None
         else:
             answ = None
+        self.stats.record(self.name, name, info, t0, t1, t2, self.stats.clock())
 
         return answ
 
 
+    def askDongleBatch(self, transactions, name="no name", info="no info", doPrint=True, end="\n"):
+        """ All transactions are concatenated into one ASCII command string,
+        which is only split where a wait_time is needed; the answers of all
+        reading transactions are then read in one go. A read answered with an
+        error msg or incomplete is asked again by askDongle"""
+
+        t0       = self.stats.clock()
+        waited   = 0                        # ns of the wait_times
+        commands = []
+        rlist    = []                       # no of bytes for each transaction
+        for addr, data, rbytes, wait_time in transactions:
+            commands.append(self.__writeCommand(addr, data))
+            if wait_time > 0:
+                self.ELVwriteBatch(b" ".join(commands), name=name, info=info, doPrint=doPrint)
+                tw = self.stats.clock()
+                time.sleep(wait_time/1000)
+                waited += self.stats.clock() - tw
+                commands = []
+            if rbytes > 0: commands.append(self.__readCommand(addr, rbytes))
+            rlist.append(rbytes)
+        self.ELVwriteBatch(b" ".join(commands), name=name, info=info, doPrint=doPrint)
+        t2       = self.stats.clock()
+
+        lines    = []
+        if sum(rlist) > 0:
+            lines = self.ELVreadBatch([r for r in rlist if r > 0], name=name, doPrint=doPrint)
+            if doPrint and self.trace.echo: print(end=end)
+        lines    = iter(lines)
+        answers  = [next(lines) if rbytes > 0 else None for rbytes in rlist]
+        failed   = [i for i, (rbytes, answ) in enumerate(zip(rlist, answers)) if rbytes > 0 and answ is None]
+        self.stats.record(self.name, name, info, t0, t2 - waited, t2, self.stats.clock())
+        for i in failed:                    # repeated one by one, by the retry policy of askDongle
+            addr, data, rbytes, wait_time = transactions[i]
+            answers[i] = self.askDongle(addr, data, rbytes, wait_time=wait_time, name=name, info=info, doPrint=doPrint, end=end)
+
+        return answers
+
+
+    def scanBus(self, first=0x03, last=0x77, doPrint=True):
+        """ Reads 1 byte from every address, in command strings of scanChunk
+        reads; an address which does not ACK gives an error msg line """
+
+        addrs = []
+        for start in range(first, last + 1, self.scanChunk):
+            chunk = range(start, min(start + self.scanChunk, last + 1))
+            self.ELVwriteBatch(b" ".join(self.__readCommand(addr, 1) for addr in chunk), name=self.short, info="scan bus", doPrint=False)
+            lines = self.ELVreadBatch([1] * len(chunk), doPrint=False)
+            addrs += [addr for addr, line in zip(chunk, lines) if line is not None]
+        if doPrint: self.showBusMap(addrs, first, last)
+
+        return addrs
+
+
+    def ELVwriteBatch(self, command, name="", info="", doPrint=True):
+        """write a concatenated command string via the ELV USB-I2C"""
+
+        if len(command) == 0: return
+        wrt     = self.ser.write(command)  # wrt = no of bytes written
+        self.trace.record(self.name, TRACE_NOADDR, "TB", command)
+        if doPrint and self.trace.echo: print(self.pTemplate.format(name, "TB", util.strtime()[11:], len(command), wrt, info, command))
+
+
     def ELVwriteData (self, addr, data, name="", info ="", doPrint=True):
         """write commands for the sensors via the ELV USB-I2C"""
 
-        wA      = "{:02X}".format((addr << 1) + 0)
-        wdata   = ""
-        for a in data: wdata += " {:02X}".format(a) # puts a space at the beginning
-
-        command = bytes('S {}{} P'.format(wA, wdata), 'ASCII').upper()
+        command = self.__writeCommand(addr, data)
         wrt     = self.ser.write(command)  # wrt = no of bytes written
-        if doPrint: print(self.pTemplate.format(name, "TX", util.strtime()[11:], len(command), wrt, info, command))
+        self.trace.record(self.name, addr, "TX", command)
+        if doPrint and self.trace.echo: print(self.pTemplate.format(name, "TX", util.strtime()[11:], len(command), wrt, info, command))
 
 
     def ELVinitializeRead(self, addr, rbytes, name="", info="", doPrint=True):
         """initialize reading from the sensor via the ELV USB-I2C"""
 
-        rA      = "{:02X}".format((addr << 1) + 1)  # read address
-        rb      = "{:02X}".format(rbytes)           # no of bytes
-        command = bytes('S {} {} P'.format(rA, rb), 'ASCII').upper()
+        command = self.__readCommand(addr, rbytes)
         wrt     = self.ser.write(command)  # wrt = no of bytes written
-        if doPrint: print(self.pTemplate.format("", "iR", util.strtime()[11:], len(command), wrt, info, command))
+        self.trace.record(self.name, addr, "iR", command)
+        if doPrint and self.trace.echo: print(self.pTemplate.format("", "iR", util.strtime()[11:], len(command), wrt, info, command))
 
 
-    def ELVreadData (self, length=1, name="", info="", doPrint=True):
+    def ELVreadData (self, length=1, addr=TRACE_NOADDR, name="", info="", doPrint=True):
         """ read data from the ELV USB-I2C """
 
-        rec = self.ser.read(length * 3 + 2) # 3 chars per byte('FF ') + CR, LF
+        rec = self.ELVreadLine()        # 3 chars per byte('FF ') + CR, LF
         cnt = self.ser.in_waiting
         if cnt > 0:
             util.bell()
             print("Bytes waiting:", cnt)
-            while True:                # read single byte until nothing is returned
-                x = self.ser.read(1)
-                if len(x) == 0: break
-                rec += x
+            rec += self.ELVdrain()
 
         rec = rec.rstrip(b"\r\n")       # remove carridge return, linefeed, keep last space
 
-        if doPrint: print( self.pTemplate.format("", "RX", util.strtime()[11:], length, len(rec), info, rec), end="")
+        status = TRACE_NACK if ELVisError(rec) else TRACE_TIMEOUT if len(rec) < 3 * length - 1 else TRACE_OK
+        self.trace.record(self.name, addr, "RX", rec, status=status)
+        if doPrint and self.trace.echo: print( self.pTemplate.format("", "RX", util.strtime()[11:], length, len(rec), info, rec), end="")
 
-        if not rec.strip().startswith(b"Solve ") or \
-           not rec.strip().startswith(b"Err: "):        # conversion unless an error msg from dongle
-            rlist = self.__getListfromRec(rec)
-            return rlist
-        else:
-            return rec
+        if ELVisError(rec): return rec  # an error msg from dongle
+
+        return ELVdecodeHex(rec)
+
+
+    def ELVreadLine(self):
+        """ read one reply line from the ELV USB-I2C; returns as soon as the
+        terminator has been received, and only waits for the timeout if the
+        line is incomplete """
+
+        return self.ser.read_until(self.terminator)
+
+
+    def ELVdrain(self):
+        """ read all bytes waiting in the input buffer, in bulk """
+
+        rec = b""
+        while True:
+            cnt = self.ser.in_waiting
+            if cnt == 0: break
+            rec += self.ser.read(cnt)
+
+        return rec
+
+
+    def ELVreadBatch(self, rlist, name="", info="", doPrint=True):
+        """ read the answers of several reading transactions, one line each,
+        from the ELV USB-I2C; rlist is the no of bytes of each answer
+        returns one answer per entry of rlist, None for an error msg or a
+        missing or incomplete line; these count as failures of name, if given"""
+
+        rec = b""
+        for r in rlist: rec += self.ELVreadLine()
+        cnt = self.ser.in_waiting
+        if cnt > 0:
+            util.bell()
+            print("Bytes waiting:", cnt)
+            rec += self.ELVdrain()
+
+        if doPrint and self.trace.echo: print( self.pTemplate.format("", "RB", util.strtime()[11:], sum(rlist), len(rec), info, rec), end="")
+
+        lines  = []
+        status = TRACE_OK
+        recs   = rec.split(b"\r\n")[:rec.count(b"\r\n")]     # complete lines only
+        for rbytes, line in itertools.zip_longest(rlist, recs[:len(rlist)]):
+            if line is None:            reason = "no data"                  # no line at all
+            elif ELVisError(line):      reason = "NoACK"                    # an error msg from dongle
+            else:
+                line   = ELVdecodeHex(line)
+                reason = None if len(line) == rbytes else "no data"
+            if reason is not None:
+                line   = None
+                status = TRACE_NACK if reason == "NoACK" or status == TRACE_NACK else TRACE_TIMEOUT
+                if name: self.stats.failure(self.name, name, reason)
+            lines.append(line)
+        self.trace.record(self.name, TRACE_NOADDR, "RB", rec, status=status)
+
+        return lines
 
 
     def close(self):
         """ Close the serial port """
 
+        self.stopWorker()
         self.ser.close()
         print("ELV is closed")
 
 
-    def __getListfromRec(self, rec):
-        """ convert ASCII string from terminal to list of integer """
-        # rec    : b'BE 6E 9A 69 32 00 ...'
-        # returns: [190, 110, 154, 105, 50, 0, ...]
+    def __writeCommand(self, addr, data):
+        """ ASCII command to write data to the sensor at addr """
+        # addr: 0x77, data: [0xF4, 0xD6]
+        # returns: b'S EE F4 D6 P'
+
+        return b'S ' + ELVencodeHex([(addr << 1) + 0] + list(data)) + b' P'
+
+
+    def __readCommand(self, addr, rbytes):
+        """ ASCII command to read rbytes from the sensor at addr """
+        # addr: 0x77, rbytes: 8
+        # returns: b'S EF 08 P'
+
+        return b'S ' + ELVencodeHex([(addr << 1) + 1, rbytes]) + b' P'
 
+
+def ELVbenchmark(count=10000, sizes=(24, 64)):
+    """ microbenchmark of the hex codec: encoding of a write command and
+    decoding of a reply line of each size, compared to the former per byte
+    formatting and parsing """
+
+    def legacy(data, rec):
+        wdata = ""
+        for a in data: wdata += " {:02X}".format(a)
+        command = bytes('S {}{} P'.format("EE", wdata), 'ASCII').upper()
         rlist = []
-        if len(rec) >= 3:
-            for i in range(0, len(rec), 3):
-                rlist.append(int(rec[i:i+3], 16))
-        else: # empty record
-            pass
+        for i in range(0, len(rec), 3): rlist.append(int(rec[i:i+3], 16))
+
+    def current(data, rec):
+        command = b'S ' + ELVencodeHex([0xEE] + data) + b' P'
+        rlist   = ELVdecodeHex(rec)
+
+    for size in sizes:
+        data = list(range(size))
+        rec  = ELVencodeHex(data) + b" "            # a reply line as after rstrip
+        print("\n---- ELVbenchmark: {} commands and replies of {} bytes".format(count, size))
+        for name, func in (("former", legacy), ("current", current)):
+            start = time.perf_counter()
+            for i in range(count): func(data, rec)
+            dt = time.perf_counter() - start
+            util.fncprint("{:8s}: {:8.2f} µs per encode+decode".format(name, dt / count * 1e6))
+
 
-        return rlist
+if __name__ == "__main__":
+    ELVbenchmark()
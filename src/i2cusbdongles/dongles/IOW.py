@@ -6,98 +6,117 @@ Code for the 'IO-Warrior Dongles' (IOW24 and IOW28)
 from Code Mercenaries ( https://www.codemercs.com).
 """
 
-import time, sys, copy
+import time, sys
 import ctypes, ctypes.util
+import collections
 
-from i2cusbdongles import glob
 from i2cusbdongles import util
 from i2cusbdongles.dongles.Dongle import Dongle
+from i2cusbdongles.dongles.Trace import TRACE_NOADDR, TRACE_OK, TRACE_NACK, TRACE_TIMEOUT
+
+
+# iowkit definitions and declarations -----------------------------------------
+# using CodeMerc doc: IO-Warrior Dynamic Library V1.5 for Windows, 22. Jul 2016
+#
+
+def IOWdeclare(iowkit):
+    """set argtypes and restype of the iowkit library functions"""
+
+    # IOWKIT_HANDLE IOWKIT_API IowKitOpenDevice(void);
+    iowkit.IowKitOpenDevice.argtypes        = None
+    iowkit.IowKitOpenDevice.restype         = ctypes.c_voidp
+
+    # void IOWKIT_API IowKitCloseDevice(IOWKIT_HANDLE devHandle); # devhandle ignored
+    # void IOWKIT_API IowKitCloseDevice(void);    # allowed also; compare with open
+    iowkit.IowKitCloseDevice.argtypes       = None
+    iowkit.IowKitCloseDevice.restype        = None
+
+    # IOWKIT_HANDLE IOWKIT_API IowKitGetDeviceHandle(ULONG numDevice);
+    iowkit.IowKitGetDeviceHandle.argtypes   = [ctypes.c_ulong]  # numDev = 1 ... 16
+    iowkit.IowKitGetDeviceHandle.restype    = ctypes.c_voidp
+
+    # ULONG IOWKIT_API IowKitGetNumDevs(void);
+    iowkit.IowKitGetNumDevs.argtypes        = None
+    iowkit.IowKitGetNumDevs.restype         = ctypes.c_ulong    # Py default
+
+    # PCHAR IOWKIT_API IowKitVersion(void);
+    # res like: IO-Warrior Kit V1.5
+    iowkit.IowKitVersion.argtypes           = None
+    iowkit.IowKitVersion.restype            = ctypes.c_char_p
+
+    # ULONG IOWKIT_API IowKitProductId(IOWKIT_HANDLE iowHandle);
+    # res like: 0x1501
+    iowkit.IowKitGetProductId.argtypes      = [ctypes.c_voidp]
+    iowkit.IowKitGetProductId.restype       = ctypes.c_ulong    # Py default
+
+    # ULONG IOWKIT_API IowKitGetRevision(IOWKIT_HANDLE iowHandle);
+    # res like: 0x1030
+    iowkit.IowKitGetRevision.argtypes       = [ctypes.c_voidp]
+    iowkit.IowKitGetRevision.restype        = ctypes.c_ulong    # Py default
+
+    # BOOL IOWKIT_API IowKitSetTimeout(IOWKIT_HANDLE devHandle, ULONG timeout);
+    iowkit.IowKitSetTimeout.argtypes        = [ctypes.c_voidp, ctypes.c_ulong]
+    iowkit.IowKitSetTimeout.restype         = ctypes.c_bool
+
+    # BOOL IOWKIT_API IowKitSetWriteTimeout(IOWKIT_HANDLE devHandle, ULONG timeout);
+    iowkit.IowKitSetWriteTimeout.argtypes   = [ctypes.c_voidp, ctypes.c_ulong]
+    iowkit.IowKitSetWriteTimeout.restype    = ctypes.c_bool
+
+    # ULONG IOWKIT_API IowKitWrite(IOWKIT_HANDLE devHandle, ULONG self.numPipe, PCHAR buffer, ULONG length);
+    iowkit.IowKitWrite.argtypes             = [ctypes.c_voidp, ctypes.c_ulong, ctypes.c_voidp, ctypes.c_ulong]
+    iowkit.IowKitWrite.restype              = ctypes.c_ulong    # Py default
+
+    # ULONG IOWKIT_API IowKitRead(IOWKIT_HANDLE devHandle, ULONG self.numPipe, PCHAR buffer, ULONG length);
+    iowkit.IowKitRead.argtypes              = [ctypes.c_voidp, ctypes.c_ulong, ctypes.c_voidp, ctypes.c_ulong]
+    iowkit.IowKitRead.restype               = ctypes.c_ulong    # Py default
+
+    # ULONG IOWKIT_API IowKitReadNonBlocking(IOWKIT_HANDLE devHandle, ULONG numPipe, PCHAR buffer, ULONG length);
+    # returns 0 at once if no report is waiting; missing in old library versions
+    if hasattr(iowkit, "IowKitReadNonBlocking"):
+        iowkit.IowKitReadNonBlocking.argtypes   = [ctypes.c_voidp, ctypes.c_ulong, ctypes.c_voidp, ctypes.c_ulong]
+        iowkit.IowKitReadNonBlocking.restype    = ctypes.c_ulong
+
+    # BOOL IOWKIT_API IowKitCancelIo(IOWKIT_HANDLE devHandle, ULONG numPipe);
+    # cancels a pending read or write on the pipe
+    if hasattr(iowkit, "IowKitCancelIo"):
+        iowkit.IowKitCancelIo.argtypes          = [ctypes.c_voidp, ctypes.c_ulong]
+        iowkit.IowKitCancelIo.restype           = ctypes.c_bool
+
+    # BOOL IOWKIT_API IowKitReadImmediate(IOWKIT_HANDLE devHandle, PDWORD value);
+    # Return current value directly read from the IO-Warrior I/O pins.
+    # not relevant for I2C
+    iowkit.IowKitReadImmediate.argtypes     = [ctypes.c_voidp, ctypes.POINTER(ctypes.c_ulong)]
+    iowkit.IowKitReadImmediate.restype      = ctypes.c_bool
+
+    # BOOL IOWKIT_API IowKitGetSerialNumber(IOWKIT_HANDLE iowHandle, PWCHAR serialNumber);
+    # from iowkit.h:
+    # typedef unsigned short *       PWCHAR;
+    # from library docu:
+    # "The serial number is represented as an Unicode string. The buffer pointed to
+    # by serialNumber must be big enough to hold 9 Unicode characters (18 bytes),
+    # because the string is terminated in the usual C way with a 0 character."
+    #
+    # Originally suggested code fails:
+    # iowkit.IowKitGetSerialNumber.argtypes  = [ctypes.c_voidp, ctypes.c_wchar_p]
+    # It results in Python crashing on conversion of c_wchar_p, probably because
+    # the implicit conversion of Python3 expects 4 bytes per unicode char, while
+    # the iowlibrary uses only 2.
+    # Workaround is a string buffer of length 18 and the conversion is per
+    # buffer.raw.decode("utf-16-le"), see IOWgetSerial
+    iowkit.IowKitGetSerialNumber.argtypes   = [ctypes.c_voidp, ctypes.c_voidp] # ok
+    iowkit.IowKitGetSerialNumber.restype    = ctypes.c_bool
 
 
 iowlib = ctypes.util.find_library("iowkit") # must NOT use prefix, suffix
                                             # finds: 'libiowkit.so.1'
 #print("{:33s}: {}".format("IOW - Found Library", iowlib))
 
-if not iowlib: raise ImportError("iowkit library not found in os path")
-
-iowkit = ctypes.CDLL(iowlib)                # same result when loading:
+iowkit = None                               # without library only a stand-in like
+if iowlib:                                  # SIM.SIMiowkit can be used
+    iowkit = ctypes.CDLL(iowlib)            # same result when loading:
                                             # libiowkit.so, libiowkit.so.1,
                                             # both linked to libiowkit.so.1.0.5
-
-# iowkit definitions and declarations -----------------------------------------
-# using CodeMerc doc: IO-Warrior Dynamic Library V1.5 for Windows, 22. Jul 2016
-#
-# IOWKIT_HANDLE IOWKIT_API IowKitOpenDevice(void);
-iowkit.IowKitOpenDevice.argtypes        = None
-iowkit.IowKitOpenDevice.restype         = ctypes.c_voidp
-
-# void IOWKIT_API IowKitCloseDevice(IOWKIT_HANDLE devHandle); # devhandle ignored
-# void IOWKIT_API IowKitCloseDevice(void);    # allowed also; compare with open
-iowkit.IowKitCloseDevice.argtypes       = None
-iowkit.IowKitCloseDevice.restype        = None
-
-# IOWKIT_HANDLE IOWKIT_API IowKitGetDeviceHandle(ULONG numDevice);
-iowkit.IowKitGetDeviceHandle.argtypes   = [ctypes.c_ulong]  # numDev = 1 ... 16
-iowkit.IowKitGetDeviceHandle.restype    = ctypes.c_voidp
-
-# ULONG IOWKIT_API IowKitGetNumDevs(void);
-iowkit.IowKitGetNumDevs.argtypes        = None
-iowkit.IowKitGetNumDevs.restype         = ctypes.c_ulong    # Py default
-
-# PCHAR IOWKIT_API IowKitVersion(void);
-# res like: IO-Warrior Kit V1.5
-iowkit.IowKitVersion.argtypes           = None
-iowkit.IowKitVersion.restype            = ctypes.c_char_p
-
-# ULONG IOWKIT_API IowKitProductId(IOWKIT_HANDLE iowHandle);
-# res like: 0x1501
-iowkit.IowKitGetProductId.argtypes      = [ctypes.c_voidp]
-iowkit.IowKitGetProductId.restype       = ctypes.c_ulong    # Py default
-
-# ULONG IOWKIT_API IowKitGetRevision(IOWKIT_HANDLE iowHandle);
-# res like: 0x1030
-iowkit.IowKitGetRevision.argtypes       = [ctypes.c_voidp]
-iowkit.IowKitGetRevision.restype        = ctypes.c_ulong    # Py default
-
-# BOOL IOWKIT_API IowKitSetTimeout(IOWKIT_HANDLE devHandle, ULONG timeout);
-iowkit.IowKitSetTimeout.argtypes        = [ctypes.c_voidp, ctypes.c_ulong]
-iowkit.IowKitSetTimeout.restype         = ctypes.c_bool
-
-# BOOL IOWKIT_API IowKitSetWriteTimeout(IOWKIT_HANDLE devHandle, ULONG timeout);
-iowkit.IowKitSetWriteTimeout.argtypes   = [ctypes.c_voidp, ctypes.c_ulong]
-iowkit.IowKitSetWriteTimeout.restype    = ctypes.c_bool
-
-# ULONG IOWKIT_API IowKitWrite(IOWKIT_HANDLE devHandle, ULONG self.numPipe, PCHAR buffer, ULONG length);
-iowkit.IowKitWrite.argtypes             = [ctypes.c_voidp, ctypes.c_ulong, ctypes.c_voidp, ctypes.c_ulong]
-iowkit.IowKitWrite.restype              = ctypes.c_ulong    # Py default
-
-# ULONG IOWKIT_API IowKitRead(IOWKIT_HANDLE devHandle, ULONG self.numPipe, PCHAR buffer, ULONG length);
-iowkit.IowKitRead.argtypes              = [ctypes.c_voidp, ctypes.c_ulong, ctypes.c_voidp, ctypes.c_ulong]
-iowkit.IowKitRead.restype               = ctypes.c_ulong    # Py default
-
-# BOOL IOWKIT_API IowKitReadImmediate(IOWKIT_HANDLE devHandle, PDWORD value);
-# Return current value directly read from the IO-Warrior I/O pins.
-# not relevant for I2C
-iowkit.IowKitReadImmediate.argtypes     = [ctypes.c_voidp, ctypes.POINTER(ctypes.c_ulong)]
-iowkit.IowKitReadImmediate.restype      = ctypes.c_bool
-
-# BOOL IOWKIT_API IowKitGetSerialNumber(IOWKIT_HANDLE iowHandle, PWCHAR serialNumber);
-# from iowkit.h:
-# typedef unsigned short *       PWCHAR;
-# from library docu:
-# "The serial number is represented as an Unicode string. The buffer pointed to
-# by serialNumber must be big enough to hold 9 Unicode characters (18 bytes),
-# because the string is terminated in the usual C way with a 0 character."
-#
-# Originally suggested code fails:
-# iowkit.IowKitGetSerialNumber.argtypes  = [ctypes.c_voidp, ctypes.c_wchar_p]
-# It results in Python crashing on conversion of c_wchar_p, probably because
-# the implicit conversion of Python3 expects 4 bytes per unicode char, while
-# the iowlibrary uses only 2.
-# Workaround is a string buffer of length 18 and the conversion is per
-# buffer.raw.decode("utf-8")
-iowkit.IowKitGetSerialNumber.argtypes   = [ctypes.c_voidp, ctypes.c_voidp] # ok
-iowkit.IowKitGetSerialNumber.restype    = ctypes.c_bool
+    IOWdeclare(iowkit)
 
 # Max number of IOW devices in system = 16
 IOWKIT_MAX_DEVICES                      = ctypes.c_ulong(16)
@@ -126,6 +145,10 @@ IOWKIT_PRODUCT_ID_IOWPV2                = 0x1512
 # IO-Warrior 56
 IOWKIT_PRODUCT_ID_IOW56                 = 0x1503
 IOWKIT_PRODUCT_ID_IOW56_ALPHA           = 0x158B
+# the IO-Warriors with an I2C special mode
+IOWKIT_PRODUCT_IDS_I2C                  = (IOWKIT_PRODUCT_ID_IOW40, IOWKIT_PRODUCT_ID_IOW24,
+                                           IOWKIT_PRODUCT_ID_IOW24_SENSIRION, IOWKIT_PRODUCT_ID_IOW28,
+                                           IOWKIT_PRODUCT_ID_IOW56, IOWKIT_PRODUCT_ID_IOW56_ALPHA)
 
 # IOW Legacy devices open modes
 IOW_OPEN_SIMPLE                         = ctypes.c_ulong(1)
@@ -141,6 +164,62 @@ IOWKIT56_SPECIAL_REPORT                 = ctypes.c_ubyte * 64
 #
 # end iowkit definitions and declarations -------------------------------------
 
+IOWopened = {}                              # {library: handle of 1st device}
+
+def IOWopen(lib):
+    """opens all IO-Warriors; IowKitOpenDevice is called only once per library,
+    because it opens all devices at once
+    returns the handle of the 1st device or None"""
+
+    if IOWopened.get(lib) is None: IOWopened[lib] = lib.IowKitOpenDevice()
+
+    return IOWopened[lib]
+
+
+def IOWgetSerial(lib, handle):
+    """returns the serial number of the device as string"""
+
+    # the library writes 9 Unicode chars of 2 bytes each, incl. the final 0
+    bsno = ctypes.create_string_buffer(18)
+    lib.IowKitGetSerialNumber(handle, ctypes.byref(bsno))
+
+    return bsno.raw.decode("utf-16-le").split("\0")[0]
+
+
+def IOWdevices(lib=None):
+    """returns the list of (numDevice, handle, serial, pid) of all IO-Warriors
+    lib: default is the iowkit library found in the os path"""
+
+    lib = lib if lib is not None else iowkit
+    if lib is None or IOWopen(lib) is None: return []
+
+    devices = []
+    for num in range(1, lib.IowKitGetNumDevs() + 1):
+        handle = lib.IowKitGetDeviceHandle(num)
+        if handle is None: continue
+        devices.append((num, handle, IOWgetSerial(lib, handle), lib.IowKitGetProductId(handle)))
+
+    return devices
+
+
+def IOWopenAll(disable_pullups=False, sensibus=False, lib=None):
+    """returns a list with one IOWdongle per attached IO-Warrior"""
+
+    return [IOWdongle(disable_pullups=disable_pullups, sensibus=sensibus, lib=lib, serial=serial)
+            for num, handle, serial, pid in IOWdevices(lib)]
+
+
+def IOWpollAll(batches, name="no name", info="no info", doPrint=False):
+    """asks several IO-Warriors concurrently, each one by its own worker
+    batches: {IOWdongle: transactions}, see Dongle.askDongleBatch
+    returns {IOWdongle: answers}"""
+
+    futures = {dongle: dongle.askDongleBatchFuture(transactions, name=name, info=info, doPrint=doPrint)
+               for dongle, transactions in batches.items()}
+
+    return {dongle: future.result() for dongle, future in futures.items()}
+
+
 
 class IOWdongle(Dongle):
     """Code for the IO-Warrior Dongles"""
@@ -149,31 +228,71 @@ class IOWdongle(Dongle):
     short        = "dongle"
     readtimeout  = 500          # ms
     writetimeout = 500          # ms  - not implemented on Linux
+    deadline     = None         # ms  - if set: reads poll IowKitReadNonBlocking
+                                #       and give up after deadline ms
+    pollinterval = 0.0002       # sec - sleep between the polls
+    pipelined    = False        # if True: write-only transactions don't wait for their ACKs
+    pipelineDepth = 8           # max of transactions with ACKs pending
+    staleReports  = 3           # max of reports with a wrong report ID skipped by a read
     
     #            IOW name    xX   time   reqB   wrt/rec   info     rec
     pTemplate = "IOW {:7s} {:2s} {:10s} [{:3d}] [{:3d}]  {:15s} == {}"
 
 
-    def __init__(self, disable_pullups=False, sensibus=False):
-        """opening the USB port and checking dongle"""
+    def __init__(self, disable_pullups=False, sensibus=False, lib=None, serial=None, deadline=None, pipelined=False, i2ctimeout=128):
+        """opening the USB port and checking dongle
+        lib: a stand-in for the iowkit library (like SIM.SIMiowkit);
+             default is the iowkit library found in the os path
+        serial: serial number of the IO-Warrior to use; default is the 1st device
+        deadline: ms to wait for a report in non-blocking mode; default is
+             the blocking IowKitRead with readtimeout
+        pipelined: write-only transactions return at once, their ACKs are
+             collected later (see IOWcollectAcks)
+        i2ctimeout: ms to wait for a sensor stretching the clock, 0.5 ... 128;
+             the IOW24 has no selectable bus clock, only this timeout"""
+
+        self.iowkit = lib if lib is not None else iowkit
+        if self.iowkit is None:
+            util.ecprint("iowkit library not found in os path, Exiting")
+            sys.exit()
 
         # Open device and get handle
-        self.iow = iowkit.IowKitOpenDevice()
+        self.iow = IOWopen(self.iowkit)
         if self.iow != None:                      # must check for None, not 0 (zero)
             self.__infoprint__(str("IowKitOpenDevice"), str(self.iow), str("(iowHandle of 1st device)"))
         else:
             util.ecprint("No {} dongle detected, Exiting".format(self.name))
             sys.exit()
 
+        if serial is not None:
+            handles = [d[1] for d in IOWdevices(self.iowkit) if d[2] == serial]
+            if not handles:
+                util.ecprint("No {} dongle with serial number {} detected, Exiting".format(self.name, serial))
+                sys.exit()
+            self.iow = handles[0]
+            self.__infoprint__("IowKitGetDeviceHandle", str(self.iow), "(iowHandle of S/N {})".format(serial))
+        self.serial = IOWgetSerial(self.iowkit, self.iow)
+        self.name   = "{} {}".format(self.name, self.serial)     # each device its own trace and stats
+
+        if deadline is not None:
+            if hasattr(self.iowkit, "IowKitReadNonBlocking"):
+                self.deadline = deadline
+                self.__infoprint__("IowKitReadNonBlocking", "----", deadline, "ms deadline per report")
+            else:
+                util.ecprint("IowKitReadNonBlocking not in iowkit library, using blocking reads")
+        self.worker = None                        # started with the 1st submit, see Dongle
+        self.pipelined   = pipelined
+        self.pendingAcks = collections.deque()    # (addr, data, nreports, name, info) of pipelined writes
+
         # set Read Timeout
-        ito = iowkit.IowKitSetTimeout(self.iow, self.readtimeout)
+        ito = self.iowkit.IowKitSetTimeout(self.iow, self.readtimeout)
         self.__infoprint__("IowKitSetTimeout", ito, self.readtimeout, "ms" )
 
         # set Write Timeout
-        iwto = iowkit.IowKitSetWriteTimeout(self.iow, self.writetimeout)
+        iwto = self.iowkit.IowKitSetWriteTimeout(self.iow, self.writetimeout)
         self.__infoprint__("IowKitSetWriteTimeout", iwto, self.writetimeout, "ms - not implemented on Linux" )
 
-        pid = iowkit.IowKitGetProductId(self.iow)
+        pid = self.iowkit.IowKitGetProductId(self.iow)
         
         if pid == IOWKIT_PRODUCT_ID_IOW28:
             self.numPipe     = IOW_PIPE_I2C_MODE
@@ -188,11 +307,17 @@ class IOWdongle(Dongle):
 
         self.reportSize  = ctypes.sizeof(self.special_report)
         self.emptyReport = self.special_report(*((0x00,)*self.reportSize))
+
+        # reports are preallocated and reused; filled via memoryview
+        self.writeReport = self.special_report()
+        self.readReport  = self.special_report()
+        self.writeView   = memoryview(self.writeReport).cast("B")
+        self.nulldata    = bytes(self.reportSize)
         
         self.__infoprint__("Size of Report:", "----", self.reportSize, "0x{:02X}".format(self.reportSize))
 
         # Set IOWarrior to I2C mode
-        self.IOWsetIOWtoI2Cmode(name=self.short, info = "setI2Cmode", disable_pullups=disable_pullups, sensibus=sensibus)
+        self.IOWsetIOWtoI2Cmode(name=self.short, info = "setI2Cmode", disable_pullups=disable_pullups, sensibus=sensibus, i2ctimeout=i2ctimeout)
 
         util.fncprint("{} dongle initialized{}".format(self.name," with pull-ups disabled" if disable_pullups else ""))
 
@@ -204,49 +329,59 @@ class IOWdongle(Dongle):
 
         print("\n---- IOWshowInfo -------------------------------------------")
 
-        # Get individual handle
-        igdh = iowkit.IowKitGetDeviceHandle(1)  # device #1
-        self.__infoprint__("IowKitGetDeviceHandle(1)", igdh, "(iowHandle of 1st device)")
-
         # Get number of IOWs
-        numdevs = iowkit.IowKitGetNumDevs()
+        numdevs = self.iowkit.IowKitGetNumDevs()
         self.__infoprint__("IowKitGetNumDevs", numdevs)
 
+        # Get individual handles
+        for num, handle, serial, pid in IOWdevices(self.iowkit):
+            self.__infoprint__("IowKitGetDeviceHandle({})".format(num), handle, serial,
+                               "(this device)" if handle == self.iow else "")
+
         # Get Kit Version
-        ikv = iowkit.IowKitVersion()
+        ikv = self.iowkit.IowKitVersion()
         self.__infoprint__("IowKitVersion", "----", "", ikv.decode("UTF-8"))
 
         # Get Revision
-        rev = iowkit.IowKitGetRevision(self.iow)
+        rev = self.iowkit.IowKitGetRevision(self.iow)
         self.__infoprint__("IowKitGetRevision", rev, hex(rev), "Firmware Version")
 
         # Get ProductID and Name
-        pid = iowkit.IowKitGetProductId(self.iow)
+        pid = self.iowkit.IowKitGetProductId(self.iow)
         self.__infoprint__("IowKitGetProductId", pid, hex(pid), self.__getDeviceName__(pid))
 
         # Get Serial number
-        bsno  = ctypes.create_string_buffer(18)
-        isn   = iowkit.IowKitGetSerialNumber(self.iow, ctypes.byref(bsno))
-        self.__infoprint__("IowKitGetSerialNumber", isn, bsno.raw.decode("utf-8"))
+        self.__infoprint__("IowKitGetSerialNumber", "----", IOWgetSerial(self.iowkit, self.iow))
 
 
-    def IOWsetIOWtoI2Cmode(self, name="no name", info="no info", disable_pullups=False, sensibus=False):
-        """sets IOW to I2C mode"""
+    def IOWsetIOWtoI2Cmode(self, name="no name", info="no info", disable_pullups=False, sensibus=False, i2ctimeout=128):
+        """sets IOW to I2C mode; i2ctimeout in ms, see __init__"""
 
         b2 = 0x80*disable_pullups + 0x40*sensibus + 0x00
+        b3 = round(i2ctimeout * 2)          # in units of 500 microsec
+        if not 1 <= b3 <= 256:
+            util.ecprint("IOW I2C timeout of {} ms not possible, valid is 0.5 ... 128 ms, Exiting".format(i2ctimeout))
+            sys.exit()
 
-        report = copy.copy(self.emptyReport)
+        report = self.writeReport
+        self.writeView[:] = self.nulldata
         report[0] = 0x01 # report ID = 1
         report[1] = 0x01 # enable I2C mode
         report[2] = b2   # all flags 0 (Bit 7   - Disable Pull Ups (1 = disable) - IOW24 only (for 3.3V operation)
                          #              Bit 6   - Use Sensibus Protocol (1 = enable)
                          #              Bit 5:0 - unused, write zero
-        report[3] = 0x00 # max timeout of 256x500 microsec (=0.128 sec)
+        report[3] = b3 & 0xFF   # timeout of b3 x 500 microsec; 0 means 256 (=0.128 sec)
 
         wdl = 1
-        ikw = iowkit.IowKitWrite(self.iow, self.numPipe, ctypes.byref(report), self.reportSize)
+        ikw = self.iowkit.IowKitWrite(self.iow, self.numPipe, report, self.reportSize)
+        self.trace.record(self.name, TRACE_NOADDR, "TA", report, length=ikw)
         print(self.pTemplate.format(name, "TX", util.strtime()[11:], wdl, ikw, info, self.__getstrArray__(report)))
 
+        # the IOW does not answer this report; check at least that it was taken
+        if ikw != self.reportSize:
+            util.ecprint("IOW did not accept the I2C mode, Exiting")
+            sys.exit()
+
 
 
     def askDongle(self, addr, data, rbytes, wait_time=0, name="no name", info="no info", doPrint=True, end="\n"):
@@ -255,75 +390,232 @@ class IOWdongle(Dongle):
         """
         # Write & Ack command loop
         # Write to Sensor to set for reading, and read until error-free Acknowledge received,
-        # but give up and break after 3 retries
+        # but give up when the retry policy says so (see Retry.py)
         
         sensirion = (addr == 0) or (name.strip().upper().startswith("SHT7"))
         suspend_stop_flag = True if rbytes > 0 else False #True if rbytes > 0 else False
         #TODO: determine if suspend_stop_flag must be True or False if rbytes > 0              
         
-        if not sensirion:
-
-            loop = 0
-            while True:
-                glob.dongles[self.name].IOWwriteData(addr, data, suspend_stop_flag=suspend_stop_flag, name=name, info=info, doPrint=doPrint)
-                
-                ret, rep = self.IOWreadAck(name="", info="", doPrint=doPrint)
-                if rep[0] == 2:             # is Acknowledge Report (ID=02)
-                    if rep[1] & 0x80:       # error bit is set                        
-                        print("NoACK: error bit is set")
-                        if loop >= 3:
-                            util.fecprint("After {} retries NoACK ignored\n".format(loop))
-                            break
-                        loop += 1
-                    else:
-                        if doPrint: print("ACK")
-                        break
-                else:
-                    util.fecprint("wrong report ID, retrying write")
-                    time.sleep(0.05) #in case acknowledgment takes some time
+        t0 = self.stats.clock()
+        if not sensirion and self.pipelined and rbytes == 0:
+            self.IOWqueueWrite(addr, data, name=name, info=info, doPrint=doPrint)
+
+        elif not sensirion:
+            if self.pendingAcks: self.IOWcollectAcks(doPrint=doPrint)
+            self.IOWwriteAcked(addr, data, suspend_stop_flag=suspend_stop_flag, name=name, info=info, doPrint=doPrint)
+
+        elif self.pendingAcks:
+            self.IOWcollectAcks(doPrint=doPrint)
         
         # Write & Read loop
+        t1 = self.stats.clock()
         sumrep = []
         if rbytes > 0:
             #For 'read' or 'send command and fetch results' sequences,
             #after writing the address and/or data to the sensor and sending the ACK bit,
             #the sensor needs the execution time to respond to the I2C read header with an ACK bit.
             #Hence, it is required to wait the command execution time before issuing the read header.            
-            while True:
-                if wait_time>2: time.sleep(wait_time/1000) # wait
+            if wait_time>2: time.sleep(wait_time/1000) # wait
+            t2 = self.stats.clock()
+            for attempt in self.retries(name):
                 if sensirion:
-                    glob.dongles[self.name].IOWreadCommand(addr, data[0], rbytes, name=name, info=info, doPrint=doPrint)
+                    self.IOWreadCommand(addr, data[0], rbytes, name=name, info=info, doPrint=doPrint)
                 else:
-                    glob.dongles[self.name].IOWinitializeRead(addr, rbytes, name=name, info=info, doPrint=doPrint)
-                bytes_received = 0
-                while rbytes > bytes_received:
-                    ret, rep = self.IOWreadData(rbytes, name="", info="", doPrint=doPrint)
-                    if rep[0] == 3:
-                        if rep[1] & 0x80:       # error bit is set
-                            print("Error Bit set - Repeating Read")
-                        else:
-                            sumrep += rep[2:]
-                            bytes_received += (self.reportSize-2)
-                            if doPrint: print(":{:d} bytes".format(bytes_received))
-                    else:
-                        # sometimes repID==2 is found; loop until correct (helpful?)
-                        util.ecprint("Wrong reportID - Repeating Read")
-                        #time.sleep(0.5)
-                break
-
-            answ    = sumrep[:rbytes]
-            stransw = ""
-            for a in answ: stransw += "{:02X} ".format(a)
-            if doPrint: print(" "*20, "Answer:  ==", stransw, end= end)
+                    self.IOWinitializeRead(addr, rbytes, name=name, info=info, doPrint=doPrint)
+                sumrep = []
+                while rbytes > len(sumrep):
+                    rep = self.IOWreadReport(3, rbytes=rbytes, addr=addr, name=name, doPrint=doPrint)
+                    if rep is None:
+                        util.fecprint("No data report received")
+                        self.stats.failure(self.name, name, "no data")
+                        break
+                    if rep[1] & 0x80:       # error bit is set
+                        print("Error Bit set - Repeating Read")
+                        self.stats.failure(self.name, name, "error bit")
+                        break
+                    sumrep += rep[2:]
+                    if doPrint and self.trace.echo: print(":{:d} bytes".format(len(sumrep)))
+                if rbytes <= len(sumrep): break
+            else:
+                self.stats.failure(self.name, name, "given up")
+
+            answ    = sumrep[:rbytes] if rbytes <= len(sumrep) else None
+            if doPrint and self.trace.echo: print(" "*20, "Answer:  ==", bytes(answ or []).hex(" ").upper(), end= end)
         else:
             if wait_time>2: time.sleep(wait_time/1000) # wait
+            t2 = self.stats.clock()
             answ = None
+        self.stats.record(self.name, name, info, t0, t1, t2, self.stats.clock())
 
         return answ
 
 
+    def askDongleBatch(self, transactions, name="no name", info="no info", doPrint=True, end="\n"):
+        """
+        The reports of all transactions are written back-to-back, only
+        interrupted where a wait_time is needed; the ACK and data reports are
+        collected afterwards, in the same order. A transaction with NoACK or
+        without data is asked again by askDongle
+        """
+
+        t0        = self.stats.clock()
+        waited    = 0                       # ns of the wait_times
+        if self.pendingAcks: self.IOWcollectAcks(doPrint=doPrint)
+
+        sensirion = name.strip().upper().startswith("SHT7")
+        expected  = []                      # (no of ACK reports, rbytes) for each transaction
+        for addr, data, rbytes, wait_time in transactions:
+            nreports = 0
+            if not (sensirion or addr == 0):
+                nreports = self.IOWwriteData(addr, data, suspend_stop_flag=rbytes > 0, name=name, info=info, doPrint=doPrint)
+            if wait_time>2:
+                tw = self.stats.clock()
+                time.sleep(wait_time/1000) # wait
+                waited += self.stats.clock() - tw
+            if rbytes > 0:
+                if sensirion or addr == 0:
+                    self.IOWreadCommand(addr, data[0], rbytes, name=name, info=info, doPrint=doPrint)
+                else:
+                    self.IOWinitializeRead(addr, rbytes, name=name, info=info, doPrint=doPrint)
+            expected.append((nreports, rbytes))
+        t2        = self.stats.clock()
+
+        answers = []
+        failed  = []                        # index of transactions with NoACK or without data
+        for nreports, rbytes in expected:
+            acked = self.IOWreadAcks(nreports, name=name, doPrint=doPrint)
+            if not acked:                               self.stats.failure(self.name, name, "NoACK")
+            elif nreports and doPrint and self.trace.echo: print("ACK")
+
+            answ = None
+            if rbytes > 0:
+                sumrep = []
+                while rbytes > len(sumrep):
+                    rep = self.IOWreadReport(3, rbytes=rbytes, name=name, doPrint=doPrint)
+                    if rep is None:
+                        util.fecprint("No data report received")
+                        self.stats.failure(self.name, name, "no data")
+                        break
+                    if rep[1] & 0x80:       # error bit is set, no more reports of this read
+                        print("Error Bit set")
+                        self.stats.failure(self.name, name, "error bit")
+                        break
+                    sumrep += rep[2:]
+                    if doPrint and self.trace.echo: print(":{:d} bytes".format(len(sumrep)))
+                if acked and rbytes <= len(sumrep):
+                    answ = sumrep[:rbytes]
+            if not acked or (rbytes > 0 and answ is None): failed.append(len(answers))
+            answers.append(answ)
+
+        if doPrint and self.trace.echo: print(end=end)
+        self.stats.record(self.name, name, info, t0, t2 - waited, t2, self.stats.clock())
+        for i in failed:                    # repeated one by one, by the retry policy of askDongle
+            addr, data, rbytes, wait_time = transactions[i]
+            answers[i] = self.askDongle(addr, data, rbytes, wait_time=wait_time, name=name, info=info, doPrint=doPrint, end=end)
+
+        return answers
+
+
+    def scanBus(self, first=0x03, last=0x77, doPrint=True):
+        """ One ID=2 report per address with the address byte only, Start and
+        Stop, written pipelineDepth at a time; the error bit of each ACK
+        report tells a NoACK """
+
+        if self.pendingAcks: self.IOWcollectAcks(doPrint=False)
+
+        addrs = []
+        for start in range(first, last + 1, self.pipelineDepth):
+            chunk = range(start, min(start + self.pipelineDepth, last + 1))
+            for addr in chunk: self.IOWwriteReport([addr << 1], start=True, stop=True)
+            for addr in chunk:
+                rep = self.IOWreadReport(2, doPrint=False)
+                if rep is not None and not rep[1] & 0x80: addrs.append(addr)
+        if doPrint: self.showBusMap(addrs, first, last)
+
+        return addrs
+
+
+    def IOWwriteAcked(self, addr, data, suspend_stop_flag=False, name="no name", info="no info", doPrint=True):
+        """ Writes to the sensor and reads the ACK reports; the write is
+        repeated on NoACK, but given up when the retry policy says so
+        returns True if acknowledged """
+
+        attempts = 0
+        for attempt in self.retries(name):
+            attempts += 1
+            nreports = self.IOWwriteData(addr, data, suspend_stop_flag=suspend_stop_flag, name=name, info=info, doPrint=doPrint)
+            if self.IOWreadAcks(nreports, name=name, doPrint=doPrint):
+                if doPrint and self.trace.echo: print("ACK")
+                return True
+            self.stats.failure(self.name, name, "NoACK")
+
+        util.fecprint("After {} attempts NoACK ignored\n".format(attempts))
+        self.stats.failure(self.name, name, "given up")
+
+        return False
+
+
+    def IOWreadAcks(self, nreports, name="", doPrint=True):
+        """ Reads the ACK reports of one write, one per written report
+        returns False if a report is missing or has the error bit set """
+
+        acked = True
+        for i in range(nreports):
+            rep = self.IOWreadReport(2, rbytes=2, name=name, doPrint=doPrint)
+            if   rep is None:     print("NoACK: no report received");   acked = False
+            elif rep[1] & 0x80:   print("NoACK: error bit is set");     acked = False
+
+        return acked
+
+
+    def IOWqueueWrite(self, addr, data, name="no name", info="no info", doPrint=True):
+        """ Writes to the sensor without waiting for the ACK reports; they are
+        read by IOWcollectAcks, at the latest when pipelineDepth writes are pending """
+
+        nreports = self.IOWwriteData(addr, data, name=name, info=info, doPrint=doPrint)
+        self.pendingAcks.append((addr, list(data), nreports, name, info))
+        if len(self.pendingAcks) >= self.pipelineDepth: self.IOWcollectAcks(doPrint=doPrint)
+
+
+    def IOWcollectAcks(self, doPrint=True):
+        """ Reads the ACK reports of all pipelined writes in the order of writing;
+        the writes with NoACK are repeated afterwards (see IOWwriteAcked)
+        returns the list of (addr, data) which were finally not acknowledged """
+
+        nacked = []
+        while self.pendingAcks:
+            addr, data, nreports, name, info = self.pendingAcks.popleft()
+            if not self.IOWreadAcks(nreports, name=name, doPrint=doPrint):
+                nacked.append((addr, data, name, info))
+        if doPrint and self.trace.echo: print("ACK pipeline: {} NoACK".format(len(nacked)))
+
+        failed = []
+        for addr, data, name, info in nacked:
+            util.ecprint("NoACK for {} {} - repeating write".format(name, info))
+            if not self.IOWwriteAcked(addr, data, name=name, info=info, doPrint=doPrint):
+                failed.append((addr, data))
+
+        return failed
+
+
+    def IOWreadReport(self, repID, rbytes=2, addr=TRACE_NOADDR, name="", info="", doPrint=True):
+        """ Read reports until one with report ID repID is found, skipping at
+        most staleReports others; no retry policy here, the transaction which
+        reads the report repeats as a whole (see IOWwriteAcked, askDongle)
+        returns None when the read timed out or no such report came """
+
+        for skipped in range(self.staleReports + 1):
+            ikr, rep = self.IOWreadData(rbytes, addr=addr, name=name, info=info, doPrint=doPrint)
+            if ikr == 0:        return None
+            if rep[0] == repID: return rep
+            util.ecprint("Wrong reportID - Repeating Read")
+            self.stats.failure(self.name, name, "report ID")
+
+        return None
+
+
     def IOWwriteData(self, addrSensor, wdata, suspend_stop_flag=False, name= "no name", info = "no info", doPrint = True):
-        """ Writing to the sensor """
+        """ Writing to the sensor; returns the no of reports written """
 
         #In 7-bit addressing procedure, the slave I2C address is transferred in the 1st byte after the Start condition.
         #The first seven bits of the byte comprise the slave address.
@@ -337,35 +629,46 @@ class IOWdongle(Dongle):
             data = wdata
             if addr8: data = [addr8] + data
             ikw, report = self.IOWwriteReport(data, start=True, stop=stop_flag)
-            if doPrint: print(self.pTemplate.format(name, "TX", util.strtime()[11:], wdlen + 1, ikw, info, self.__getstrArray__(report)))
+            self.trace.record(self.name, addrSensor, "TX", report, length=ikw)
+            if doPrint and self.trace.echo: print(self.pTemplate.format(name, "TX", util.strtime()[11:], wdlen + 1, ikw, info, self.__getstrArray__(report)))
+            nreports = 1
 
         else:   # more data than fit into one report
             #print("IOWwriteData: wdata:", wdata)
 
             # first batch of data; with Generate Start, no Generate Stop
             pointer = (self.reportSize-3)
+            nreports = 1
             data = wdata[:pointer]
             if addr8: data = [addr8] + data
             ikw, report = self.IOWwriteReport(data, start=True, stop=False)
-            if doPrint: print(self.pTemplate.format(name, "TX", util.strtime()[11:], wdlen + 1, ikw, info, self.__getstrArray__(report)))
+            self.trace.record(self.name, addrSensor, "TX", report, length=ikw)
+            if doPrint and self.trace.echo: print(self.pTemplate.format(name, "TX", util.strtime()[11:], wdlen + 1, ikw, info, self.__getstrArray__(report)))
 
             # next batches without Start, without Stop; leave enough for one last report with Stop=True
             while pointer + (self.reportSize-2) < wdlen:
                 data = wdata[pointer:pointer+(self.reportSize-2)]
                 #print("pointer, data:", pointer, data)
                 ikw, report = self.IOWwriteReport(data, start=False, stop=False)
-                if doPrint: print(self.pTemplate.format(name, "TX", util.strtime()[11:], wdlen + 1, ikw, info, self.__getstrArray__(report)))
+                self.trace.record(self.name, addrSensor, "TX", report, length=ikw)
+                if doPrint and self.trace.echo: print(self.pTemplate.format(name, "TX", util.strtime()[11:], wdlen + 1, ikw, info, self.__getstrArray__(report)))
                 pointer += (self.reportSize-2)
+                nreports += 1
 
             # lastbatch with Stop
             data = wdata[pointer:]
             #print("pointer, last batch:", pointer, data)
             ikw, report = self.IOWwriteReport(data, start=False, stop=stop_flag)
-            if doPrint: print(self.pTemplate.format(name, "TX", util.strtime()[11:], wdlen + 1, ikw, info, self.__getstrArray__(report)))
+            self.trace.record(self.name, addrSensor, "TX", report, length=ikw)
+            if doPrint and self.trace.echo: print(self.pTemplate.format(name, "TX", util.strtime()[11:], wdlen + 1, ikw, info, self.__getstrArray__(report)))
+            nreports += 1
+
+        return nreports
 
 
     def IOWwriteReport(self, wdata, start=True, stop=True):
-        """ Write a single ID=2 report """
+        """ Write a single ID=2 report; wdata is a list, bytes or memoryview.
+        The report is the preallocated self.writeReport, valid until the next write """
 
         #print("IOWwriteReport: wdata:", wdata)
 
@@ -380,11 +683,7 @@ class IOWdongle(Dongle):
         if stop:    flags = flags | 0x40
         #print("start, Stop:", start, stop, hex(flags))
 
-        nulldata = [0x00]*(self.reportSize-2)
-        data     = wdata + nulldata
-        #print("IOWwriteReport: [02, " + hex(flags) + ", " + str(data[0:6]).strip("["))
-
-        report = copy.copy(self.emptyReport)
+        report = self.writeReport
         report[0] = 0x02    # report ID = 2
         report[1] = flags   # flags: e.g. C3:  Start, Stop and 2 bytes data + address as third byte!
                             # flags: e.g. 06:  No Start, No Stop and 6 bytes data, no address
@@ -400,9 +699,11 @@ class IOWdongle(Dongle):
                             # 1 - data count
                             # 0 - data count LSB 
         
-        for i in range(0,self.reportSize-2): report[i+2] = data[i]
-        
-        ikw = iowkit.IowKitWrite(self.iow, self.numPipe, ctypes.byref(report), self.reportSize)
+        wv = self.writeView
+        wv[2:2 + lenwdata] = wdata if isinstance(wdata, (bytes, bytearray, memoryview)) else bytes(wdata)
+        wv[2 + lenwdata:]  = self.nulldata[2 + lenwdata:]
+
+        ikw = self.iowkit.IowKitWrite(self.iow, self.numPipe, report, self.reportSize)
 
         return ikw, report
 
@@ -412,16 +713,39 @@ class IOWdongle(Dongle):
         return self.IOWreadData(rbytes=2, name=name, info=info, doPrint=doPrint)
     
 
-    def IOWreadData(self, rbytes, name="", info="", doPrint=True):
-        """ Read max of (self.reportSize-2) bytes from sensor """
+    def IOWreadData(self, rbytes, addr=TRACE_NOADDR, name="", info="", doPrint=True):
+        """ Read max of (self.reportSize-2) bytes from sensor.
+        The report is the preallocated self.readReport, valid until the next read """
 
-        report = copy.copy(self.emptyReport)
-        ikr = iowkit.IowKitRead(self.iow, self.numPipe, ctypes.byref(report), self.reportSize)
-        if doPrint: print(self.pTemplate.format(name, "RX", util.strtime()[11:], rbytes, ikr, info, self.__getstrArray__(report)), end="")
+        report = self.readReport
+        if self.deadline is None:
+            ikr = self.iowkit.IowKitRead(self.iow, self.numPipe, report, self.reportSize)
+        else:
+            ikr = self.IOWreadNonBlocking(report)
+        if ikr == 0: ctypes.memset(report, 0, self.reportSize)  # no stale report after timeout
+        self.trace.record(self.name, addr, "RX", report, length=ikr,
+                          status=TRACE_TIMEOUT if ikr == 0 else TRACE_NACK if report[0] in (2, 3) and report[1] & 0x80 else TRACE_OK)
+        if doPrint and self.trace.echo: print(self.pTemplate.format(name, "RX", util.strtime()[11:], rbytes, ikr, info, self.__getstrArray__(report)), end="")
 
         return ikr, report
 
 
+    def IOWreadNonBlocking(self, report):
+        """ Polls for a report until self.deadline (ms) has passed; on timeout
+        the pending I/O is cancelled and 0 is returned """
+
+        end = time.monotonic() + self.deadline / 1000
+        while True:
+            ikr = self.iowkit.IowKitReadNonBlocking(self.iow, self.numPipe, report, self.reportSize)
+            if ikr or time.monotonic() >= end: break
+            time.sleep(self.pollinterval)
+
+        if ikr == 0 and hasattr(self.iowkit, "IowKitCancelIo"):
+            self.iowkit.IowKitCancelIo(self.iow, self.numPipe)
+
+        return ikr
+
+
     def IOWinitializeRead(self, addrSensor, count, name="no name", info="no info", doPrint=True):
         """ Setup Sensor with 7bit address addrSensor for Read of count bytes"""
         
@@ -440,18 +764,22 @@ class IOWdongle(Dongle):
         #The 8th bit is the read/write flag, where 0 indicates a write and 1 indicates a read.
         addr8  = ((addrSensor << 1) + 1) if addrSensor else 0x00  # ex. LM75: 7bit:0x49 -> 8bit:0x91
         
-        report = copy.copy(self.emptyReport)
+        report = self.writeReport
+        self.writeView[3:] = self.nulldata[3:]
         report[0] = 0x03  # report ID = 3
         report[1] = count # count: (=number of bytes to be read from the sensor)
         report[2] = addr8|command # sensor read address + command
         
-        ikw = iowkit.IowKitWrite(self.iow, self.numPipe, ctypes.byref(report), self.reportSize)
-        if doPrint: print(self.pTemplate.format("", "cR" if command else "iR", util.strtime()[11:], count, ikw, info, self.__getstrArray__(report)))
+        ikw = self.iowkit.IowKitWrite(self.iow, self.numPipe, report, self.reportSize)
+        self.trace.record(self.name, addrSensor, "cR" if command else "iR", report, length=ikw)
+        if doPrint and self.trace.echo: print(self.pTemplate.format("", "cR" if command else "iR", util.strtime()[11:], count, ikw, info, self.__getstrArray__(report)))
 
 
     def close(self):
-        """ a dummy just for symmetry """
-        pass
+        """ stops the worker; the device itself stays open for the other IOWdongles """
+
+        if self.pendingAcks: self.IOWcollectAcks(doPrint=False)
+        self.stopWorker()
         print("IOW is closed")
 
 
@@ -497,3 +825,42 @@ class IOWdongle(Dongle):
         for arg in args: sarg += "{:16s} ".format(str(arg))
         print("{:30s}: {:5s} {:15s}".format(text, str(ret), sarg))
 
+
+def IOWbenchmark(count=10000, pid=IOWKIT_PRODUCT_ID_IOW28):
+    """ microbenchmark of the report path against the simulated iowkit library:
+    one write report and one read report per cycle, compared to the former
+    path, which copied an empty report and filled it from a padded list """
+
+    import copy
+    from i2cusbdongles.dongles import SIM
+
+    lib  = SIM.SIMiowkit(pid=pid)
+    iow  = IOWdongle(lib=lib)
+    data = list(range(iow.reportSize - 2))
+
+    def legacy():
+        nulldata = [0x00]*(iow.reportSize-2)
+        padded   = data + nulldata
+        report   = copy.copy(iow.emptyReport)
+        report[0] = 0x02
+        report[1] = 0xC0 | len(data)
+        for i in range(0,iow.reportSize-2): report[i+2] = padded[i]
+        ikw = lib.IowKitWrite(iow.iow, iow.numPipe, ctypes.byref(report), iow.reportSize)
+        report = copy.copy(iow.emptyReport)
+        ikr = lib.IowKitRead(iow.iow, iow.numPipe, ctypes.byref(report), iow.reportSize)
+
+    def current():
+        iow.IOWwriteReport(data)
+        iow.IOWreadData(2, doPrint=False)
+
+    print("\n---- IOWbenchmark: {} reports of {} bytes".format(count, iow.reportSize))
+    for name, func in (("former", legacy), ("current", current)):
+        start = time.perf_counter()
+        for i in range(count): func()
+        dt = time.perf_counter() - start
+        util.fncprint("{:8s}: {:8.2f} µs per write+read".format(name, dt / count * 1e6))
+
+
+if __name__ == "__main__":
+    IOWbenchmark()
+
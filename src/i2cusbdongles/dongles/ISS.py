@@ -10,6 +10,60 @@ import sys, serial, time
 #from I2Cpytools import glob
 from i2cusbdongles import util
 from i2cusbdongles.dongles.Dongle import Dongle
+from i2cusbdongles.dongles.Trace import TRACE_NOADDR, TRACE_OK, TRACE_NACK, TRACE_TIMEOUT
+
+
+# USB-ISS commands ------------------------------------------------------------
+# using Devantech doc: USB-ISS Multifunction USB Communications Module, Technical Documentation
+#
+I2C_SGL         = 0x53      # read/write single byte for non-registered devices
+I2C_AD0         = 0x54      # read/write multiple bytes for devices without register address
+I2C_AD1         = 0x55      # read/write multiple bytes for devices with 1 byte register address
+I2C_AD2         = 0x56      # read/write multiple bytes for devices with 2 byte register address
+I2C_DIRECT      = 0x57      # custom I2C sequence, built from the sub-commands below
+I2C_TEST        = 0x58      # check for the existence of an I2C device
+ISS_CMD         = 0x5A      # USB-ISS admin commands
+ISS_MODULE_ID   = 0x07      # 1st byte of the answer to ISS_CMD 0x01 (version)
+
+# I2C_DIRECT sub-commands
+I2C_START       = 0x01
+I2C_RESTART     = 0x02
+I2C_STOP        = 0x03
+I2C_NACK        = 0x04      # NACK after the next read
+I2C_READ        = 0x20      # + (n-1): read n bytes, n = 1 ... 16
+I2C_WRITE       = 0x30      # + (n-1): write the n following bytes, n = 1 ... 16
+
+ISS_MAXDATA     = 60        # max of data bytes per frame
+
+# ISS_MODE operating modes for I2C: {(hardware I2C, bus clock in Hz): mode}
+ISS_I2C_MODES   = {
+                    (False,   20000): 0x20,     # I2C_S_20KHZ
+                    (False,   50000): 0x30,     # I2C_S_50KHZ
+                    (False,  100000): 0x40,     # I2C_S_100KHZ
+                    (False,  400000): 0x50,     # I2C_S_400KHZ
+                    (True,   100000): 0x60,     # I2C_H_100KHZ
+                    (True,   400000): 0x70,     # I2C_H_400KHZ
+                    (True,  1000000): 0x80,     # I2C_H_1000KHZ
+                  }
+#
+# end USB-ISS commands --------------------------------------------------------
+
+
+def ISSprobe(usbport, timeout=0.2):
+    """ True if a USB-ISS answers at the serial port usbport with its module
+    ID 0x07; the port is closed again, nothing is printed """
+
+    try:
+        with serial.Serial(usbport, ISSdongle.baudrate, timeout=timeout) as ser:
+            ser.reset_input_buffer()            # whatever an earlier probe left
+            ser.write(bytes([ISS_CMD, 0x01]))   # Get ISS Version
+            rec = ser.read(3)
+    except Exception:
+        return False
+
+    return len(rec) == 3 and rec[0] == ISS_MODULE_ID
+
+
 
 class ISSdongle(Dongle):
     """Code for the ISS USB-I2C Dongle"""
@@ -27,8 +81,18 @@ class ISSdongle(Dongle):
     #              ISS name    xX   time   reqB   wrt/rec   info     rec
     pTemplate   = "ISS {:7s} {:2s} {:10s} [{:3d}] [{:3d}]  {:20s} == {}"
 
-    def __init__(self):
-        """opening the serial port and testing for correct dongle"""
+    def __init__(self, busclock=100000, hardware=True, usbport=None):
+        """opening the serial port and testing for correct dongle
+        busclock: I2C bus clock in Hz; 20k, 50k (software I2C only), 100k,
+                  400k, 1M (hardware I2C only), see ISS_I2C_MODES
+        hardware: True for the hardware I2C module, False for software I2C
+        usbport:  serial port of the dongle, default see class (or ISSprobe)"""
+
+        if usbport is not None: self.usbport = usbport
+
+        self.frame  = bytearray(64)     # frames are built here, grows for batches
+        self.acks   = 0                 # no of ACK bytes of writes not yet read
+        self.status = TRACE_OK          # of the last read, see ISSreadData
 
         # open serial port
         try:
@@ -43,30 +107,42 @@ class ISSdongle(Dongle):
         # Test on correct module ID
         self.ISSwriteAdmin(b'\x5A\x01', name=self.short, info="Get ISS Version")
         rec = self.ISSreadAdmin(length=3)
-        if rec[0] == 0x07:
+        if rec[0] == ISS_MODULE_ID:
             util.fncprint("ISS Dongle initialized")
         else:
             util.fecprint("ISS Dongle did not respond - is it connected?")
             sys.exit(1)
 
-        # default is software I2C mode
-        if 10:  # Set I2C Mode for hardware I2C at 100kHz
-            self.ISSwriteAdmin(b'\x5A\x02\x60\x04', name=self.short, info="Set I2C mode")
-            rec = self.ISSreadAdmin(length=2)
-            if rec == b'\xff\x00':
-                util.fncprint("ISS Dongle set to hardware mode, 100kHz")
-            else:
-                util.fecprint("ISS Dongle setting to hardware I2C mode, 100kHz - FAILED")
-                sys.exit(1)
-
-        else: # Set I2C Mode for software I2C at 100kHz (default mode)
-            self.ISSwriteAdmin(b'\x5A\x02\x40\x04', name=self.short, info="Set I2C mode")
-            rec = self.ISSreadAdmin(length=2)
-            if rec == b'\xff\x00':
-                util.fncprint("ISS Dongle set to hardware mode, 100kHz")
-            else:
-                util.fecprint("ISS Dongle setting to hardware I2C mode, 100kHz - FAILED")
-                sys.exit(1)
+        # Set I2C Mode; the dongle default is software I2C at 100kHz
+        self.ISSsetI2Cmode(busclock, hardware)
+
+
+    def ISSsetI2Cmode(self, busclock=100000, hardware=True):
+        """Sets the I2C mode and checks that the dongle accepted it"""
+
+        smode = "{} mode, {:g}kHz".format("hardware" if hardware else "software", busclock / 1000)
+        if (hardware, busclock) not in ISS_I2C_MODES:
+            util.fecprint("ISS Dongle has no I2C {} - valid are: {}".format(smode,
+                          ", ".join("{}:{:g}kHz".format("H" if h else "S", c / 1000) for h, c in ISS_I2C_MODES)))
+            sys.exit(1)
+        mode = ISS_I2C_MODES[(hardware, busclock)]
+
+        # 0x04: the unused I/O pins are inputs
+        self.ISSwriteAdmin(bytes([ISS_CMD, 0x02, mode, 0x04]), name=self.short, info="Set I2C mode")
+        rec = self.ISSreadAdmin(length=2)
+        if rec != b'\xff\x00':
+            util.fecprint("ISS Dongle setting to I2C {} - FAILED".format(smode))
+            sys.exit(1)
+
+        # the operating mode is the 3rd byte of the version
+        self.ISSwriteAdmin(b'\x5A\x01', name=self.short, info="Get ISS Version")
+        rec = self.ISSreadAdmin(length=3)
+        if len(rec) < 3 or rec[2] != mode:
+            util.fecprint("ISS Dongle did not accept I2C {} - FAILED".format(smode))
+            sys.exit(1)
+
+        self.busclock = busclock
+        util.fncprint("ISS Dongle set to I2C {}".format(smode))
 
 
     def ISSshowInfo(self):
@@ -76,110 +152,199 @@ class ISSdongle(Dongle):
 
         # Module ID, Firmware Version, Operating Mode
         self.ISSwriteAdmin(b'\x5A\x01', name=self.short, info="Get ISS Version")
-        rec = self.ISSreadAdmin()
+        rec = self.ISSreadAdmin(length=3)
         util.fncprint("ISS Version: Module ID:       0x{:02X}".format(rec[0] ))
         util.fncprint("ISS Version: Firmware :       0x{:02X}".format(rec[1] ))
         util.fncprint("ISS Version: Operating Mode:  0x{:02X}".format(rec[2] ))
-        util.fncprint("Note: Operating Mode 0x40 is: I2C_S_100kHz (Software Mode)")
-        util.fncprint("Note: Operating Mode 0x60 is: I2C_H_100kHz (Hardware Mode)")
+        for (hardware, busclock), mode in ISS_I2C_MODES.items():
+            util.fncprint("Note: Operating Mode 0x{:02X} is: I2C_{}_{:g}kHz ({} Mode)".format(
+                          mode, "H" if hardware else "S", busclock / 1000, "Hardware" if hardware else "Software"))
 
         # Serial Number
         self.ISSwriteAdmin(b'\x5A\x03', name=self.short, info="Get Serial Number")
-        rec = self.ISSreadAdmin()
+        rec = self.ISSreadAdmin(length=8)
         util.fncprint("Serial Number:", rec.decode("utf-8") )
 
 
     def ISSwriteAdmin(self, command, name= "-", info = "no info"):
         """ write to the USB-ISS - only for its interal admin functions"""
 
+        if self.acks: self.ISSreadData(length=0, doPrint=False)     # ACKs of earlier writes
         wrt     = self.ser.write(command)  # wrt = no of bytes written
+        self.trace.record(self.name, TRACE_NOADDR, "TA", command)
         print( self.pTemplate.format(name, "TA", util.strtime()[11:], len(command), wrt, info, self.__strCommand(command)))
 
 
-    def ISSreadAdmin(self, length = 100, name = "", info = "", doPrint=True):
-        """ read from the USB-ISS"""
+    def ISSreadAdmin(self, length, name = "", info = "", doPrint=True):
+        """ read the length bytes of the answer to an admin command"""
 
-        rec = self.ser.read(length )
-        cnt = self.ser.in_waiting
-        if cnt > 0:
-            print("7Bytes waiting:", cnt)
-            while True:                # read single byte until nothing is returned
-                x = self.ser.read(1)
-                if len(x) == 0: break
-                rec += x
+        rec = self.ser.read(length)
 
-        if doPrint: print( self.pTemplate.format(name, "RA", util.strtime()[11:], length, len(rec), info, self.__strCommand(rec)))
+        self.trace.record(self.name, TRACE_NOADDR, "RA", rec, status=TRACE_TIMEOUT if len(rec) < length else TRACE_OK)
+        if doPrint and self.trace.echo: print( self.pTemplate.format(name, "RA", util.strtime()[11:], length, len(rec), info, self.__strCommand(rec)))
 
         return rec
 
 
     def askDongle(self, addr, data, rbytes, wait_time=0, name= "no name", info = "no info", doPrint= True, end="\n"):
-        """takes care of the communication needs of the dongle"""
+        """takes care of the communication needs of the dongle;
+        without wait_time a read is a single frame: data, repeated start, read
+        returns None when the retry policy gave up, or the write was NACKed"""
+
+        t0 = self.stats.clock()
+        if rbytes > 0 and wait_time == 0:
+            register = data                     # the whole frame is repeated
+            t1 = t2  = t0
+        else:
+            register = []                       # only the read is repeated
+            self.ISSwriteData(addr, data, name=name, info=info, doPrint=doPrint)
+            t1 = self.stats.clock()
+            if wait_time > 0: time.sleep(wait_time/1000)
+            t2 = self.stats.clock()
 
-        self.ISSwriteData(addr, data, name=name, info=info, doPrint=doPrint)
+        answ = None
         if rbytes > 0:
-            if wait_time>2: time.sleep(wait_time/1000) 
-            self.ISSinitializeRead(addr, data, rbytes, name=name, info=info, doPrint=doPrint)
-            answ = self.ISSreadData (length=rbytes, name=name, doPrint=doPrint)
-            if doPrint: print(end=end)
-        else:
-            answ = None
+            for attempt in self.retries(name):
+                header = self.ISSinitializeRead(addr, register, rbytes, name=name, info=info, doPrint=doPrint)
+                answ   = self.ISSreadData(length=rbytes, header=header, addr=addr, name=name, doPrint=doPrint)
+                if doPrint and self.trace.echo: print(end=end)
+                if self.status == TRACE_OK: break
+                self.stats.failure(self.name, name, "NoACK" if self.status == TRACE_NACK else "no data")
+                if self.status == TRACE_NACK and not register:  # the write before was NACKed,
+                    answ = None                                 # reading again makes no sense
+                    break
+            else:
+                self.stats.failure(self.name, name, "given up")
+        self.stats.record(self.name, name, info, t0, t1, t2, self.stats.clock())
 
         return answ
 
 
-    def ISSwriteData (self, addr, data, name= "--", info = "---", doPrint=True):
-        """write commands for the sensors via the ISS USB-I2C"""
+    def askDongleBatch(self, transactions, name="no name", info="no info", doPrint=True, end="\n"):
+        """ The frames of all transactions are packed into one binary stream,
+        which is only split where a wait_time is needed; the answers of all
+        frames are then read in one go. A transaction with a NACKed or not
+        answered frame is asked again by askDongle"""
+
+        t0      = self.stats.clock()
+        waited  = 0                         # ns of the wait_times
+        pos     = 0
+        frames  = []                        # (header, count, index of transaction) for each frame
+        for i, (addr, data, rbytes, wait_time) in enumerate(transactions):
+            if rbytes > 0 and wait_time == 0:
+                pos, header = self.__putRead(pos, addr, data, rbytes)
+                frames.append((header, rbytes, i))
+                continue
+            pos, header = self.__putWrite(pos, addr, data)
+            frames.append((header, 0, i))
+            if wait_time > 0:
+                self.ISSwriteBatch(memoryview(self.frame)[:pos], name=name, info=info, doPrint=doPrint)
+                tw  = self.stats.clock()
+                time.sleep(wait_time/1000)
+                waited += self.stats.clock() - tw
+                pos = 0
+            if rbytes > 0:
+                pos, header = self.__putRead(pos, addr, [], rbytes)
+                frames.append((header, rbytes, i))
+        self.ISSwriteBatch(memoryview(self.frame)[:pos], name=name, info=info, doPrint=doPrint)
+        t2      = self.stats.clock()
+
+        rec     = self.ISSreadData(length=sum(header + count for header, count, i in frames), name=name, doPrint=doPrint)
+        if doPrint and self.trace.echo: print(end=end)
+
+        answers = [None] * len(transactions)
+        failed  = []                        # index of transactions with a frame NACKed or not answered
+        pos     = 0
+        for header, count, i in frames:
+            frame = rec[pos:pos + header + count]
+            pos  += header + count
+            if   len(frame) < header + count:   reason = "no data"
+            elif not all(frame[:header]):       reason = "NoACK"
+            else:
+                if count > 0: answers[i] = frame[header:]
+                continue
+            util.fecprint("ISS: {} in frame of {} {}".format(reason, name, info))
+            self.stats.failure(self.name, name, reason)
+            if i not in failed: failed.append(i)
+        self.stats.record(self.name, name, info, t0, t2 - waited, t2, self.stats.clock())
+        for i in failed:                    # repeated one by one, by the retry policy of askDongle
+            addr, data, rbytes, wait_time = transactions[i]
+            answers[i] = self.askDongle(addr, data, rbytes, wait_time=wait_time, name=name, info=info, doPrint=doPrint, end=end)
+
+        return answers
+
+
+    def scanBus(self, first=0x03, last=0x77, doPrint=True):
+        """ One I2C_TEST frame per address, all written in one go; each
+        answers with a single byte, non-zero if the address ACKed """
 
-        waddr8  = (addr << 1) + 0
-        wdata   = b""
-        for a in data: wdata += bytes([a])
-        command = b'\x55' + bytes([waddr8]) + wdata
+        count   = last - first + 1
+        self.__reserve(2 * count)
+        f       = self.frame
+        f[0:2 * count:2] = bytes([I2C_TEST] * count)
+        f[1:2 * count:2] = bytes(addr << 1 for addr in range(first, last + 1))
+        self.ISSwriteBatch(memoryview(f)[:2 * count], name=self.short, info="scan bus", doPrint=False)
+
+        rec     = self.ISSreadData(length=count, doPrint=False)
+        addrs   = [first + i for i, ack in enumerate(rec) if ack]
+        if doPrint: self.showBusMap(addrs, first, last)
+
+        return addrs
+
+
+    def ISSwriteBatch(self, command, name="", info="", doPrint=True):
+        """write a packed stream of frames via the ISS USB-I2C"""
+
+        if len(command) == 0: return
         wrt     = self.ser.write(command)  # wrt = no of bytes written
+        self.trace.record(self.name, TRACE_NOADDR, "TB", command)
+        if doPrint and self.trace.echo: print(self.pTemplate.format(name, "TB", util.strtime()[11:], len(command), wrt, info, self.__strCommand(command)))
+
+
+    def ISSwriteData (self, addr, data, name= "--", info = "---", doPrint=True):
+        """write commands for the sensors via the ISS USB-I2C; the ACK byte
+        is not waited for, but read together with the next answer"""
+
+        pos, header = self.__putWrite(0, addr, data)
+        command     = memoryview(self.frame)[:pos]
+        wrt         = self.ser.write(command)  # wrt = no of bytes written
+        self.acks  += header
 
-        if doPrint: print(self.pTemplate.format(name, "TX", util.strtime()[11:], len(command), wrt, info, self.__strCommand(command)))
+        self.trace.record(self.name, addr, "TX", command)
+        if doPrint and self.trace.echo: print(self.pTemplate.format(name, "TX", util.strtime()[11:], len(command), wrt, info, self.__strCommand(command)))
 
 
     def ISSinitializeRead(self, addr, register, count, name= "no name", info = "no info", doPrint = True):
-        """ Setup Sensor with address addrSensor for reading count bytes;
-        attempts workaround for ISS problem"""
-
-        raddr8  = (addr << 1) + 1
-
-        # is this a fix for the faulty ISS needs?
-        # different command 0x56 (vs 0x55) for 2 vs 1 byte sequence
-        # What if 3 bytes are needed?
-        if len(register) <= 1 :
-            # 1 byte
-            command = b'\x55' + bytes([raddr8]) + bytes(register) + bytes([count])
-            ii = "i1"
-        else:
-            # 2 bytes (and more -> problem?)
-            command = b'\x56' + bytes([raddr8]) + bytes(register) + bytes([count])
-            ii = "i2"
+        """ Setup Sensor with address addrSensor for reading count bytes,
+        after writing the register bytes (may be empty)
+        returns the no of status bytes preceding the answer"""
 
-        wrt     = self.ser.write(command)  # wrt = no of bytes written
-        if doPrint: print(self.pTemplate.format(name, ii, util.strtime()[11:], count, wrt, info, self.__strCommand(command) ))
+        pos, header = self.__putRead(0, addr, register, count)
+        command     = memoryview(self.frame)[:pos]
+        ii          = "iD" if command[0] == I2C_DIRECT else "i{}".format(command[0] - I2C_AD0)
+        wrt         = self.ser.write(command)  # wrt = no of bytes written
+        self.trace.record(self.name, addr, ii, command)
+        if doPrint and self.trace.echo: print(self.pTemplate.format(name, ii, util.strtime()[11:], count, wrt, info, self.__strCommand(command) ))
 
+        return header
 
-    def ISSreadData (self, length = 100, name = "", info = "", doPrint=True):
-        """ read from the USB-ISS"""
 
-        rec = self.ser.read(length)
-        cnt = self.ser.in_waiting
-        if cnt > 0:
-            print("\7Bytes waiting:", cnt)
-            while True:            # read single byte until nothing is returned
-                x = self.ser.read(1)
-                if len(x) == 0: break
-                rec += x
+    def ISSreadData (self, length, header=0, addr=TRACE_NOADDR, name = "", info = "", doPrint=True):
+        """ read exactly the answer of length bytes from the USB-ISS; the
+        ACK bytes of earlier writes and header status bytes are read before
+        and checked, but not returned; self.status tells NACK or timeout"""
 
-        if doPrint: print(self.pTemplate.format("", "RX", util.strtime()[11:], length, len(rec), info, self.__strCommand(rec)), end="")
+        skip        = self.acks + header
+        rec         = self.ser.read(skip + length)
+        self.acks   = 0
 
-        reclist = []
-        for a in rec: reclist.append(a)
+        nack        = not all(rec[:skip])
+        self.status = TRACE_NACK if nack else TRACE_TIMEOUT if len(rec) < skip + length else TRACE_OK
+        self.trace.record(self.name, addr, "RX", rec, status=self.status)
+        if doPrint and self.trace.echo: print(self.pTemplate.format("", "RX", util.strtime()[11:], skip + length, len(rec), info, self.__strCommand(rec)), end="")
+        if nack: util.fecprint("ISS: NACK from sensor")
 
-        return reclist
+        return list(rec[skip:])
 
 
     def ISSreset(self):
@@ -192,14 +357,76 @@ class ISSdongle(Dongle):
     def close(self):
         """ Close the serial port """
 
+        self.stopWorker()
+        if self.acks: self.ISSreadData(length=0, doPrint=False)
         self.ser.close()
         print("ISS is closed")
 
 
+    def __reserve(self, size):
+        """ grow the frame buffer to size bytes """
+
+        if len(self.frame) < size: self.frame.extend(bytes(size - len(self.frame)))
+
+
+    def __putWrite(self, pos, addr, data):
+        """ Puts the frame to write data to the sensor at addr into self.frame
+        at pos; returns the new pos and the no of status bytes of the answer"""
+
+        count = len(data)
+        if count > ISS_MAXDATA:
+            util.ecprint("ISS: max {} bytes per frame, {} bytes not written".format(ISS_MAXDATA, count))
+            return pos, 0
+
+        end = pos + 3 + count
+        self.__reserve(end)
+        f = self.frame
+        f[pos]          = I2C_AD0
+        f[pos + 1]      = addr << 1
+        f[pos + 2]      = count
+        f[pos + 3:end]  = data
+
+        return end, 1
+
+
+    def __putRead(self, pos, addr, register, count):
+        """ Puts the frame to read count bytes from the sensor at addr, after
+        writing the register bytes, into self.frame at pos;
+        0, 1 and 2 register bytes use I2C_AD0/1/2, more use I2C_DIRECT
+        returns the new pos and the no of status bytes of the answer"""
+
+        nreg = len(register)
+        if nreg <= 2:
+            end = pos + 3 + nreg
+            self.__reserve(end)
+            f = self.frame
+            f[pos]              = I2C_AD0 + nreg
+            f[pos + 1]          = (addr << 1) + 1
+            f[pos + 2:end - 1]  = register
+            f[end - 1]          = count
+
+            return end, 0
+
+        # I2C_DIRECT: start, write address + register, restart, read address,
+        # read count bytes in chunks of max 16 with NACK before the last, stop
+        seq = [I2C_START, I2C_WRITE + nreg, addr << 1] + list(register)
+        seq += [I2C_RESTART, I2C_WRITE, (addr << 1) + 1]
+        for i in range(0, count - 1, 16):
+            seq.append(I2C_READ + min(16, count - 1 - i) - 1)
+        seq += [I2C_NACK, I2C_READ, I2C_STOP]
+
+        end = pos + 1 + len(seq)
+        self.__reserve(end)
+        self.frame[pos]             = I2C_DIRECT
+        self.frame[pos + 1:end]     = seq
+
+        return end, 2
+
+
     def __strCommand(self, command):
         """Convert Bytes sequence to Hex string"""
 
         scmd = ""
         for a in command: scmd += "{:02X} ".format(a)
 
-        return str(command) + " == " + scmd
+        return str(bytes(command)) + " == " + scmd
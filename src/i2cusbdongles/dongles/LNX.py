@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+
+"""
+Code for the native I2C adapters of Linux, via /dev/i2c-N (i2c-dev module)
+
+All transfers are done with the I2C_RDWR ioctl: a write of the register
+and the read of the answer are one combined transfer with a repeated
+start, without any USB hop in between.
+"""
+
+import os, sys, time, errno
+import ctypes
+try:
+    import fcntl
+except ImportError:                                 # not on Windows
+    fcntl = None
+
+from i2cusbdongles import util
+from i2cusbdongles.dongles.Dongle import Dongle
+from i2cusbdongles.dongles.Trace import TRACE_OK, TRACE_NACK
+
+
+# i2c-dev definitions, see linux/i2c-dev.h and linux/i2c.h ---------------------
+
+I2C_RDWR            = 0x0707                        # combined R/W transfer, one Stop
+I2C_M_RD            = 0x0001                        # the message reads
+I2C_RDWR_MAX_MSGS   = 42                            # max messages per I2C_RDWR
+
+
+class i2c_msg(ctypes.Structure):
+    _fields_ = [("addr",  ctypes.c_uint16),
+                ("flags", ctypes.c_uint16),
+                ("len",   ctypes.c_uint16),
+                ("buf",   ctypes.POINTER(ctypes.c_uint8))]
+
+
+class i2c_rdwr_ioctl_data(ctypes.Structure):
+    _fields_ = [("msgs",  ctypes.POINTER(i2c_msg)),
+                ("nmsgs", ctypes.c_uint32)]
+
+#
+# end i2c-dev definitions ------------------------------------------------------
+
+
+class LNXdongle(Dongle):
+    """Code for a native I2C adapter of Linux"""
+
+    name        = "LNXdongle"
+    short       = "dongle"
+
+    #              LNX name    xX   time   reqB   wrt/rec   info     rec
+    pTemplate   = "LNX {:7s} {:2s} {:10s} [{:3d}] [{:3d}]  {:20s} == {}"
+
+    def __init__(self, bus=1, fd=None, ioctl=None):
+        """opens /dev/i2c-<bus>
+        fd:    a file descriptor to use instead of opening /dev/i2c-<bus>
+        ioctl: a stand-in for fcntl.ioctl(fd, request, arg) (like SIM.SIMi2cdev);
+               with both, the dongle runs without an adapter"""
+
+        self.device = "/dev/i2c-{}".format(bus)
+        self.ioctl  = ioctl if ioctl is not None else getattr(fcntl, "ioctl", None)
+        if self.ioctl is None:
+            util.ecprint("No ioctl on this platform, Exiting")
+            sys.exit()
+
+        self.ownfd  = fd is None
+        if fd is None:
+            try:
+                fd = os.open(self.device, os.O_RDWR)
+            except OSError as e:
+                util.ecprint("Is {} available (modprobe i2c-dev, group i2c)? {} - Exiting".format(self.device, e))
+                sys.exit()
+        else:
+            self.device = "file descriptor {}".format(fd)
+        self.fd     = fd
+
+        util.fncprint("LNX Dongle initialized at {}".format(self.device))
+
+
+    def askDongle(self, addr, data, rbytes, wait_time=0, name="no name", info="no info", doPrint=True, end="\n"):
+        """ Without wait_time a read is a single combined transfer: data,
+        repeated start, read; a transfer with NoACK is repeated by the retry
+        policy (see Retry.py)
+        returns None when the policy gave up """
+
+        t0 = self.stats.clock()
+        if rbytes > 0 and wait_time == 0:
+            msgs = ([(addr, data, 0)] if len(data) else []) + [(addr, None, rbytes)]
+            t1 = t2 = t0
+        else:
+            acked = self.LNXtransferRetried([(addr, data, 0)], name=name, info=info, doPrint=doPrint) is not None
+            t1 = self.stats.clock()
+            if acked and wait_time > 0: time.sleep(wait_time/1000)
+            t2 = self.stats.clock()
+            msgs = [(addr, None, rbytes)] if acked else []      # no use to read after a NoACK
+
+        answ = None
+        if rbytes > 0 and msgs:
+            answers = self.LNXtransferRetried(msgs, name=name, info=info, doPrint=doPrint)
+            if answers is not None: answ = answers[-1]
+            if doPrint and self.trace.echo: print(end=end)
+        self.stats.record(self.name, name, info, t0, t1, t2, self.stats.clock())
+
+        return answ
+
+
+    def askDongleBatch(self, transactions, name="no name", info="no info", doPrint=True, end="\n"):
+        """ Consecutive transactions without wait_time are combined into one
+        transfer, of up to I2C_RDWR_MAX_MSGS messages; a transaction with
+        wait_time is asked on its own. On NoACK the transactions of the
+        combined transfer are repeated one by one """
+
+        answers = [None] * len(transactions)
+        group   = []                        # index of transactions to combine
+        nmsgs   = 0                         # no of their messages
+
+        def flush():
+            nonlocal nmsgs
+            msgs = []
+            for i in group:
+                addr, data, rbytes, wait_time = transactions[i]
+                if len(data) or rbytes == 0: msgs.append((addr, data, 0))
+                if rbytes > 0:               msgs.append((addr, None, rbytes))
+            t0   = self.stats.clock()
+            rec  = self.LNXtransfer(msgs, name=name, info=info, doPrint=doPrint) if msgs else []
+            if rec is None:
+                self.stats.failure(self.name, name, "NoACK")
+                for i in group:
+                    addr, data, rbytes, wait_time = transactions[i]
+                    answers[i] = self.askDongle(addr, data, rbytes, wait_time=wait_time, name=name, info=info, doPrint=doPrint, end="")
+            else:
+                self.stats.record(self.name, name, info, t0, t0, t0, self.stats.clock())
+                for i in group:
+                    if transactions[i][2] > 0: answers[i] = rec.pop(0)
+            group.clear()
+            nmsgs = 0
+
+        for i, (addr, data, rbytes, wait_time) in enumerate(transactions):
+            if wait_time > 0:
+                flush()
+                answers[i] = self.askDongle(addr, data, rbytes, wait_time=wait_time, name=name, info=info, doPrint=doPrint, end="")
+                continue
+            n = (1 if len(data) or rbytes == 0 else 0) + (1 if rbytes > 0 else 0)
+            if nmsgs + n > I2C_RDWR_MAX_MSGS: flush()
+            group.append(i)
+            nmsgs += n
+        flush()
+        if doPrint and self.trace.echo: print(end=end)
+
+        return answers
+
+
+    def scanBus(self, first=0x03, last=0x77, doPrint=True):
+        """ Reads 1 byte from every address; the kernel reports the NoACK """
+
+        addrs = [addr for addr in range(first, last + 1) if self.LNXtransfer([(addr, None, 1)], doPrint=False) is not None]
+        if doPrint: self.showBusMap(addrs, first, last)
+
+        return addrs
+
+
+    def LNXtransferRetried(self, msgs, name="", info="", doPrint=True):
+        """ LNXtransfer, repeated on NoACK by the retry policy of name """
+
+        for attempt in self.retries(name):
+            answers = self.LNXtransfer(msgs, name=name, info=info, doPrint=doPrint)
+            if answers is not None: return answers
+            self.stats.failure(self.name, name, "NoACK")
+
+        self.stats.failure(self.name, name, "given up")
+        util.fecprint("LNX: NoACK from {} {}".format(name, info))
+
+        return None
+
+
+    def LNXtransfer(self, msgs, name="", info="", doPrint=True):
+        """ One I2C_RDWR transfer of the messages msgs, list of (addr, data,
+        rbytes): data is written if rbytes is 0, else rbytes are read; a
+        repeated start between the messages, a Stop at the end
+        returns the list of answers of the reading messages, None on NoACK """
+
+        cmsgs = (i2c_msg * len(msgs))()
+        bufs  = []
+        for cmsg, (addr, data, rbytes) in zip(cmsgs, msgs):
+            if rbytes > 0:
+                buf        = (ctypes.c_uint8 * rbytes)()
+                cmsg.flags = I2C_M_RD
+            else:
+                buf        = (ctypes.c_uint8 * len(data)).from_buffer_copy(bytes(data))
+                cmsg.flags = 0
+            cmsg.addr = addr
+            cmsg.len  = len(buf)
+            cmsg.buf  = ctypes.cast(buf, ctypes.POINTER(ctypes.c_uint8))
+            bufs.append(buf)
+
+        status = TRACE_OK
+        try:
+            self.ioctl(self.fd, I2C_RDWR, i2c_rdwr_ioctl_data(cmsgs, len(msgs)))
+        except OSError as e:
+            if e.errno not in (errno.ENXIO, errno.EREMOTEIO, errno.EIO, errno.ETIMEDOUT): raise
+            status = TRACE_NACK
+
+        for i, (buf, (addr, data, rbytes)) in enumerate(zip(bufs, msgs)):
+            xx = "RX" if rbytes > 0 else "TX"
+            self.trace.record(self.name, addr, xx, buf, status=status)
+            if doPrint and self.trace.echo:
+                # like the other dongles, the line of the answer is ended by askDongle
+                print(self.pTemplate.format(name if xx == "TX" else "", xx, util.strtime()[11:], len(buf), len(buf), info,
+                                            bytes(buf).hex(" ").upper() + (" NoACK" if status else "")),
+                      end="" if xx == "RX" and i == len(msgs) - 1 and status == TRACE_OK else "\n")
+
+        if status != TRACE_OK: return None
+
+        return [list(buf) for buf, (addr, data, rbytes) in zip(bufs, msgs) if rbytes > 0]
+
+
+    def close(self):
+        """ Close the adapter """
+
+        self.stopWorker()
+        if self.ownfd: os.close(self.fd)
+        print("LNX is closed")
@@ -0,0 +1,275 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+
+"""
+Record and replay of dongle transactions
+
+RECdongle wraps any dongle and writes each of its transactions (request,
+answer, timing) into a compact binary file; REPdongle reads such a file and
+answers the same requests with the recorded answers, at the original or
+an accelerated speed, without any hardware.
+
+File: the MAGIC line, then records of 2 kinds
+    b"S" + len (uint16) + utf-8 text: a string, numbered in order, for the
+          name and info of the transactions
+    b"T" + REC_HEADER + data + answer: a transaction
+"""
+
+import sys, os, time, struct, threading
+
+from i2cusbdongles import glob
+from i2cusbdongles import util
+from i2cusbdongles.dongles.Dongle import Dongle
+
+MAGIC       = b"I2CREC1\n"
+
+# start (sec since start of recording), duration (sec), wait_time (ms),
+# name, info (no of string), addr, kind, rbytes, len(data), len(answer)
+REC_HEADER  = struct.Struct("<ddfHHBBHHH")
+
+# kind of the answer
+REC_NONE    = 0             # None, from a write only
+REC_LIST    = 1             # list of int
+REC_BYTES   = 2             # bytes (ELV)
+REC_SCAN    = 3             # scanBus: data is first, last; answer the addresses which ACK
+
+
+def RECload(filename):
+    """reads a recording; returns the list of transactions as tuples
+    (start, duration, wait_time, name, info, addr, kind, rbytes, data, answer)"""
+
+    with open(filename, "rb") as f:
+        rec = f.read()
+    if not rec.startswith(MAGIC):
+        util.ecprint("{} is no recording of dongle transactions, Exiting".format(filename))
+        sys.exit()
+
+    strings      = []
+    transactions = []
+    pos          = len(MAGIC)
+    while pos < len(rec):
+        kind = rec[pos:pos + 1]
+        pos += 1
+        if kind == b"S":
+            (length,) = struct.unpack_from("<H", rec, pos)
+            pos      += 2
+            strings.append(rec[pos:pos + length].decode("utf-8"))
+            pos      += length
+        elif kind == b"T":
+            start, duration, wait_time, name, info, addr, kind, rbytes, ldata, lansw = REC_HEADER.unpack_from(rec, pos)
+            pos      += REC_HEADER.size
+            data      = rec[pos:pos + ldata]
+            answ      = rec[pos + ldata:pos + ldata + lansw]
+            pos      += ldata + lansw
+            if   kind == REC_NONE:  answ = None
+            elif kind != REC_BYTES: answ = list(answ)
+            transactions.append((start, duration, wait_time, strings[name], strings[info], addr, kind, rbytes, data, answ))
+        else:
+            util.ecprint("{}: recording broken at byte {}, rest ignored".format(filename, pos - 1))
+            break
+
+    return transactions
+
+
+def RECwrapAll(directory):
+    """replaces all dongles in glob.dongles and in the sensors by RECdongles,
+    each recording to <directory>/<key of the dongle>.rec"""
+
+    for key, dongle in glob.dongles.items():
+        if dongle is None or isinstance(dongle, RECdongle): continue
+        rec = RECdongle(dongle, os.path.join(directory, "{}.rec".format(key)))
+        glob.dongles[key] = rec
+        for sensor in glob.sensors:
+            if sensor["dngl"] is dongle: sensor["dngl"] = rec
+
+
+class RECdongle(Dongle):
+    """Wraps a dongle and records its transactions; everything else is
+    passed on to the dongle"""
+
+    short       = "dongle"
+
+    def __init__(self, dongle, filename):
+        """dongle: the dongle to record, filename: the recording, overwritten"""
+
+        self.dongle  = dongle
+        self.name    = dongle.name
+        self.file    = open(filename, "wb")
+        self.file.write(MAGIC)
+        self.strings = {}
+        self.lock    = threading.Lock()
+        self.start   = time.monotonic()
+
+        util.fncprint("{} transactions are recorded to: {}".format(self.name, filename))
+
+
+    def __getattr__(self, attr):
+        """the attributes of the dongle; its specific functions, like
+        ELVuploadMacro, would pass by the recording and the worker of the
+        RECdongle, so they are not available"""
+
+        value = getattr(self.dongle, attr)
+        if callable(value): raise AttributeError("{} is not recorded, only askDongle, askDongleBatch and scanBus".format(attr))
+
+        return value
+
+
+    def askDongle(self, addr, data, rbytes, wait_time=0, name="no name", info="no info", doPrint=True, end="\n"):
+
+        t0   = time.monotonic()
+        answ = self.dongle.askDongle(addr, data, rbytes, wait_time=wait_time, name=name, info=info, doPrint=doPrint, end=end)
+        self.RECwrite(t0, time.monotonic() - t0, wait_time, name, info, addr, rbytes, data, answ)
+
+        return answ
+
+
+    def askDongleBatch(self, transactions, name="no name", info="no info", doPrint=True, end="\n"):
+        """ the time of the batch is shared by its transactions """
+
+        t0       = time.monotonic()
+        answers  = self.dongle.askDongleBatch(transactions, name=name, info=info, doPrint=doPrint, end=end)
+        duration = (time.monotonic() - t0) / max(1, len(transactions))
+        for i, ((addr, data, rbytes, wait_time), answ) in enumerate(zip(transactions, answers)):
+            self.RECwrite(t0 + i * duration, duration, wait_time, name, info, addr, rbytes, data, answ)
+
+        return answers
+
+
+    def scanBus(self, first=0x03, last=0x77, doPrint=True):
+
+        t0    = time.monotonic()
+        addrs = self.dongle.scanBus(first=first, last=last, doPrint=doPrint)
+        if addrs is not NotImplemented:
+            self.RECwrite(t0, time.monotonic() - t0, 0, "scan", "scan bus", first, len(addrs), [first, last], addrs, kind=REC_SCAN)
+
+        return addrs
+
+
+    def RECwrite(self, t0, duration, wait_time, name, info, addr, rbytes, data, answ, kind=None):
+        """append a transaction to the recording"""
+
+        if kind is None:
+            if   answ is None:                  kind = REC_NONE
+            elif isinstance(answ, bytes):       kind = REC_BYTES
+            else:                               kind = REC_LIST
+        data = bytes(data)
+        answ = bytes(answ or b"")
+
+        with self.lock:
+            rec = b""
+            six = []
+            for s in (str(name), str(info)):
+                if s not in self.strings:
+                    self.strings[s] = len(self.strings)
+                    text = s.encode("utf-8")
+                    rec += b"S" + struct.pack("<H", len(text)) + text
+                six.append(self.strings[s])
+            rec += b"T" + REC_HEADER.pack(t0 - self.start, duration, wait_time, six[0], six[1], addr, kind, rbytes, len(data), len(answ))
+            self.file.write(rec + data + answ)
+            self.file.flush()               # complete up to the last transaction, even after a crash
+
+
+    def close(self):
+        """ closes the recording and the dongle """
+
+        self.stopWorker()
+        self.dongle.close()
+        with self.lock: self.file.close()
+        print("REC is closed")
+
+
+class REPdongle(Dongle):
+    """Replays a recording: each request is answered with the answer of the
+    next recorded transaction with the same address, data and rbytes"""
+
+    name        = "REPdongle"
+    short       = "dongle"
+
+    #              REP name    xX   time   reqB   wrt/rec   info     rec
+    pTemplate   = "REP {:7s} {:2s} {:10s} [{:3d}] [{:3d}]  {:20s} == {}"
+
+    def __init__(self, filename, speed=1.0, loop=True):
+        """filename: the recording of a RECdongle
+        speed:  1 for the original timing, 10 ten times as fast, 0 no waiting at all
+        loop:   start again from the beginning at the end of the recording"""
+
+        self.transactions = RECload(filename)
+        self.speed        = speed
+        self.loop         = loop
+        self.cursor       = 0                   # the next transaction
+        self.misses       = 0                   # requests not found in the recording
+
+        util.fncprint("REP Dongle initialized with {} transactions from: {}".format(len(self.transactions), filename))
+
+
+    def askDongle(self, addr, data, rbytes, wait_time=0, name="no name", info="no info", doPrint=True, end="\n"):
+        """answers from the recording, a request not recorded as if the
+        sensor were missing"""
+
+        t0   = self.stats.clock()
+        data = bytes(data)
+        rec  = self.REPfind(lambda t: t[5] == addr and t[6] != REC_SCAN and t[7] == rbytes and t[8] == data)
+        if rec is None:
+            self.misses += 1
+            util.ecprint("REP: {} {} not in recording, addr 0x{:02X} data {}".format(name, info, addr, data.hex(" ").upper()))
+            answ = [0xFF] * rbytes if rbytes > 0 else None
+        else:
+            self.REPwait(rec[1])
+            answ = rec[9]
+
+        self.trace.record(self.name, addr, "TX", data)
+        if answ is not None: self.trace.record(self.name, addr, "RX", answ)
+        if doPrint and self.trace.echo:
+            print(self.pTemplate.format(name, "TX", util.strtime()[11:], len(data), len(data), info, data.hex(" ").upper()))
+            if answ is not None:
+                print(self.pTemplate.format("", "RX", util.strtime()[11:], rbytes, len(answ), info, bytes(answ).hex(" ").upper()), end=end)
+        # the recording has no phases, all the time is counted for reading
+        self.stats.record(self.name, name, info, t0, t0, t0, self.stats.clock())
+
+        return list(answ) if isinstance(answ, list) else answ
+
+
+    def scanBus(self, first=0x03, last=0x77, doPrint=True):
+
+        rec = self.REPfind(lambda t: t[6] == REC_SCAN and t[8] == bytes([first, last]))
+        if rec is None: return NotImplemented
+
+        self.REPwait(rec[1])
+        if doPrint: self.showBusMap(rec[9], first, last)
+
+        return list(rec[9])
+
+
+    def REPfind(self, match):
+        """the next transaction for which match is True, from the cursor on;
+        with loop also from the beginning; None if there is none"""
+
+        count = len(self.transactions)
+        for i in range(self.cursor, self.cursor + count if self.loop else count):
+            t = self.transactions[i % count]
+            if match(t):
+                self.cursor = (i + 1) % count if self.loop else i + 1
+                return t
+
+        return None
+
+
+    def REPwait(self, duration):
+        """the time the transaction took, divided by speed"""
+
+        if self.speed > 0: time.sleep(duration / self.speed)
+
+
+    def REPshowInfo(self):
+        """Show what the recording contains"""
+
+        print("\n---- Show Info")
+        util.fncprint("REP: {} transactions, {:.3f} sec, speed {}, {} requests not found".format(
+                      len(self.transactions), sum(t[1] for t in self.transactions), self.speed, self.misses))
+
+
+    def close(self):
+        """ nothing to close but the worker """
+
+        self.stopWorker()
+        print("REP is closed")
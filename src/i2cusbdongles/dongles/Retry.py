@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+
+"""
+Retry policy of the dongles: how often and for how long a failed
+transaction (NoACK, error bit, wrong report, no answer) is repeated, and
+how long to wait before each repeat
+
+The default policy of all dongles is Dongle.retryPolicy, a sensor may have
+its own in Dongle.retryPolicies, by the name of the sensor; both are set
+from glob.py by main. The failures are counted in Dongle.stats.
+"""
+
+import time, random
+
+
+class RetryPolicy:
+    """max attempts, deadline, exponential backoff with jitter"""
+
+    def __init__(self, attempts=4, deadline=500, backoff=1, factor=2, maxbackoff=100, jitter=0.5):
+        """attempts:    max no of attempts, including the 1st
+        deadline:   ms after the 1st attempt, after which no further attempt is started; None: no limit
+        backoff:    ms to wait before the 2nd attempt
+        factor:     the backoff is multiplied with factor before each further attempt ...
+        maxbackoff: ... up to maxbackoff ms
+        jitter:     the backoff varies randomly by +/- jitter (0.5 = 50%), so
+                    that the dongles do not repeat in lockstep"""
+
+        self.attempts   = attempts
+        self.deadline   = deadline
+        self.backoff    = backoff
+        self.factor     = factor
+        self.maxbackoff = maxbackoff
+        self.jitter     = jitter
+
+
+    def tries(self):
+        """yields the no of the attempt, 0 for the 1st, waiting the backoff
+        before each repeat; ends when attempts or deadline are reached, so
+        that a for loop over it ends without break if all attempts failed"""
+
+        start   = time.monotonic()
+        backoff = self.backoff
+        for attempt in range(self.attempts):
+            if attempt:
+                delay = min(backoff, self.maxbackoff) / 1000
+                if self.jitter: delay *= 1 + random.uniform(-self.jitter, self.jitter)
+                if self.deadline is not None and time.monotonic() + delay - start > self.deadline / 1000: return
+                time.sleep(delay)
+                backoff *= self.factor
+            yield attempt
+
+
+    def __repr__(self):
+
+        return "RetryPolicy(attempts={}, deadline={}, backoff={}, factor={}, maxbackoff={}, jitter={})".format(
+                self.attempts, self.deadline, self.backoff, self.factor, self.maxbackoff, self.jitter)
@@ -0,0 +1,802 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+
+"""
+Code for a simulated I2C Dongle
+
+The whole I2C bus is emulated in memory: every supported sensor is modelled by
+its register map, and the dongle answers askDongle() exactly like the ELV, IOW
+and ISS dongles do, i.e. it returns a list of integers, or None when no bytes
+are requested. An optional latency per transaction allows to profile the
+acquisition loop in main.py without any USB dongle attached.
+"""
+
+import time, random, collections, errno
+import ctypes
+
+from i2cusbdongles import util
+from i2cusbdongles.dongles.Dongle import Dongle
+from i2cusbdongles.dongles import LNX
+from i2cusbdongles.dongles.Trace import TRACE_OK, TRACE_NACK
+
+
+def SIMcrc8(data, init=0xFF, poly=0x31):
+    """8-Bit checksum as used by the Sensirion I2C sensors (SCD4x)"""
+
+    crc = init
+    for a in data:
+        crc ^= a
+        for i in range(8):
+            crc = ((crc << 1) ^ poly) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+
+    return crc
+
+
+class SIMdevice:
+    """A generic I2C device with 256 registers and an auto-incrementing pointer.
+    The 1st byte of a write sets the register pointer, further bytes are
+    written to the registers; a read continues from the pointer"""
+
+    name        = "device"
+
+    def __init__(self):
+        self.regs    = bytearray(256)
+        self.pointer = 0x00
+
+
+    def write(self, data):
+        """data as received from the dongle, without the address byte"""
+
+        if len(data) == 0: return
+        self.pointer = data[0] & 0xFF
+        for a in data[1:]:
+            self.writeRegister(self.pointer, a & 0xFF)
+            self.pointer = (self.pointer + 1) & 0xFF
+
+
+    def read(self, count):
+        """returns count bytes as list of integer"""
+
+        answ = []
+        for i in range(count):
+            answ.append(self.readRegister(self.pointer))
+            self.pointer = (self.pointer + 1) & 0xFF
+
+        return answ
+
+
+    def writeRegister(self, reg, value):
+        self.regs[reg] = value
+
+
+    def readRegister(self, reg):
+        return self.regs[reg]
+
+
+class SIMsensorBME280(SIMdevice):
+    """BME280 with the calibration of the BlueDot module (see sensors/BME280.py)"""
+
+    name        = "BME280"
+    chipID      = 0x60
+
+    # raw values giving T: 21.49, P: 1002.50, H: 45.00 with the calibration below
+    temp_raw    = 520295
+    press_raw   = 303958
+    hum_raw     = 28446
+
+    def __init__(self, noise=True):
+        SIMdevice.__init__(self)
+        self.noise    = noise
+        self.ready_at = 0
+        self.reset()
+
+
+    def reset(self):
+        """power-on-reset values"""
+
+        self.regs = bytearray(256)
+        self.regs[0x88:0xA0] = bytes.fromhex("BE 6E 9A 69 32 00 77 92 CE D6 D0 0B 00 22 A4 FF F9 FF AC 26 0A D8 BD 10")
+        self.regs[0xA1]      = 0x4B
+        self.regs[0xE1:0xE8] = bytes.fromhex("6B 01 00 13 2D 03 1E")
+        self.regs[0xD0]      = self.chipID
+        self.regs[0xF7:0xFF] = bytes.fromhex("80 00 00 80 00 00 80 00")   # skipped values
+
+
+    def writeRegister(self, reg, value):
+
+        if   reg == 0xE0:
+            if value == 0xB6: self.reset()
+        elif reg in (0xF2, 0xF4, 0xF5):
+            self.regs[reg] = value
+            if reg == 0xF4 and value & 0x03 in (0x01, 0x02):  # forced mode
+                self.ready_at = time.time() + self.__measureTime()
+                self.__measure()
+            elif reg == 0xF4 and value & 0x03 == 0x03:          # normal mode, 1st measurement
+                self.ready_at = time.time() + self.__measureTime()
+        # all other registers are read-only
+
+
+    def readRegister(self, reg):
+
+        normal = self.regs[0xF4] & 0x03 == 0x03
+        if reg == 0xF3:                                     # status
+            # in normal mode only during the measurement before ready_at
+            measuring = 0x08 if self.ready_at - (self.__measureTime() if normal else 1e9) <= time.time() < self.ready_at else 0x00
+            return measuring
+        if reg == 0xF7 and normal and time.time() >= self.ready_at:
+            self.__measure()                                # the latest of the continuous measurements
+            self.ready_at = time.time() + self.__standbyTime() + self.__measureTime()
+        if reg == 0xF4 and time.time() >= self.ready_at and self.regs[0xF4] & 0x03 in (0x01, 0x02):
+            self.regs[0xF4] &= 0xFC                         # back to sleep mode
+
+        return self.regs[reg]
+
+
+    def __measureTime(self):
+        """max measurement time in sec according to datasheet, 9.1"""
+
+        osrs  = [0, 1, 2, 4, 8, 16, 16, 16]
+        osr_t = osrs[self.regs[0xF4] >> 5 & 0x07]
+        osr_p = osrs[self.regs[0xF4] >> 2 & 0x07]
+        osr_h = osrs[self.regs[0xF2] & 0x07]
+
+        return (1.25 + 2.3 * osr_t + (2.3 * osr_p + 0.575 if osr_p else 0) + (2.3 * osr_h + 0.575 if osr_h else 0)) / 1000
+
+
+    def __standbyTime(self):
+        """standby time in sec in normal mode, datasheet 5.4.6"""
+
+        return [0.5, 62.5, 125, 250, 500, 1000, 10, 20][self.regs[0xF5] >> 5 & 0x07] / 1000
+
+
+    def __measure(self):
+        """put new raw values into the data registers 0xF7 ... 0xFE"""
+
+        n = (lambda r: random.randint(-r, r)) if self.noise else (lambda r: 0)
+        p = (self.press_raw + n(40)) << 4
+        t = (self.temp_raw  + n(40)) << 4
+        h =  self.hum_raw   + n(20)
+        self.regs[0xF7:0xFF] = bytes([p >> 16 & 0xFF, p >> 8 & 0xFF, p & 0xF0,
+                                      t >> 16 & 0xFF, t >> 8 & 0xFF, t & 0xF0,
+                                      h >> 8  & 0xFF, h & 0xFF])
+
+
+class SIMsensorLM75(SIMdevice):
+    """LM75(B); the pointer is not auto-incremented, a read repeats the register"""
+
+    name        = "LM75"
+    temp        = 23.125            # deg Celsius
+
+    def __init__(self):
+        SIMdevice.__init__(self)
+        self.regs[0x01] = 0x00      # conf
+        self.thyst      = [0x4B, 0x00]
+        self.tos        = [0x50, 0x00]
+
+
+    def write(self, data):
+
+        if len(data) == 0: return
+        self.pointer = data[0] & 0x03
+        if   self.pointer == 0x01 and len(data) > 1: self.regs[0x01] = data[1]
+        elif self.pointer == 0x02 and len(data) > 2: self.thyst = list(data[1:3])
+        elif self.pointer == 0x03 and len(data) > 2: self.tos   = list(data[1:3])
+
+
+    def read(self, count):
+
+        if   self.pointer == 0x00:
+            t11  = int(round(self.temp / 0.125)) & 0x7FF
+            word = [t11 >> 3, (t11 << 5) & 0xE0]
+        elif self.pointer == 0x01: word = [self.regs[0x01]]
+        elif self.pointer == 0x02: word = self.thyst
+        else:                      word = self.tos
+
+        return (word * count)[:count]
+
+
+class SIMsensorTSL2591(SIMdevice):
+    """TSL2591; the 1st byte is the command byte 0b1 TT AAAAA (CMD, transaction, address)"""
+
+    name        = "TSL2591"
+    chipID      = 0x50
+    gains       = (1, 25, 428, 9876)
+    vislight    = 150.0             # counts at gain 1 and 100 ms
+    irlight     = 40.0
+
+    def __init__(self):
+        SIMdevice.__init__(self)
+        self.regs[0x12] = self.chipID
+        self.regs[0x11] = 0x00      # PID
+        self.valid_at   = None
+
+
+    def write(self, data):
+
+        if len(data) == 0: return
+        if data[0] & 0x80 == 0: return                  # not a command
+        self.pointer = data[0] & 0x1F
+        for a in data[1:]:
+            self.writeRegister(self.pointer, a & 0xFF)
+            self.pointer = (self.pointer + 1) & 0x1F
+
+
+    def writeRegister(self, reg, value):
+
+        if reg == 0x01 and value & 0x80:                # system reset
+            self.regs[0x00] = 0x00
+            self.regs[0x01] = 0x00
+            self.valid_at   = None
+            return
+        if reg in (0x00, 0x01):
+            self.regs[reg] = value
+            if reg == 0x00:
+                if value & 0x03 == 0x03:                # PON and AEN
+                    self.valid_at = time.time() + self.__intTime()
+                else:
+                    self.valid_at = None
+
+
+    def readRegister(self, reg):
+
+        if reg == 0x13:                                 # status: AVALID
+            return 0x01 if self.__valid() else 0x00
+        if 0x14 <= reg <= 0x17:
+            gain = self.gains[self.regs[0x01] >> 4 & 0x03]
+            fct  = gain * self.__intTime() / 0.1
+            vis  = min(int(self.vislight * fct), 0xFFFF)
+            ir   = min(int(self.irlight  * fct), 0xFFFF)
+            return [vis & 0xFF, vis >> 8, ir & 0xFF, ir >> 8][reg - 0x14]
+
+        return self.regs[reg]
+
+
+    def __intTime(self):
+        """integration time in sec"""
+
+        return ((self.regs[0x01] & 0x07) + 1) * 0.1
+
+
+    def __valid(self):
+
+        return self.valid_at is not None and time.time() >= self.valid_at
+
+
+class SIMsensorSHT7x(SIMdevice):
+    """SHT71/SHT75 on the Sensibus; the 1st byte is the command, 3 bytes are
+    returned: MSB, LSB, CRC"""
+
+    name        = "SHT7x"
+    soT         = 6116              # 21.50 deg Celsius at 3.3V
+    soRH        = 1362              # ~ 45 %
+
+    def __init__(self):
+        SIMdevice.__init__(self)
+        self.command = 0x00
+        self.status  = 0x00
+
+
+    def write(self, data):
+
+        if len(data) == 0: return
+        self.command = data[0] & 0x1F
+        if self.command == 0x1E: self.status = 0x00     # soft reset
+        if self.command == 0x06 and len(data) > 1: self.status = data[1]
+
+
+    def read(self, count):
+
+        if   self.command == 0x03: answ = [self.soT  >> 8, self.soT  & 0xFF]
+        elif self.command == 0x05: answ = [self.soRH >> 8, self.soRH & 0xFF]
+        elif self.command == 0x07: answ = [self.status]
+        else:                      answ = []
+        answ = answ + [self.__crc([self.command] + answ)]
+
+        return (answ + [0x00] * count)[:count]
+
+
+    def __crc(self, data):
+        """CRC as in 'Sensirion_Humidity_SHT1x_SHT7x_CRC_Calculation_V1.pdf'"""
+
+        crc = self.status & 0x0F
+        crc = int("{:08b}".format(crc)[::-1], 2)
+        for a in data:
+            for i in range(7, -1, -1):
+                bit = (a >> i) & 0x01
+                if bit ^ (crc >> 7): crc = ((crc << 1) ^ 0x31) & 0xFF
+                else:                crc = (crc << 1) & 0xFF
+
+        return int("{:08b}".format(crc)[::-1], 2)
+
+
+class SIMsensorSCD4x(SIMdevice):
+    """SCD40/SCD41; commands are 16 bit, every 16 bit word is followed by a CRC"""
+
+    name        = "SCD4x"
+    serial      = (0x1234, 0x5678, 0x9ABC)
+    co2         = 612               # ppm
+    temp        = 22.3              # deg Celsius
+    hum         = 44.5              # %
+
+    def __init__(self, clock=1.0):
+        """clock: the period of the measurements is multiplied with clock,
+        e.g. 1.01 for a sensor 1 % slow"""
+        SIMdevice.__init__(self)
+        self.command   = None
+        self.answer    = []
+        self.clock     = clock
+        self.period    = None       # 5 sec or 30 sec when running
+        self.started   = None
+        self.last_read = None
+        self.altitude  = 0
+        self.offset    = 0x8000
+
+
+    def write(self, data):
+
+        if len(data) < 2: return
+        self.command = data[0] << 8 | data[1]
+        value        = (data[2] << 8 | data[3]) if len(data) > 3 else None
+        self.answer  = []
+
+        if   self.command == 0x21b1: self.__start(5)                     # start_periodic_measurement
+        elif self.command == 0x21ac: self.__start(30)                    # start_low_power_periodic_measurement
+        elif self.command == 0x3f86: self.period = None                  # stop_periodic_measurement
+        elif self.command == 0xec05:                                     # read_measurement
+            t  = int((self.temp + 45) * 65536 / 175) & 0xFFFF
+            rh = int(self.hum * 65536 / 100) & 0xFFFF
+            self.answer    = self.__words(self.co2, t, rh)
+            self.last_read = time.time()
+        elif self.command == 0xe4b8:                                     # get_data_ready_status
+            self.answer = self.__words(0x8006 if self.__ready() else 0x8000)
+        elif self.command == 0x3682: self.answer = self.__words(*self.serial)
+        elif self.command == 0x3639: self.answer = self.__words(0x0000)  # perform_self_test: ok
+        elif self.command == 0x2322: self.answer = self.__words(self.altitude)
+        elif self.command == 0x2427 and value is not None: self.altitude = value
+        elif self.command == 0x362f and value is not None:               # perform_forced_recalibration
+            self.offset = (value - self.co2 + 0x8000) & 0xFFFF
+            self.answer = self.__words(self.offset)
+        elif self.command == 0x2313: self.answer = self.__words(0x0001)  # ASC enabled
+        elif self.command == 0x2318: self.answer = self.__words(0x0000)  # temperature offset
+
+
+    def read(self, count):
+
+        answ = self.answer[:count]
+        if len(answ) < count:
+            answ += [0xFF] * (count - len(answ))
+
+        return answ
+
+
+    def __start(self, period):
+
+        self.period  = period
+        self.started = time.time()
+
+
+    def __ready(self):
+        """a measurement completed since the last read; the sensor measures
+        every period from the start, whenever it is read"""
+
+        if self.period is None: return False
+        period = self.period * self.clock
+        done   = int((time.time() - self.started) / period)
+        if self.last_read is None or self.last_read < self.started: return done > 0
+
+        return done > int((self.last_read - self.started) / period)
+
+
+    def __words(self, *words):
+
+        answ = []
+        for w in words:
+            b     = [w >> 8 & 0xFF, w & 0xFF]
+            answ += b + [SIMcrc8(b)]
+
+        return answ
+
+
+class SIMsensorHT16K33(SIMdevice):
+    """HT16K33 LED driver; 16 bytes of display RAM at 0x00 ... 0x0F; the upper
+    nibble of the 1st byte selects the command"""
+
+    name        = "HT16K33"
+
+    def __init__(self):
+        SIMdevice.__init__(self)
+        self.system  = 0x20
+        self.display = 0x80
+        self.rowint  = 0xA0
+        self.dimming = 0xEF
+
+
+    def write(self, data):
+
+        if len(data) == 0: return
+        cmd = data[0] & 0xF0
+        if   cmd == 0x20: self.system  = data[0]
+        elif cmd == 0x80: self.display = data[0]
+        elif cmd == 0xA0: self.rowint  = data[0]
+        elif cmd == 0xE0: self.dimming = data[0]
+        elif cmd == 0x00:                                   # display data
+            self.pointer = data[0] & 0x0F
+            for a in data[1:]:
+                self.regs[self.pointer] = a & 0xFF
+                self.pointer = (self.pointer + 1) & 0x0F
+
+
+    def read(self, count):
+
+        answ = []
+        for i in range(count):
+            answ.append(self.regs[self.pointer & 0x0F])
+            self.pointer = (self.pointer + 1) & 0x0F
+
+        return answ
+
+
+class SIMdongle(Dongle):
+    """Code for the simulated I2C Dongle"""
+
+    name        = "SIMdongle"
+    short       = "dongle"
+
+    #              SIM name    xX   time   reqB   wrt/rec   info     rec
+    pTemplate   = "SIM {:7s} {:2s} {:10s} [{:3d}] [{:3d}]  {:20s} == {}"
+
+    def __init__(self, sensors=None, latency=0, jitter=0, busclock=100000):
+        """Populate the bus. Default are all supported sensors on their default
+        addresses (see glob.py); sensors is a dict {7bit addr: SIMdevice}.
+        latency: time in ms spent on each USB round trip (write, read)
+        jitter:  max random time in ms added to the latency
+        busclock: I2C clock in Hz; used to add the time on the bus"""
+
+        if sensors is None:
+            sensors = { 0x77: SIMsensorBME280(),
+                        0x48: SIMsensorLM75(),
+                        0x29: SIMsensorTSL2591(),
+                        0x00: SIMsensorSHT7x(),
+                        0x62: SIMsensorSCD4x(),
+                        0x70: SIMsensorHT16K33(),
+                      }
+        self.bus      = dict(sensors)
+        self.latency  = latency
+        self.jitter   = jitter
+        self.busclock = busclock
+        self.nacks    = 0           # count of transactions not acknowledged
+
+        util.fncprint("SIM Dongle initialized with {} devices, latency: {} ms".format(len(self.bus), latency))
+
+
+    def SIMaddSensor(self, addr, sensor):
+        """connect a SIMdevice at 7bit address addr"""
+
+        self.bus[addr] = sensor
+
+
+    def SIMshowInfo(self):
+        """Show the devices on the simulated bus"""
+
+        print("\n---- Show Info")
+        for addr in sorted(self.bus):
+            util.fncprint("0x{:02X}: {}".format(addr, self.bus[addr].name))
+
+
+    def askDongle(self, addr, data, rbytes, wait_time=0, name="no name", info="no info", doPrint=True, end="\n"):
+        """takes care of the communication needs of the dongle"""
+
+        t0 = self.stats.clock()
+        self.SIMwriteData(addr, data, name=name, info=info, doPrint=doPrint)
+        t1 = self.stats.clock()
+        if wait_time>2: time.sleep(wait_time/1000)
+        t2 = self.stats.clock()
+        if rbytes > 0:
+            answ = self.SIMreadData(addr, rbytes, name=name, doPrint=doPrint)
+            if doPrint and self.trace.echo: print(end=end)
+        else:
+            answ = None
+        self.stats.record(self.name, name, info, t0, t1, t2, self.stats.clock())
+
+        return answ
+
+
+    def askDongleBatch(self, transactions, name="no name", info="no info", doPrint=True, end="\n"):
+        """ The whole batch costs a single USB round trip, plus one more for
+        each wait_time"""
+
+        t0      = self.stats.clock()
+        waited  = 0                         # ns of the wait_times
+        answers = []
+        nbytes  = 0                         # bytes on the bus since last round trip
+        for addr, data, rbytes, wait_time in transactions:
+            self.SIMwriteData(addr, data, name=name, info=info, doPrint=doPrint, delay=False, xx="TB")
+            nbytes += len(data) + 1
+            if wait_time>2:
+                self.SIMdelay(nbytes)
+                tw     = self.stats.clock()
+                time.sleep(wait_time/1000)
+                waited += self.stats.clock() - tw
+                nbytes = 0
+            if rbytes > 0:
+                answers.append(self.SIMreadData(addr, rbytes, name=name, doPrint=doPrint, delay=False, xx="RB"))
+                if doPrint and self.trace.echo: print()
+                nbytes += rbytes + 1
+            else:
+                answers.append(None)
+        t2      = self.stats.clock()
+        self.SIMdelay(nbytes)
+        if doPrint and self.trace.echo: print(end=end)
+        self.stats.record(self.name, name, info, t0, t2 - waited, t2, self.stats.clock())
+
+        return answers
+
+
+    def scanBus(self, first=0x03, last=0x77, doPrint=True):
+        """ All addresses cost a single USB round trip, with the address byte
+        of each on the bus"""
+
+        addrs = [addr for addr in range(first, last + 1) if addr in self.bus]
+        self.SIMdelay(last - first + 1)
+        if doPrint: self.showBusMap(addrs, first, last)
+
+        return addrs
+
+
+    def SIMwriteData(self, addr, data, name="", info="", doPrint=True, delay=True, xx="TX"):
+        """write to the sensor at addr"""
+
+        if delay: self.SIMdelay(len(data) + 1)
+        if addr in self.bus:
+            self.bus[addr].write(list(data))
+            rec = "ACK"
+        else:
+            self.nacks += 1
+            rec = "NoACK"
+        self.trace.record(self.name, addr, xx, data, status=TRACE_OK if addr in self.bus else TRACE_NACK)
+        if doPrint and self.trace.echo: print(self.pTemplate.format(name, xx, util.strtime()[11:], len(data) + 1, len(data) + 1, info, self.__strData(data) + rec))
+
+
+    def SIMreadData(self, addr, rbytes, name="", info="", doPrint=True, delay=True, xx="RX"):
+        """read rbytes from the sensor at addr; a missing sensor returns 0xFF
+        as the bus is pulled high"""
+
+        if delay: self.SIMdelay(rbytes + 1)
+        if addr in self.bus:
+            answ = self.bus[addr].read(rbytes)
+        else:
+            answ = [0xFF] * rbytes
+        self.trace.record(self.name, addr, xx, answ, status=TRACE_OK if addr in self.bus else TRACE_NACK)
+        if doPrint and self.trace.echo: print(self.pTemplate.format("", xx, util.strtime()[11:], rbytes, len(answ), info, self.__strData(answ)), end="")
+
+        return answ
+
+
+    def SIMdelay(self, nbytes):
+        """sleep for one USB round trip plus nbytes on the bus (9 clocks per byte)"""
+
+        if nbytes == 0: return
+        delay = self.latency / 1000 + nbytes * 9 / self.busclock
+        if self.jitter: delay += random.uniform(0, self.jitter / 1000)
+        if self.latency or self.jitter: time.sleep(delay)
+
+
+    def close(self):
+        """ nothing to close but the worker """
+
+        self.stopWorker()
+        print("SIM is closed")
+
+
+    def __strData(self, data):
+        """Convert list of integer to Hex string"""
+
+        return "".join("{:02X} ".format(a) for a in data)
+
+
+class SIMiowdevice:
+    """One emulated IO-Warrior in I2C special mode; the reports are answered
+    from the bus of a SIMdongle"""
+
+    def __init__(self, dongle=None, pid=0x1501, serial="0000ABCD", revision=0x1030):
+        """dongle: the SIMdongle holding the bus (default: all sensors)
+        pid: product ID; IOW28 (0x1504) and IOW56 (0x1503) use 64 byte reports"""
+
+        self.dongle     = dongle if dongle is not None else SIMdongle()
+        self.pid        = pid
+        self.serial     = serial
+        self.revision   = revision
+        self.reportSize = 64 if pid in (0x1504, 0x1503) else 8
+        self.sensibus   = False
+        self.timeout    = 0                     # ms; a read of an empty queue waits this long
+        self.replies    = collections.deque()   # (time when ready, report) waiting to be read
+        self.ready      = 0                     # time when the last reply is ready
+        self.pending    = None                  # [addr, data] of a write without Stop
+
+
+    def write(self, report):
+        """process one report; the answers are queued for read and are ready
+        one USB round trip later, so that several reports can be on the way"""
+
+        dongle = self.dongle
+        if dongle.latency or dongle.jitter:     # timing as in SIMdelay
+            latency    = dongle.latency / 1000 + (random.uniform(0, dongle.jitter / 1000) if dongle.jitter else 0)
+            self.ready = max(self.ready, time.monotonic() + latency) + len(report) * 9 / dongle.busclock
+
+        if   report[0] == 0x01:                     # enable I2C mode
+            self.sensibus = bool(report[2] & 0x40)
+
+        elif report[0] == 0x02:                     # write
+            flags = report[1]
+            data  = list(report[2:2 + (flags & 0x3F)])
+            if flags & 0x80:                        # Start: 1st byte is address
+                self.__flush()
+                self.pending = [data[0] >> 1, data[1:]]
+            elif self.pending is not None:
+                self.pending[1] += data
+            nack = self.pending is None or self.pending[0] not in self.dongle.bus
+            if flags & 0x40: self.__flush()         # Stop
+            self.__reply(0x02, (flags & 0x3F) | (0x80 if nack else 0x00), [])
+
+        elif report[0] == 0x03:                     # read
+            count = report[1]
+            self.__flush()
+            if self.sensibus:                       # command instead of address
+                addr = 0x00
+                if addr in self.dongle.bus: self.dongle.bus[addr].write([report[2]])
+            else:
+                addr = report[2] >> 1
+            if addr not in self.dongle.bus:
+                self.__reply(0x03, 0x80, [])
+            else:
+                answ  = self.dongle.bus[addr].read(count)
+                chunk = self.reportSize - 2
+                for i in range(0, count, chunk):
+                    self.__reply(0x03, len(answ[i:i + chunk]), answ[i:i + chunk])
+
+
+    def read(self, timeout=0):
+        """returns the next report, None if no report is ready within timeout (ms)"""
+
+        if not self.replies: return None
+        wait = self.replies[0][0] - time.monotonic()
+        if wait > timeout / 1000: return None
+        if wait > 0: time.sleep(wait)
+
+        return self.replies.popleft()[1]
+
+
+    def __flush(self):
+        """deliver a pending write to the device"""
+
+        if self.pending is None: return
+        addr, data = self.pending
+        if addr in self.dongle.bus: self.dongle.bus[addr].write(data)
+        self.pending = None
+
+
+    def __reply(self, repID, flags, data):
+
+        report = bytes([repID, flags] + list(data))
+        self.replies.append((self.ready, report + bytes(self.reportSize - len(report))))
+
+
+class SIMi2cdev:
+    """Stand-in for the ioctl of a native I2C adapter (see LNX.py), with the
+    bus of a SIMdongle, so that LNXdongle runs unchanged:
+    LNX.LNXdongle(fd=0, ioctl=SIM.SIMi2cdev())
+    A message to an address without sensor fails with ENXIO, like the kernel"""
+
+    def __init__(self, dongle=None):
+        """dongle: the SIMdongle holding the bus (default: all sensors)"""
+
+        self.dongle = dongle if dongle is not None else SIMdongle()
+
+
+    def __call__(self, fd, request, arg):
+
+        if request != LNX.I2C_RDWR: raise OSError(errno.EINVAL, "SIMi2cdev: only I2C_RDWR")
+
+        msgs = arg.msgs[:arg.nmsgs]
+        for msg in msgs:
+            if msg.addr not in self.dongle.bus: raise OSError(errno.ENXIO, "No such device or address")
+        for msg in msgs:
+            if msg.flags & LNX.I2C_M_RD:
+                answ = self.dongle.bus[msg.addr].read(msg.len)
+                for i in range(msg.len): msg.buf[i] = answ[i]
+            else:
+                self.dongle.bus[msg.addr].write(list(msg.buf[:msg.len]))
+        self.dongle.SIMdelay(sum(msg.len + 1 for msg in msgs))
+
+        return 0
+
+
+class SIMiowkit:
+    """Stand-in for the iowkit library of the IO-Warrior dongles (see IOW.py)
+    with one or several emulated devices, so that IOWdongle runs unchanged:
+    IOW.IOWdongle(lib=SIM.SIMiowkit())
+    IOW.IOWopenAll(lib=SIM.SIMiowkit(devices=[SIM.SIMiowdevice(serial="00001234"), ...]))
+
+    The handles are the device numbers 1 ... n"""
+
+    version     = b"IO-Warrior Kit V1.5 (SIM)"
+
+    def __init__(self, dongle=None, pid=0x1501, serial="0000ABCD", revision=0x1030, devices=None):
+        """devices: list of SIMiowdevice; default is a single device made
+        from dongle, pid, serial and revision"""
+
+        if devices is None: devices = [SIMiowdevice(dongle, pid, serial, revision)]
+        self.devices    = devices
+        self.opened     = False
+
+
+    def IowKitOpenDevice(self):
+
+        self.opened = True
+
+        return 1 if self.devices else None
+
+
+    def IowKitCloseDevice(self, handle=None):       self.opened = False
+    def IowKitGetNumDevs(self):                     return len(self.devices) if self.opened else 0
+    def IowKitVersion(self):                        return self.version
+    def IowKitGetProductId(self, handle):           return self.devices[handle - 1].pid
+    def IowKitGetRevision(self, handle):            return self.devices[handle - 1].revision
+    def IowKitSetWriteTimeout(self, handle, timeout): return True
+
+
+    def IowKitSetTimeout(self, handle, timeout):
+
+        self.devices[handle - 1].timeout = timeout
+
+        return True
+
+
+    def IowKitCancelIo(self, handle, numPipe):
+
+        self.devices[handle - 1].replies.clear()
+
+        return True
+
+
+    def IowKitGetDeviceHandle(self, numDevice):
+
+        return numDevice if self.opened and 1 <= numDevice <= len(self.devices) else None
+
+
+    def IowKitGetSerialNumber(self, handle, buffer):
+
+        sno = (self.devices[handle - 1].serial.encode("utf-16-le") + bytes(18))[:18]
+        ctypes.memmove(buffer, sno, len(sno))
+
+        return True
+
+
+    def IowKitWrite(self, handle, numPipe, buffer, length):
+
+        self.devices[handle - 1].write(ctypes.string_at(buffer, length))
+
+        return length
+
+
+    def IowKitRead(self, handle, numPipe, buffer, length):
+        """blocks for the read timeout if no report is waiting, then returns 0"""
+
+        device = self.devices[handle - 1]
+        report = device.read(device.timeout)
+        if report is None:
+            time.sleep(device.timeout / 1000)
+            return 0
+        ctypes.memmove(buffer, report, min(length, len(report)))
+
+        return min(length, len(report))
+
+
+    def IowKitReadNonBlocking(self, handle, numPipe, buffer, length):
+        """returns 0 at once if no report is ready"""
+
+        report = self.devices[handle - 1].read()
+        if report is None: return 0
+        ctypes.memmove(buffer, report, min(length, len(report)))
+
+        return min(length, len(report))
@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+
+"""
+Latency statistics of the dongles: every askDongle is timed on the
+monotonic clock, split into the write, wait and read phase, and counted
+into histograms per dongle, sensor and info label; the time the bus is
+busy (write and read) gives the bus utilisation over time; the failed
+attempts of transactions (see Retry.py) are counted by reason
+"""
+
+import time, threading, collections
+
+
+class Histogram:
+    """HDR style histogram of latencies in µs: the buckets are exact up to
+    2 * 2**subBits µs, above the width doubles with every power of 2, so
+    that all values are kept with a precision of 1 / 2**subBits"""
+
+    subBits = 4                                 # 16 sub-buckets: max 6 % error
+
+    def __init__(self):
+
+        self.counts = [0] * ((64 - self.subBits) << self.subBits)
+        self.n      = 0
+        self.sum    = 0
+        self.min    = None
+        self.max    = 0
+
+
+    def record(self, value):
+        """count a latency of value µs"""
+
+        value = int(value)
+        shift = value.bit_length() - self.subBits - 1
+        if shift <= 0:  self.counts[value] += 1
+        else:           self.counts[(shift << self.subBits) + (value >> shift)] += 1
+
+        self.n   += 1
+        self.sum += value
+        if self.min is None or value < self.min: self.min = value
+        if value > self.max:                     self.max = value
+
+
+    def merge(self, other):
+        """add the counts of the histogram other"""
+
+        for i, c in enumerate(other.counts):
+            if c: self.counts[i] += c
+        self.n   += other.n
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or other.min < self.min): self.min = other.min
+        if other.max > self.max: self.max = other.max
+
+
+    def percentile(self, p):
+        """returns the latency in µs below which p percent of the values are,
+        within the precision of the bucket"""
+
+        if self.n == 0: return 0
+
+        rank = p / 100 * self.n
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if c and seen >= rank: break
+
+        sub   = 1 << self.subBits
+        shift = (i >> self.subBits) - 1 if i >= 2 * sub else 0
+        value = ((i - (shift << self.subBits) + 1) << shift) - 1   # highest value of the bucket
+
+        return min(max(value, self.min), self.max)
+
+
+    def mean(self):
+
+        return self.sum / self.n if self.n else 0
+
+
+class Stats:
+    """Latency histograms of all dongles and their bus utilisation"""
+
+    phases = ("write", "wait", "read", "total")
+
+    def __init__(self, window=10, windows=360):
+        """window: seconds over which the bus utilisation is summed up
+        windows: no of windows kept per dongle (default 1 hour)"""
+
+        self.window     = window
+        self.windows    = windows
+        self.hists      = {}                    # (dongle, name, info): [Histogram per phase]
+        self.busy       = {}                    # dongle: deque of [window no, ns of bus busy]
+        self.failures   = collections.Counter() # (dongle, name, reason): no of failed attempts
+        self.lock       = threading.Lock()      # dongles record from their workers
+        self.start      = time.perf_counter_ns()
+
+
+    def clock(self):
+        """the monotonic clock in ns, for the timestamps given to record"""
+
+        return time.perf_counter_ns()
+
+
+    def record(self, dongle, name, info, t0, t1, t2, t3):
+        """count a transaction of dongle for the sensor name with the info
+        label, by its timestamps (from clock): start of writing, end of
+        writing, end of waiting, end of reading"""
+
+        phases = (t1 - t0, t2 - t1, t3 - t2, t3 - t0)
+        wnd    = (t3 - self.start) // (self.window * 1000000000)
+
+        with self.lock:
+            hists = self.hists.get((dongle, name, info))
+            if hists is None:
+                hists = self.hists[(dongle, name, info)] = [Histogram() for p in self.phases]
+            for hist, ns in zip(hists, phases): hist.record(ns // 1000)
+
+            busy = self.busy.get(dongle)
+            if busy is None:
+                busy = self.busy[dongle] = collections.deque(maxlen=self.windows)
+            if not busy or busy[-1][0] != wnd: busy.append([wnd, 0])
+            busy[-1][1] += phases[0] + phases[2]
+
+
+    def failure(self, dongle, name, reason):
+        """count a failed attempt of a transaction of dongle for the sensor
+        name; reason like "NoACK", "error bit", "given up" """
+
+        with self.lock: self.failures[(dongle, name, reason)] += 1
+
+
+    def histograms(self, by="dongle"):
+        """returns the histograms merged by "dongle", "name" (sensor) or "info"
+        as dict {label: [Histogram per phase]}"""
+
+        pos    = ("dongle", "name", "info").index(by)
+        merged = {}
+        with self.lock:
+            for key, hists in self.hists.items():
+                label = key[pos] if by != "info" else "{} {}".format(key[1], key[2])
+                if label not in merged: merged[label] = [Histogram() for p in self.phases]
+                for m, h in zip(merged[label], hists): m.merge(h)
+
+        return merged
+
+
+    def utilisation(self, dongle, last=None):
+        """returns the bus utilisation of dongle in percent as list of
+        (seconds since start of the window, percent), oldest first;
+        last: only the last n windows"""
+
+        now = (time.perf_counter_ns() - self.start) // (self.window * 1000000000)
+        with self.lock:
+            busy = list(self.busy.get(dongle, []))
+        if last is not None: busy = busy[-last:]
+
+        pcts = []
+        for wnd, ns in busy:
+            # the current window is not complete yet
+            length = self.window if wnd < now else (time.perf_counter_ns() - self.start) / 1e9 - wnd * self.window
+            pcts.append((wnd * self.window, 100 * ns / 1e9 / length if length > 0 else 0))
+
+        return pcts
+
+
+    def show(self, by=("dongle", "name", "info"), last=6):
+        """print the latencies in ms (median / 99th percentile / max of each
+        phase) and the bus utilisation of the last windows"""
+
+        for grp in by:
+            hists = self.histograms(grp)
+            if not hists: continue
+            print("\n---- Latency by {:6s}  [ms] {:>9s}".format(grp, "n") +
+                  "".join("  {:>18s}".format(p + " p50/p99/max") for p in self.phases))
+            for label in sorted(hists):
+                line = "   {:30s} {:7d}".format(label, hists[label][0].n)
+                for h in hists[label]:
+                    line += "  {:6.1f}/{:5.1f}/{:5.1f}".format(h.percentile(50) / 1000, h.percentile(99) / 1000, h.max / 1000)
+                print(line)
+
+        for dongle in sorted(self.busy):
+            pcts = self.utilisation(dongle, last)
+            print("\n---- Bus utilisation {} [%] per {} s: ".format(dongle, self.window) +
+                  " ".join("{:5.1f}".format(pct) for t, pct in pcts))
+
+        with self.lock: failures = sorted(self.failures.items())
+        if failures:
+            print("\n---- Failed attempts")
+            for (dongle, name, reason), count in failures:
+                print("   {:10s} {:10s} {:12s} {:7d}".format(dongle, name, reason, count))
+
+
+    def clear(self):
+
+        with self.lock:
+            self.hists = {}
+            self.busy  = {}
+            self.failures.clear()
+            self.start = time.perf_counter_ns()
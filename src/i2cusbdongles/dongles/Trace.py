@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+
+"""
+Transaction trace of the dongles: a fixed-size ring buffer, preallocated,
+with one binary record per transfer; formatting is done only when the
+trace is shown or exported
+"""
+
+import time, struct, threading
+
+# status of a record
+TRACE_OK        = 0
+TRACE_NACK      = 1         # NoACK, error bit, error msg from dongle
+TRACE_TIMEOUT   = 2         # no or incomplete answer
+
+TRACE_NOADDR    = 0xFF      # for transfers without a single sensor address (admin, batches)
+
+
+class Trace:
+    """Ring buffer of transfer records:
+    timestamp, dongle, addr, direction, length, status, payload"""
+
+    header      = struct.Struct("<dBBBHB")      # time, dongle, addr, xx, length, status
+    statusNames = {TRACE_OK: "", TRACE_NACK: "NoACK", TRACE_TIMEOUT: "Timeout"}
+
+    def __init__(self, capacity=4096, payloadSize=64):
+        """capacity: no of records kept, the oldest are overwritten
+        payloadSize: bytes kept of each payload, longer ones are truncated"""
+
+        self.capacity    = capacity
+        self.payloadSize = payloadSize
+        self.recordSize  = self.header.size + payloadSize
+        self.buffer      = bytearray(capacity * self.recordSize)
+        self.count       = 0                    # no of records ever written
+        self.lock        = threading.Lock()     # dongles record from their workers
+        self.names       = []                   # dongle names and directions by index
+        self.index       = {}
+        self.echo        = True                 # print every transfer as it happens (doPrint)
+
+
+    def record(self, dongle, addr, xx, payload, length=None, status=TRACE_OK):
+        """record a transfer; payload is anything convertible by bytes(),
+        length the no of bytes transferred (default len(payload))"""
+
+        if length is None: length = len(payload)
+        payload = bytes(payload[:self.payloadSize])
+
+        with self.lock:
+            dix = self.index.get(dongle)
+            if dix is None: dix = self.__intern(dongle)
+            xix = self.index.get(xx)
+            if xix is None: xix = self.__intern(xx)
+            off = (self.count % self.capacity) * self.recordSize
+            self.header.pack_into(self.buffer, off, time.time(), dix, addr & 0xFF, xix, min(length, 0xFFFF), status)
+            off += self.header.size
+            self.buffer[off:off + len(payload)] = payload
+            self.count += 1
+
+
+    def records(self, last=None):
+        """returns the records, oldest first, as list of
+        (time, dongle, addr, xx, length, status, payload); last: only the last n"""
+
+        with self.lock:
+            n     = min(self.count, self.capacity)
+            if last is not None: n = min(n, last)
+            recs  = []
+            for i in range(self.count - n, self.count):
+                off = (i % self.capacity) * self.recordSize
+                t, dix, addr, xix, length, status = self.header.unpack_from(self.buffer, off)
+                off += self.header.size
+                recs.append((t, self.names[dix], addr, self.names[xix], length, status,
+                             bytes(self.buffer[off:off + min(length, self.payloadSize)])))
+
+        return recs
+
+
+    def show(self, last=20):
+        """print the last records"""
+
+        print("\n---- Trace: last {} of {} transfers".format(min(last, self.count, self.capacity), self.count))
+        for t, dongle, addr, xx, length, status, payload in self.records(last):
+            print(self.__format(t, dongle, addr, xx, length, status, payload))
+
+
+    def export(self, filename):
+        """write all records to a CSV file"""
+
+        with open(filename, "w") as f:
+            f.write("#time, dongle, addr, xx, length, status, payload\n")
+            for t, dongle, addr, xx, length, status, payload in self.records():
+                f.write("{:.6f}, {}, {}, {}, {}, {}, {}\n".format(t, dongle, "" if addr == TRACE_NOADDR else "0x{:02X}".format(addr),
+                                                                 xx, length, self.statusNames[status], payload.hex(" ").upper()))
+
+
+    def clear(self):
+
+        with self.lock: self.count = 0
+
+
+    def __intern(self, name):
+
+        self.names.append(name)
+        self.index[name] = len(self.names) - 1
+
+        return self.index[name]
+
+
+    def __format(self, t, dongle, addr, xx, length, status, payload):
+
+        saddr = "  " if addr == TRACE_NOADDR else "{:02X}".format(addr)
+        strunc = "..." if length > len(payload) else ""
+
+        return "{}.{:03d} {:10s} {} {:2s} [{:3d}] {:7s} == {}{}".format(time.strftime("%H:%M:%S", time.localtime(t)), int(t % 1 * 1000),
+                                                                  dongle, saddr, xx, length, self.statusNames[status],
+                                                                  payload.hex(" ").upper(), strunc)
@@ -20,16 +20,41 @@ verbose             = True                 # more detailed printing, use via com
 
 # dir & file
 dataDirectory       = "data"                # the data subdirectory to the program directory
+calibrationCache    = "calibration.json"    # file in dataDirectory keeping the calibration of the sensors
+                                            # by dongle and address, for a quicker restart; None: not kept
 
 #%% Dongles
 
 #Beware that None is not a pointer, so updating this dict will not update objects referring directly to its values
-dongles = {'ELVdongle': None, 'IOW-DG': None, 'ISSdongle': None, 'dummy': None}
+dongles = {'ELVdongle': None, 'IOW-DG': None, 'ISSdongle': None, 'SIMdongle': None, 'LNXdongle': None, 'REPdongle': None, 'dummy': None}
 
 disable_pullups = True                      # To disable pull-ups transistors of the dongle, if alreayd present on the sensor PCB
+iss_busclock    = 100000                    # I2C bus clock in Hz of the ISS dongle: 100000, 400000, 1000000
+                                            # (hardware I2C), 20000, 50000 with iss_hardware = False
+iss_hardware    = True                      # ISS dongle uses its hardware I2C module
+iow_i2ctimeout  = 128                       # ms the IOW dongle waits for clock stretching, 0.5 ... 128
+elv_macro       = False                     # True: the cycle of BME280 and LM75 on the ELV dongle runs as a single macro
+lnx_bus         = 1                         # N of /dev/i2c-N, the native I2C adapter used as LNXdongle
+traceEcho       = False                     # True: print every transfer as it happens, as before the trace
+traceShow       = 40                        # no of transfers printed from the trace with key 't'
+traceFile       = None                      # CSV file the whole trace is written to with key 't', None: not written
+recordDirectory = None                      # directory where the transactions of each dongle are recorded to,
+                                            # for replay with a REPdongle; None: no recording
+
+# repeating failed transactions (NoACK, error bit, wrong report ID, no answer), see dongles/Retry.py
+retry_attempts  = 4                         # max no of attempts, including the 1st
+retry_deadline  = 500                       # ms after the 1st attempt, after which no further one is started; None: no limit
+retry_backoff   = 1                         # ms to wait before the 2nd attempt, doubled before each further one ...
+retry_maxbackoff= 100                       # ... up to this no of ms
+retry_jitter    = 0.5                       # the waits vary randomly by +/- 50 %
+retry_sensors   = {}                        # other settings for single sensors, by their name, e.g.
+                                            # {"SHT7x": {"attempts": 2, "deadline": None}}
 # ELV USB-I2C Dongle
 # IO-Warrior24 Dongle (IOW-DG)
 # USB-ISS Dongle Devantech
+# Native I2C adapter of Linux (LNXdongle), via /dev/i2c-N
+# Simulated Dongle (SIMdongle), all sensors emulated in memory
+# Replay Dongle (REPdongle), the answers of a recorded dongle
 
 # Sensors and Modules
 
@@ -47,6 +72,10 @@ BME280              = {
                        "feat": "Temperature, Pressure, Humidity",
                        "addr": 0x77,        # (d119)  addr: 0x76, 0x77
                        "type": 0x60,        # (d96)   BME280 has chip_ID 0x60
+                       "mode": "forced",    # "forced": one measurement per read, "normal": continuous, the latest is read
+                       "osrs": (16, 16, 16),# oversampling of T, P, H: 0 (skipped), 1, 2, 4, 8, 16
+                       "t_sb": 1000,        # ms standby between measurements in normal mode: 0.5, 10, 20, 62.5, 125, 250, 500, 1000
+                       "filter": 0,         # IIR filter coefficient: 0 (off), 2, 4, 8, 16
                        "hndl": None,        # handle
                        "dngl": None,        # connected with dongle
                       }
@@ -92,6 +121,8 @@ SCD40             = {
                        "feat": "CO2, Temperature, Humidity",
                        "addr": 0x62,        # found in the docs
                        "type": "SCD40",     # less precise, no single shot
+                       "frc_ppm": None,     # reference CO2 level in ppm for a forced recalibration at start, None: none
+                       "low_power": False,  # True: low power periodic measurement, every 30 sec instead of 5 sec
                        "hndl": None,        # handle
                        "dngl": None,        # connected with dongle
                       }
@@ -101,6 +132,8 @@ SCD41             = {
                        "feat": "CO2, Temperature, Humidity",
                        "addr": 0x62,        # found in the docs
                        "type": "SCD41",     # More precise, single-shot possible
+                       "frc_ppm": None,     # reference CO2 level in ppm for a forced recalibration at start, None: none
+                       "low_power": False,  # True: low power periodic measurement, every 30 sec instead of 5 sec
                        "hndl": None,        # handle
                        "dngl": None,        # connected with dongle
                       }
@@ -37,10 +37,11 @@ CTRL-\ for plotting current logfile
        N (>0) : show the plot and update every N seconds
 
 When running on Linux, i2cusbdongles also responds to single keypresses:
-i   : prints info on logfile, dongles, modules, sensors
+i   : prints info on logfile, dongles, modules, sensors, latencies and bus utilisation
 m   : take a measurement now
 p   : plots the last N records, if the -l N option was given on command line
 P   : plots all records
+t   : prints the last transfers of the dongles (the trace)
 v   : prints version numbers of i2cusbdongles and Python
 q   : quits i2cusbdongles
 
@@ -71,12 +72,17 @@ else:
 from i2cusbdongles import glob
 from i2cusbdongles import  util
 from i2cusbdongles.dongles.Dongle import Dongle
+from i2cusbdongles.dongles.Retry import RetryPolicy
 from i2cusbdongles.dongles import ELV
 try:
     from i2cusbdongles.dongles import IOW
 except ImportError:
     IOW = None
 from i2cusbdongles.dongles import ISS
+from i2cusbdongles.dongles import SIM
+from i2cusbdongles.dongles import LNX
+from i2cusbdongles.dongles import Replay
+from i2cusbdongles import discovery
 #import pytoolsPlot              as plot
 
 from i2cusbdongles.sensors.SHT7x    import *
@@ -106,6 +112,13 @@ def main(datafile, configfile = glob.CONFIGFILE):
         signal.signal(signal.SIGUSR1, util.signal_handler)   # to handle user signal1
         signal.signal(signal.SIGUSR2, util.signal_handler)   # to handle user signal2
 
+    Dongle.trace.echo = glob.traceEcho
+
+    retry = dict(attempts=glob.retry_attempts, deadline=glob.retry_deadline, backoff=glob.retry_backoff,
+                 maxbackoff=glob.retry_maxbackoff, jitter=glob.retry_jitter)
+    Dongle.retryPolicy   = RetryPolicy(**retry)
+    Dongle.retryPolicies = {name: RetryPolicy(**dict(retry, **policy)) for name, policy in glob.retry_sensors.items()}
+
 
 ###############################################################################
 # BEGIN user activation BEGIN user activation BEGIN user activation BEGIN
@@ -114,6 +127,25 @@ def main(datafile, configfile = glob.CONFIGFILE):
 #%% activate any or all dongles and connected sensors
     if 0:
         glob.dongles['dummy'] = Dongle()
+
+    if 0:   # instead of the blocks below: all dongles and sensors found
+        print("\ndiscovering dongles and sensors @@@@@@@@@@@@@@@@@@@@@@@@@@@")
+        discovery.discover()
+
+    if 0:
+        print("\nactivating simulated dongle @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@")
+        glob.dongles['SIMdongle'] = SIM.SIMdongle(latency=0) # latency in ms per USB round trip
+        glob.dongles['SIMdongle'].SIMshowInfo() # show the emulated devices
+
+        # activate the sensors connected to SIM
+        if 00: glob.SHT75       ["dngl"]     = glob.dongles['SIMdongle']
+        if 00: glob.SHT71       ["dngl"]     = glob.dongles['SIMdongle']
+        if 00: glob.SCD40       ["dngl"]     = glob.dongles['SIMdongle']
+        if 00: glob.SCD41       ["dngl"]     = glob.dongles['SIMdongle']
+        if 00: glob.LM75        ["dngl"]     = glob.dongles['SIMdongle']
+        if 00: glob.BME280      ["dngl"]     = glob.dongles['SIMdongle']
+        if 00: glob.TSL2591     ["dngl"]     = glob.dongles['SIMdongle']
+        if 00: glob.HT16K33     ["dngl"]     = glob.dongles['SIMdongle']
     
     if 0:
         print("\nactivating ELV USB-I2C dongle @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@")
@@ -121,6 +153,7 @@ def main(datafile, configfile = glob.CONFIGFILE):
         # glob.dongles['ELVdongle'].ELVreset()        # do a dongle software reset (takes 2 sec)
         # glob.dongles['ELVdongle'].ELVshowInfo()     # show dongle info available with '?'
         # glob.dongles['ELVdongle'].ELVshowMacro()    # show dongle content of the macro memory
+        # glob.dongles['ELVdongle'].scanBus()         # show the addresses on the bus
 
         # activate the sensors connected to ELV
         if 00: glob.SHT75       ["dngl"]     = glob.dongles['ELVdongle']
@@ -135,7 +168,7 @@ def main(datafile, configfile = glob.CONFIGFILE):
     if 10:
         print("\nactivating IOW-DG dongle @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@")       
         
-        glob.dongles['IOW-DG'] = IOW.IOWdongle(disable_pullups=glob.disable_pullups)
+        glob.dongles['IOW-DG'] = IOW.IOWdongle(disable_pullups=glob.disable_pullups, i2ctimeout=glob.iow_i2ctimeout)
         
         # activate the sensors connected to IOW
         if 00: glob.SHT75        ["dngl"]     = glob.dongles['IOW-DG']
@@ -148,17 +181,21 @@ def main(datafile, configfile = glob.CONFIGFILE):
         if 00: glob.HT16K33      ["dngl"]     = glob.dongles['IOW-DG']
         
         if glob.SHT75["dngl"] or glob.SHT71["dngl"]:
-            glob.dongles['IOW-DG'] = IOW.IOWdongle(disable_pullups=glob.disable_pullups,sensibus=True)
+            glob.dongles['IOW-DG'] = IOW.IOWdongle(disable_pullups=glob.disable_pullups,sensibus=True, i2ctimeout=glob.iow_i2ctimeout)
         else:
-            glob.dongles['IOW-DG'] = IOW.IOWdongle(disable_pullups=glob.disable_pullups)
+            glob.dongles['IOW-DG'] = IOW.IOWdongle(disable_pullups=glob.disable_pullups, i2ctimeout=glob.iow_i2ctimeout)
 
         glob.dongles['IOW-DG'].IOWshowInfo() # show IDs on hard- and software, versions, etc
+        # glob.dongles['IOW-DG'].scanBus()   # show the addresses on the bus
+        # with several IO-Warriors: IOW.IOWdongle(serial="...") selects one by its serial
+        # number, IOW.IOWopenAll() opens all and IOW.IOWpollAll() polls them concurrently
 
 
     if 0:
         print("\nactivating USB-ISS dongle @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@")
-        glob.dongles['ISSdongle'] = ISS.ISSdongle()
+        glob.dongles['ISSdongle'] = ISS.ISSdongle(busclock=glob.iss_busclock, hardware=glob.iss_hardware)
         glob.dongles['ISSdongle'].ISSshowInfo() # show IDs on hard- and software, versions, etc
+        # glob.dongles['ISSdongle'].scanBus()   # show the addresses on the bus
 
         # activate the sensors connected to ISS
         if 00: glob.SHT75       ["dngl"]     = glob.dongles['ISSdongle']
@@ -170,10 +207,42 @@ def main(datafile, configfile = glob.CONFIGFILE):
         if 00: glob.TSL2591     ["dngl"]     = glob.dongles['ISSdongle']
         if 00: glob.HT16K33     ["dngl"]     = glob.dongles['ISSdongle']
 
+    if 0:
+        print("\nactivating Linux I2C adapter @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@")
+        glob.dongles['LNXdongle'] = LNX.LNXdongle(bus=glob.lnx_bus)
+        # glob.dongles['LNXdongle'].scanBus()   # show the addresses on the bus
+
+        # activate the sensors connected to LNX
+        if 00: glob.SCD40       ["dngl"]     = glob.dongles['LNXdongle']
+        if 00: glob.SCD41       ["dngl"]     = glob.dongles['LNXdongle']
+        if 00: glob.LM75        ["dngl"]     = glob.dongles['LNXdongle']
+        if 00: glob.BME280      ["dngl"]     = glob.dongles['LNXdongle']
+        if 00: glob.TSL2591     ["dngl"]     = glob.dongles['LNXdongle']
+        if 00: glob.HT16K33     ["dngl"]     = glob.dongles['LNXdongle']
+
+    if 0:
+        print("\nactivating replay dongle @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@")
+        # a recording made with glob.recordDirectory; speed 1: original timing, 0: no waiting
+        glob.dongles['REPdongle'] = Replay.REPdongle(os.path.join(glob.dataDirectory, "IOW-DG.rec"), speed=1)
+        glob.dongles['REPdongle'].REPshowInfo()
+
+        # activate the sensors as they were connected in the recording
+        if 00: glob.SHT75       ["dngl"]     = glob.dongles['REPdongle']
+        if 00: glob.SHT71       ["dngl"]     = glob.dongles['REPdongle']
+        if 00: glob.SCD40       ["dngl"]     = glob.dongles['REPdongle']
+        if 00: glob.SCD41       ["dngl"]     = glob.dongles['REPdongle']
+        if 00: glob.LM75        ["dngl"]     = glob.dongles['REPdongle']
+        if 00: glob.BME280      ["dngl"]     = glob.dongles['REPdongle']
+        if 00: glob.TSL2591     ["dngl"]     = glob.dongles['REPdongle']
+        if 00: glob.HT16K33     ["dngl"]     = glob.dongles['REPdongle']
+
 ###############################################################################
 # END user activation END user activation END user activation END
 ###############################################################################
 
+    if glob.recordDirectory is not None:
+        Replay.RECwrapAll(glob.recordDirectory)
+
 
 #%% execute activation of the sensors on the respective dongles
     tmplt = "\nactivating {} on {} +++++++++++++++++++++++++++++++++++++++++++"
@@ -182,13 +251,15 @@ def main(datafile, configfile = glob.CONFIGFILE):
         print(tmplt.format(glob.SCD41["name"], glob.SCD41["dngl"]))
         glob.SCD41['hndl'] = SensorSCD4x(glob.SCD41)
         glob.SCD41['hndl'].SCD4xInit()
-        glob.SCD41['hndl'].SCD4xPerformForcedRecalibration()
+        if glob.SCD41["frc_ppm"] is not None:
+            glob.SCD41['hndl'].SCD4xStartForcedRecalibration(glob.SCD41["frc_ppm"])
 
     if glob.SCD40["dngl"] != None:
         print(tmplt.format(glob.SCD40["name"], glob.SCD40["dngl"]))
         glob.SCD40['hndl'] = SensorSCD4x(glob.SCD40)
         glob.SCD40['hndl'].SCD4xInit()
-        glob.SCD40['hndl'].SCD4xPerformForcedRecalibration()
+        if glob.SCD40["frc_ppm"] is not None:
+            glob.SCD40['hndl'].SCD4xStartForcedRecalibration(glob.SCD40["frc_ppm"])
 
     if glob.SHT75["dngl"] != None:
         print(tmplt.format(glob.SHT75["name"], glob.SHT75["dngl"]))
@@ -223,6 +294,18 @@ def main(datafile, configfile = glob.CONFIGFILE):
 
     print("\nactivations completed ++++++++++++++++++++++++++++++++++++++++++")
 
+#%% optionally run the cycle of BME280 and LM75 on the ELV as a single macro
+    elv_macro = []                      # (sensor, no of transactions)
+    # (not when recording, the RECdongle records askDongleBatch only)
+    if glob.elv_macro and hasattr(glob.dongles['ELVdongle'], "ELVuploadMacro"):
+        transactions = []
+        for sensor, cycle in ((glob.BME280, "BME280cycle"), (glob.LM75, "LM75cycle")):
+            if sensor["hndl"] is not None and sensor["dngl"] is glob.dongles['ELVdongle']:
+                elv_macro    += [(sensor, len(getattr(sensor['hndl'], cycle)()))]
+                transactions += getattr(sensor['hndl'], cycle)()
+        if not transactions or not glob.dongles['ELVdongle'].ELVuploadMacro(transactions):
+            elv_macro = []
+
 
 #%% prepare array for averaging
     avg_count       = 1        # average over up to 10 cycles
@@ -251,9 +334,36 @@ def main(datafile, configfile = glob.CONFIGFILE):
         print("\nNew Cycle", "_"*100)
         print("DGL Sensor  XX  time      reqB   w/r_chr      info             rec")
 
+        # run the ELV macro on the worker of the dongle, and split its answers to the sensors
+        macro_answers = {}
+        if elv_macro:
+            try:
+                answers = glob.dongles['ELVdongle'].submit(glob.dongles['ELVdongle'].ELVrunMacro).result()
+                for sensor, n in elv_macro:
+                    macro_answers[sensor["name"]] = answers[:n]
+                    answers = answers[n:]
+            except Exception as e:
+                util.exceptPrint(e, sys.exc_info(), "ERROR running the ELV macro")
+
+        # queue the reads on the worker of each dongle: sensors on different
+        # dongles are read at the same time, those on one dongle in turn
+        reads = {}
+        for key, sensor, func in (("BME280",  glob.BME280,  "BME280getTPH"),
+                                  ("SCD41",   glob.SCD41,   "SCD4xgetAllIfReady"),
+                                  ("SCD40",   glob.SCD40,   "SCD4xgetAllIfReady"),
+                                  ("SHT75",   glob.SHT75,   "SHT7xgetAll"),
+                                  ("SHT71",   glob.SHT71,   "SHT7xgetAll"),
+                                  ("LM75",    glob.LM75,    "LM75getTemp"),
+                                  ("TSL2591", glob.TSL2591, "TSL2591getLumAuto")):
+            if sensor["hndl"] is not None and key not in macro_answers:
+                reads[key] = sensor["dngl"].submit(getattr(sensor["hndl"], func))
+
         # BME280 data T, P, H
         try:
-            t, p, h, temp_semi, press_semi, hum_semi = glob.BME280['hndl'].BME280getTPH()
+            if "BME280" in macro_answers:
+                t, p, h, temp_semi, press_semi, hum_semi = glob.BME280['hndl'].BME280parseTPH(macro_answers["BME280"])
+            else:
+                t, p, h, temp_semi, press_semi, hum_semi = reads["BME280"].result()
             print()
             #a= 1/0
         except Exception as e:
@@ -263,10 +373,7 @@ def main(datafile, configfile = glob.CONFIGFILE):
 
         # SCD41 data CO2, Temp, RH
         try:
-            if glob.SCD41['hndl'].SCD4xready:
-                CO2_SCD41, T_SCD41, RH_SCD41 = glob.SCD41['hndl'].SCD4xgetAll()
-            else:
-                CO2_SCD41, T_SCD41, RH_SCD41 = [glob.missing_value]*3
+            CO2_SCD41, T_SCD41, RH_SCD41 = reads["SCD41"].result()
             print()
             #a = 1/0
         except Exception as e:
@@ -276,10 +383,7 @@ def main(datafile, configfile = glob.CONFIGFILE):
 
         # SCD40 data CO2, Temp, RH
         try:
-            if glob.SCD40['hndl'].SCD4xready:
-                CO2_SCD40, T_SCD40, RH_SCD40 = glob.SCD40['hndl'].SCD4xgetAll()
-            else:
-                CO2_SCD40, T_SCD40, RH_SCD40 = [glob.missing_value]*3
+            CO2_SCD40, T_SCD40, RH_SCD40 = reads["SCD40"].result()
             print()
             #a = 1/0
         except Exception as e:
@@ -289,7 +393,7 @@ def main(datafile, configfile = glob.CONFIGFILE):
 
         # SHT75 data Temp, RH
         try:
-            T_SHT75, RH_SHT75 = glob.SHT75['hndl'].SHT7xgetAll()
+            T_SHT75, RH_SHT75 = reads["SHT75"].result()
             print()
             #a = 1/0
         except Exception as e:
@@ -299,7 +403,7 @@ def main(datafile, configfile = glob.CONFIGFILE):
 
         # SHT71 data Temp, RH
         try:
-            T_SHT71, RH_SHT71 = glob.SHT71['hndl'].SHT7xgetAll()
+            T_SHT71, RH_SHT71 = reads["SHT71"].result()
             print()
             #a = 1/0
         except Exception as e:
@@ -309,7 +413,10 @@ def main(datafile, configfile = glob.CONFIGFILE):
 
         # LM75B data Temp
         try:
-            T_LM75B = glob.LM75['hndl'].LM75getTemp()
+            if "LM75" in macro_answers:
+                T_LM75B = glob.LM75['hndl'].LM75parseTemp(macro_answers["LM75"])
+            else:
+                T_LM75B = reads["LM75"].result()
             print()
             #a = 1/0
         except Exception as e:
@@ -319,7 +426,7 @@ def main(datafile, configfile = glob.CONFIGFILE):
 
         # TSL2591 data Luminescence Vis, IR
         try:
-            b = glob.TSL2591['hndl'].TSL2591getLumAuto()
+            b = reads["TSL2591"].result()
             b1 = b[1]           # IR
             b1 = b[0] / b1      # ratio Vis / IR
             #print(b)
@@ -428,8 +535,19 @@ def main(datafile, configfile = glob.CONFIGFILE):
             pass
 
         #%% wait cycletime while checking for key presses
+        polls     = {}                  # Future of SCD4xpoll by sensor name
         while True:
-            print("\rNext cycle in {:1.0f} sec". format((timelast_cycle  + glob.cycletime) - time.time() ), end="")
+            # the cycle is moved a little to a SCD4x measurement expected close
+            # to it: not missed when just after, read at once when just before;
+            # again on each loop, as a late measurement sets a new next_ready
+            nextcycle = timelast_cycle + glob.cycletime
+            for sensor in (glob.SCD41, glob.SCD40):
+                if sensor["hndl"] is None or sensor["hndl"].next_ready is None: continue
+                if abs(sensor["hndl"].next_ready - nextcycle) < glob.cycletime / 5:
+                    nextcycle = sensor["hndl"].next_ready
+                    break
+
+            print("\rNext cycle in {:1.0f} sec". format(nextcycle - time.time() ), end="")
             #sys.stdout.flush() # not needed
 
             if not 'win32' in sys.platform:   # curses does not work on Windows
@@ -450,6 +568,14 @@ def main(datafile, configfile = glob.CONFIGFILE):
                     util.plotGraph(glob.logfilename)
                     glob.plotLastValues = orig
 
+                if "T" in ret.upper():
+                    util.bell()
+                    Dongle.trace.show(glob.traceShow)
+                    if glob.traceFile is not None:
+                        Dongle.trace.export(glob.traceFile)
+                        util.ncprint("Trace written to: {}".format(glob.traceFile))
+                    print()
+
                 if "V" in ret.upper():
                     util.bell()
                     util.ncprint("Version status:")
@@ -489,12 +615,24 @@ def main(datafile, configfile = glob.CONFIGFILE):
 
                     util.ncprint("   {:25s} : {}".  format("Last records to plot", glob.plotLastValues))
                     print()
-                    for dongle_name, dongle in glob.dongles:
+                    for dongle_name, dongle in glob.dongles.items():
                         util.infoPrint(dongle, dongle_name)
+                    Dongle.stats.show()
                     print()
 
-            time.sleep(0.2)
-            if time.time() - timelast_cycle > glob.cycletime: #Cycle time is elapsed
+            # a late SCD4x measurement is asked for again on the worker of
+            # its dongle, every guard sec, and read with the next cycle
+            wakeup = nextcycle
+            for sensor in (glob.SCD41, glob.SCD40):
+                hndl = sensor["hndl"]
+                if hndl is None or hndl.missed is None or hndl.next_ready is None: continue
+                poll = polls.get(sensor["name"])
+                if time.time() >= hndl.next_ready and (poll is None or poll.done()):
+                    polls[sensor["name"]] = sensor["dngl"].submit(hndl.SCD4xpoll)
+                wakeup = min(wakeup, hndl.next_ready if hndl.next_ready > time.time() else time.time() + hndl.guard)
+
+            time.sleep(max(0, min(0.2, wakeup - time.time())))
+            if time.time() >= nextcycle: #Cycle time is elapsed
                 timelast_cycle = time.time()
                 break
 
@@ -5,7 +5,8 @@
 I2C module BME280
 """
 
-import time, sys
+import os, time, sys, math, json
+import asyncio
 from i2cusbdongles import glob
 from i2cusbdongles import util
 
@@ -127,6 +128,25 @@ class SensorBME280:
         self.addr    = BME280["addr"]    # 0x76, 0x77
         self.subtype = BME280["type"]    # chip_ID: 0x60
         self.name    = BME280["name"]    # BME280
+        self.comp    = None              # BME280Compensation, from the calibration read by BME280Init
+
+        # acquisition settings, see glob.BME280; register values of datasheet 5.4
+        osrs    = {0: 0b000, 1: 0b001, 2: 0b010, 4: 0b011, 8: 0b100, 16: 0b101}
+        t_sb    = {0.5: 0b000, 62.5: 0b001, 125: 0b010, 250: 0b011, 500: 0b100, 1000: 0b101, 10: 0b110, 20: 0b111}
+        iir     = {0: 0b000, 2: 0b001, 4: 0b010, 8: 0b011, 16: 0b100}
+        try:
+            osr_t, osr_p, osr_h = BME280.get("osrs", (16, 16, 16))
+            self.mode       = BME280.get("mode", "forced")
+            self.ctrl_hum   = osrs[osr_h]
+            self.ctrl_meas  = osrs[osr_t] << 5 | osrs[osr_p] << 2 | {"forced": 0b01, "normal": 0b11}[self.mode]
+            self.config     = t_sb[BME280.get("t_sb", 1000)] << 5 | iir[BME280.get("filter", 0)] << 2
+        except (KeyError, ValueError, TypeError):
+            util.fecprint("Invalid mode, osrs, t_sb or filter of Sensor BME280 - Exiting")
+            sys.exit()
+
+        # measurement time in ms, datasheet 9.1
+        self.typTime = 1    + 2   * osr_t + (2   * osr_p + 0.5   if osr_p else 0) + (2   * osr_h + 0.5   if osr_h else 0)
+        self.maxTime = 1.25 + 2.3 * osr_t + (2.3 * osr_p + 0.575 if osr_p else 0) + (2.3 * osr_h + 0.575 if osr_h else 0)
 
 
     def BME280Init(self):
@@ -147,55 +167,181 @@ class SensorBME280:
             util.fecprint("Did NOT find Sensor BME280 - Exiting")
             sys.exit()
 
-        # set ctrl-hum
-        # 101 = 5 = oversampling * 16
-        data    = [0xf2, 0x05]
-        rbytes  = 1
-        answ    = self.dongle.askDongle(self.addr, data, rbytes, name=self.name, info="ctrl_hum")
+        # all in a single batch:
+        # set ctrl-hum, e.g. 101 = 5 = oversampling * 16
+        # set config: standby time and IIR filter (written in sleep mode only, as after the reset)
+        transactions = [(self.addr, [0xf2, self.ctrl_hum], 1,  0),
+                        (self.addr, [0xf5, self.config],   1,  0),
+                       ]
+
+        # the calibration of this sensor from the cache, if the temperature
+        # coefficients read back (calib00...calib05) are the same
+        key    = "{} {} 0x{:02X}".format(self.name, self.dongle.ident(), self.addr)
+        cached = self.BME280loadCalibration(key)
+        if cached is not None:
+            answ, answ, check = self.dongle.askDongleBatch(transactions + [(self.addr, [0x88], 6, 0)], name=self.name, info="ctrl_hum, config, check cal")
+            if check is not None and list(check) == cached[0][:6]:
+                self.cal1, self.cal2, self.cal3 = cached
+                util.fncprint("Calibration of Sensor BME280 from cache")
+            else:
+                cached = None
+            transactions = []
 
         # Calibration Data calib00...calib25 (0x88 ... 0x9F) 24 values
-        data    = [0x88]
-        rbytes  = 24
-        self.cal1    = self.dongle.askDongle(self.addr, data, rbytes, name=self.name, info="get cal1")
-
         # Calibration Data calib26...calib41 (0xA1 ) 1 value
-        data    = [0xA1]
-        rbytes  = 1
-        self.cal2    = self.dongle.askDongle(self.addr, data, rbytes, name=self.name, info="get cal2")
-
         # Calibration Data calib26...calib41 (0xe1 ... 0xe7) 7 values
-        data    = [0xe1]
-        rbytes  = 7
-        self.cal3    = self.dongle.askDongle(self.addr, data, rbytes, name=self.name, info="get cal3")
+        if cached is None:
+            transactions += [(self.addr, [0x88],                24, 0),
+                             (self.addr, [0xA1],                1,  0),
+                             (self.addr, [0xe1],                7,  0),
+                            ]
+            answers = self.dongle.askDongleBatch(transactions, name=self.name, info="ctrl_hum, config, get cal")
+            self.cal1, self.cal2, self.cal3 = answers[-3:]
+            if None in answers[-3:]: raise OSError("BME280: calibration not read from {}".format(self.dongle.ident()))
+            self.BME280saveCalibration(key)
+        self.comp = BME280Compensation(self.cal1, self.cal2, self.cal3)
+
+        # normal mode: start the continuous measurements, the 1st one is
+        # complete after the measurement time
+        if self.mode == "normal":
+            answ = self.dongle.askDongle(self.addr, [0xf4, self.ctrl_meas], 1, name=self.name, info="ctrl_meas normal")
+            time.sleep(self.maxTime / 1000)
 
         # make one measurement to discard (on ISS dongle sometimes measuremnt was wrong)
         self.BME280getTPH()
 
 
-    def BME280getTPH(self):
-        """ get one measurement of T, P, H """
+    def BME280loadCalibration(self, key):
+        """ cal1, cal2, cal3 of key from the calibration cache as lists of
+        int, None if not in the cache """
+
+        if glob.calibrationCache is None: return None
+
+        try:
+            with open(os.path.join(util.getDataPath(), glob.calibrationCache), "rt") as f:
+                cal = json.load(f)[key]
+            cals = [list(bytes.fromhex(cal[c])) for c in ("cal1", "cal2", "cal3")]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+        return cals if [len(c) for c in cals] == [24, 1, 7] else None
+
 
-        # trigger measurement with: ctrl_meas
+    def BME280saveCalibration(self, key):
+        """ puts cal1, cal2, cal3 into the calibration cache under key; the
+        file is replaced as a whole, so that a crash cannot leave it broken """
+
+        if glob.calibrationCache is None: return
+        if None in (self.cal1, self.cal2, self.cal3): return
+
+        path  = os.path.join(util.getDataPath(), glob.calibrationCache)
+        try:
+            with open(path, "rt") as f: cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        cache[key] = {c: bytes(cal).hex(" ").upper() for c, cal in (("cal1", self.cal1), ("cal2", self.cal2), ("cal3", self.cal3))}
+
+        try:
+            with open(path + ".tmp", "wt") as f: json.dump(cache, f, indent=1)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            util.ecprint("Calibration cache {} not written: {}".format(path, e))
+
+
+    def BME280cycle(self):
+        """ transactions for one measurement of T, P, H (for askDongleBatch
+        or ELV macros) """
+
+        # normal mode: the sensor measures continuously, the latest
+        # measurement is read in one burst of all 8 bytes from F7 onwards
+        if self.mode == "normal":
+            return [(self.addr, [0xf7], 8, 0)]
+
+        # forced mode: trigger measurement with: ctrl_meas
         # makes one measurement, then waits for next trigger due to forced mode
-        # 0b 101 101 10  = D6 = P oversampling * 16, T oversampling * 16,  forced mode
-        data    = [0xf4, 0xd6]
-        rbytes  = 1
-        answ    = self.dongle.askDongle(self.addr, data, rbytes, name=self.name, info="ctrl_meas")
-        #time.sleep(0.05) # appears to be insufficient, occasional faulty result, though it should be plenty:
-        #                   BOSCH: t measure,max = 1.25 + [2.3 ⋅ 1] + [2.3 ⋅ 4 + 0.575] + [0] = 13.325 ms
-        time.sleep(0.1)
+        # e.g. 0b 101 101 01  = B5 = T oversampling * 16, P oversampling * 16,  forced mode
+        # then waits before reading all 8 bytes from F7 onwards; both in a single
+        # ELV macro, which cannot poll the status, so it waits the max time, with all at * 16:
+        #                   BOSCH: t measure,max = 1.25 + [2.3 ⋅ 16] + [2.3 ⋅ 16 + 0.575] + [2.3 ⋅ 16 + 0.575] = 112.8 ms
+        # (the 50 and 100 ms waited before were too short, hence the occasional faulty results)
+        return [(self.addr, [0xf4, self.ctrl_meas], 1, 0),
+                (self.addr, [0xf7],                 8, math.ceil(self.maxTime)),
+               ]
 
-        data    = [0xf7]
-        rbytes  = 8
-        answ    = self.dongle.askDongle(self.addr, data, rbytes, name=self.name, info="Get data F7...FE", end="")
 
+    def BME280getTPH(self):
+        """ get one measurement of T, P, H; in forced mode the status is
+        polled instead of waiting the max time """
+
+        if self.mode == "normal":
+            answers = self.dongle.askDongleBatch(self.BME280cycle(), name=self.name, info="F7...FE", end="")
+            return self.BME280parseTPH(answers)
+
+        trigger  = self.BME280cycle()[0]
+        answers  = self.dongle.askDongleBatch([trigger], name=self.name, info="ctrl_meas", end="")
+        deadline = time.monotonic() + 2 * self.maxTime / 1000
+        answ     = self.BME280pollStatus(self.typTime)
+        while self.BME280measuring(answ) and time.monotonic() < deadline:
+            answ = self.BME280pollStatus(5)
+
+        return self.BME280parseTPH(answers + [self.BME280pollResult(answ)])
+
+
+    async def BME280getTPHAsync(self):
+        """ BME280getTPH for an asyncio event loop; the conversion time
+        between trigger and read is an asyncio.sleep """
+
+        if self.mode == "normal":
+            answers = await self.dongle.askDongleBatchAsync(self.BME280cycle(), name=self.name, info="F7...FE", end="")
+            return self.BME280parseTPH(answers)
+
+        trigger  = self.BME280cycle()[0]
+        answers  = await self.dongle.askDongleBatchAsync([trigger], name=self.name, info="ctrl_meas", end="")
+        deadline = time.monotonic() + 2 * self.maxTime / 1000
+        wait     = self.typTime
+        while True:
+            await asyncio.sleep(wait / 1000)
+            answ = await self.dongle.askDongleAsync(self.addr, [0xf3], 12, name=self.name, info="status, F7...FE", end="")
+            if not self.BME280measuring(answ) or time.monotonic() >= deadline: break
+            wait = 5
+
+        return self.BME280parseTPH(answers + [self.BME280pollResult(answ)])
+
+
+    def BME280pollStatus(self, wait_time):
+        """ reads status and data in one burst of 12 bytes from F3 onwards,
+        after wait_time ms """
+
+        return self.dongle.askDongle(self.addr, [0xf3], 12, wait_time=wait_time, name=self.name, info="status, F7...FE", end="")
+
+
+    def BME280measuring(self, answ):
+        """ True while bit 3 "measuring" of the status is set """
+
+        return answ is not None and answ[0] & 0x08
+
+
+    def BME280pollResult(self, answ):
+        """ the 8 bytes of F7...FE from the answer of BME280pollStatus """
+
+        if answ is None: return None
+        if self.BME280measuring(answ):
+            util.fecprint("BME280: measurement not complete after {:.0f} ms".format(2 * self.maxTime))
+
+        return answ[4:]
+
+
+    def BME280parseTPH(self, answers):
+        """ T, P, H from the answers to BME280cycle """
+
+        answ    = answers[-1]
         press_raw, temp_raw, hum_raw = self.__BME280getRawData(answ)
 
         press_semi = press_raw / 1000 * 3  # this gives roughly correct values
         temp_semi  = temp_raw  / 10000 / 2 # although not useful enough due
         hum_semi   = hum_raw   / 1000      # mainly to interaction between signals
 
-        t, p, h = readBME280All(self.cal1, self.cal2, self.cal3, press_raw, temp_raw, hum_raw)
+        t, p, h = self.comp.compensate(press_raw, temp_raw, hum_raw)
         util.ncprint("  Result: T: {:6.2f}, P: {:6.2f}, H: {:6.2f}".format(t, p, h), color=glob.TDEFAULT)
 
         return t, p, h, temp_semi, press_semi, hum_semi
@@ -351,67 +497,139 @@ def getUChar(data,index):
     return result
 
 def readBME280All(cal1, cal2, cal3, pres_raw, temp_raw, hum_raw):
+    """ T, P, H from the raw values; decodes the calibration on each call,
+    for repeated use see BME280Compensation """
+
+    return BME280Compensation(cal1, cal2, cal3).compensate(pres_raw, temp_raw, hum_raw)
 
-    # Convert byte data to word values
-    dig_T1 = getUShort(cal1, 0)
-    dig_T2 = getShort (cal1, 2)
-    dig_T3 = getShort (cal1, 4)
-
-    dig_P1 = getUShort(cal1, 6)
-    dig_P2 = getShort (cal1, 8)
-    dig_P3 = getShort (cal1, 10)
-    dig_P4 = getShort (cal1, 12)
-    dig_P5 = getShort (cal1, 14)
-    dig_P6 = getShort (cal1, 16)
-    dig_P7 = getShort (cal1, 18)
-    dig_P8 = getShort (cal1, 20)
-    dig_P9 = getShort (cal1, 22)
-
-    dig_H1 = getUChar (cal2, 0)
-
-    dig_H2 = getShort (cal3, 0)
-
-    dig_H3 = getUChar (cal3, 2)
-
-    dig_H4 = getChar  (cal3, 3)
-    dig_H4 = (dig_H4 << 24) >> 20
-    dig_H4 = dig_H4 | (getChar(cal3, 4) & 0x0F)
-
-    dig_H5 = getChar  (cal3, 5)
-    dig_H5 = (dig_H5 << 24) >> 20
-    dig_H5 = dig_H5 | (getUChar(cal3, 4) >> 4 & 0x0F)
-
-    dig_H6 = getChar  (cal3, 6)
-
-    #Refine temperature
-    var1 = ((((temp_raw>>3)-(dig_T1<<1)))*(dig_T2)) >> 11
-    var2 = (((((temp_raw>>4) - (dig_T1)) * ((temp_raw>>4) - (dig_T1))) >> 12) * (dig_T3)) >> 14
-    t_fine = var1+var2
-    temperature = float(((t_fine * 5) + 128) >> 8);
-
-    # Refine pressure and adjust for temperature
-    var1 = t_fine / 2.0 - 64000.0
-    var2 = var1 * var1 * dig_P6 / 32768.0
-    var2 = var2 + var1 * dig_P5 * 2.0
-    var2 = var2 / 4.0 + dig_P4 * 65536.0
-    var1 = (dig_P3 * var1 * var1 / 524288.0 + dig_P2 * var1) / 524288.0
-    var1 = (1.0 + var1 / 32768.0) * dig_P1
-    if var1 == 0:
-        pressure=0
-    else:
-        pressure = 1048576.0 - pres_raw
-        pressure = ((pressure - var2 / 4096.0) * 6250.0) / var1
-        var1 = dig_P9 * pressure * pressure / 2147483648.0
-        var2 = pressure * dig_P8 / 32768.0
-        pressure = pressure + (var1 + var2 + dig_P7) / 16.0
-
-    # Refine humidity
-    humidity = t_fine - 76800.0
-    humidity = (hum_raw - (dig_H4 * 64.0 + dig_H5 / 16384.0 * humidity)) * (dig_H2 / 65536.0 * (1.0 + dig_H6 / 67108864.0 * humidity * (1.0 + dig_H3 / 67108864.0 * humidity)))
-    humidity = humidity * (1.0 - dig_H1 * humidity / 524288.0)
-    if humidity > 100:
-        humidity = 100
-    elif humidity < 0:
-        humidity = 0
-
-    return temperature/100.0, pressure/100.0, humidity
+
+class BME280Compensation:
+    """The calibration of a BME280, decoded once; compensates the raw values
+    of one measurement, or of whole arrays of them with numpy"""
+
+    def __init__(self, cal1, cal2, cal3):
+        """cal1, cal2, cal3: the calibration data from 0x88, 0xA1, 0xE1"""
+
+        # Convert byte data to word values
+        self.dig_T1 = getUShort(cal1, 0)
+        self.dig_T2 = getShort (cal1, 2)
+        self.dig_T3 = getShort (cal1, 4)
+
+        self.dig_P1 = getUShort(cal1, 6)
+        self.dig_P2 = getShort (cal1, 8)
+        self.dig_P3 = getShort (cal1, 10)
+        self.dig_P4 = getShort (cal1, 12)
+        self.dig_P5 = getShort (cal1, 14)
+        self.dig_P6 = getShort (cal1, 16)
+        self.dig_P7 = getShort (cal1, 18)
+        self.dig_P8 = getShort (cal1, 20)
+        self.dig_P9 = getShort (cal1, 22)
+
+        self.dig_H1 = getUChar (cal2, 0)
+
+        self.dig_H2 = getShort (cal3, 0)
+
+        self.dig_H3 = getUChar (cal3, 2)
+
+        dig_H4      = getChar  (cal3, 3)
+        dig_H4      = (dig_H4 << 24) >> 20
+        self.dig_H4 = dig_H4 | (getChar(cal3, 4) & 0x0F)
+
+        dig_H5      = getChar  (cal3, 5)
+        dig_H5      = (dig_H5 << 24) >> 20
+        self.dig_H5 = dig_H5 | (getUChar(cal3, 4) >> 4 & 0x0F)
+
+        self.dig_H6 = getChar  (cal3, 6)
+
+
+    def compensate(self, pres_raw, temp_raw, hum_raw):
+        """ T [°C], P [hPa], H [%] of one measurement """
+
+        #Refine temperature
+        var1 = ((((temp_raw>>3)-(self.dig_T1<<1)))*(self.dig_T2)) >> 11
+        var2 = (((((temp_raw>>4) - (self.dig_T1)) * ((temp_raw>>4) - (self.dig_T1))) >> 12) * (self.dig_T3)) >> 14
+        t_fine = var1+var2
+        temperature = float(((t_fine * 5) + 128) >> 8)
+
+        # Refine pressure and adjust for temperature
+        var1 = t_fine / 2.0 - 64000.0
+        var2 = var1 * var1 * self.dig_P6 / 32768.0
+        var2 = var2 + var1 * self.dig_P5 * 2.0
+        var2 = var2 / 4.0 + self.dig_P4 * 65536.0
+        var1 = (self.dig_P3 * var1 * var1 / 524288.0 + self.dig_P2 * var1) / 524288.0
+        var1 = (1.0 + var1 / 32768.0) * self.dig_P1
+        if var1 == 0:
+            pressure=0
+        else:
+            pressure = 1048576.0 - pres_raw
+            pressure = ((pressure - var2 / 4096.0) * 6250.0) / var1
+            var1 = self.dig_P9 * pressure * pressure / 2147483648.0
+            var2 = pressure * self.dig_P8 / 32768.0
+            pressure = pressure + (var1 + var2 + self.dig_P7) / 16.0
+
+        # Refine humidity
+        humidity = t_fine - 76800.0
+        humidity = (hum_raw - (self.dig_H4 * 64.0 + self.dig_H5 / 16384.0 * humidity)) * (self.dig_H2 / 65536.0 * (1.0 + self.dig_H6 / 67108864.0 * humidity * (1.0 + self.dig_H3 / 67108864.0 * humidity)))
+        humidity = humidity * (1.0 - self.dig_H1 * humidity / 524288.0)
+        if humidity > 100:
+            humidity = 100
+        elif humidity < 0:
+            humidity = 0
+
+        return temperature/100.0, pressure/100.0, humidity
+
+
+    def compensateArrays(self, pres_raw, temp_raw, hum_raw):
+        """ compensate for arrays of raw values, e.g. a whole recording; the
+        same operations in the same order as compensate, so that the results
+        agree to the bit; returns the numpy arrays T, P, H """
+
+        import numpy as np
+
+        temp_raw = np.asarray(temp_raw, dtype=np.int64)
+        pres_raw = np.asarray(pres_raw, dtype=np.int64)
+        hum_raw  = np.asarray(hum_raw,  dtype=np.int64)
+
+        #Refine temperature
+        var1 = ((((temp_raw>>3)-(self.dig_T1<<1)))*(self.dig_T2)) >> 11
+        var2 = (((((temp_raw>>4) - (self.dig_T1)) * ((temp_raw>>4) - (self.dig_T1))) >> 12) * (self.dig_T3)) >> 14
+        t_fine = var1+var2
+        temperature = (((t_fine * 5) + 128) >> 8).astype(np.float64)
+
+        # Refine pressure and adjust for temperature
+        var1 = t_fine / 2.0 - 64000.0
+        var2 = var1 * var1 * self.dig_P6 / 32768.0
+        var2 = var2 + var1 * self.dig_P5 * 2.0
+        var2 = var2 / 4.0 + self.dig_P4 * 65536.0
+        var1 = (self.dig_P3 * var1 * var1 / 524288.0 + self.dig_P2 * var1) / 524288.0
+        var1 = (1.0 + var1 / 32768.0) * self.dig_P1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pressure = 1048576.0 - pres_raw
+            pressure = ((pressure - var2 / 4096.0) * 6250.0) / var1
+            var1p = self.dig_P9 * pressure * pressure / 2147483648.0
+            var2 = pressure * self.dig_P8 / 32768.0
+            pressure = pressure + (var1p + var2 + self.dig_P7) / 16.0
+        pressure = np.where(var1 == 0, 0.0, pressure)
+
+        # Refine humidity
+        humidity = t_fine - 76800.0
+        humidity = (hum_raw - (self.dig_H4 * 64.0 + self.dig_H5 / 16384.0 * humidity)) * (self.dig_H2 / 65536.0 * (1.0 + self.dig_H6 / 67108864.0 * humidity * (1.0 + self.dig_H3 / 67108864.0 * humidity)))
+        humidity = humidity * (1.0 - self.dig_H1 * humidity / 524288.0)
+        humidity = np.where(humidity > 100, 100.0, np.where(humidity < 0, 0.0, humidity))
+
+        return temperature/100.0, pressure/100.0, humidity
+
+
+    @staticmethod
+    def rawArrays(recs):
+        """ raw press, temp, hum as numpy arrays from the 8 byte answers of
+        register F7...FE, one row per measurement """
+
+        import numpy as np
+
+        rec   = np.asarray(recs, dtype=np.int64).reshape(-1, 8)
+        press = (rec[:, 0] << 16 | rec[:, 1] << 8 | rec[:, 2]) >> 4
+        temp  = (rec[:, 3] << 16 | rec[:, 4] << 8 | rec[:, 5]) >> 4
+        hum   =  rec[:, 6] << 8  | rec[:, 7]
+
+        return press, temp, hum
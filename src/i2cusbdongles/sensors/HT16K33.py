@@ -6,6 +6,7 @@ I2C LED module HT16K33
 """
 
 import time, sys
+import asyncio
 from i2cusbdongles import glob
 from i2cusbdongles import util
 
@@ -97,12 +98,52 @@ class LEDHT16K33:
         for i in range(0,8): self.HT16K33setPixel(i,0)
 
 
+    async def HT16K33InitAsync(self):
+        """HT16K33Init for an asyncio event loop (without the check of the
+        connection); the waits are asyncio.sleep"""
+
+        await self.dongle.askDongleAsync(self.addr, [0x21], 1, name=self.name, info="System Setup")
+        await asyncio.sleep(0.1)
+        await self.dongle.askDongleAsync(self.addr, [0x80 + 0x01 + 0x00], 1, name=self.name, info="Disp ON, Blink OFF")
+        await self.dongle.askDongleAsync(self.addr, [0xA0 + 0x00], 1, name=self.name, info="ROW/INT set 0")
+        for i in range(0, 16):
+            await self.dongle.askDongleAsync(self.addr, [0x00 + i, 255], 1, name=self.name, info="SetPixel all", end="")
+            print()
+        await asyncio.sleep(0.5)
+
+        # light up the bottom LEDs (#0) on all columns
+        for i in range(0,8): await self.HT16K33setPixelAsync(i,0)
+
+
     def HT16K33setPixel(self, x, y, on = True):
         """set pixel x,y to on (OFF not yet working);  x, y from 0...7"""
 
+        pixel = self.__pixelData(x, y, on)
+        if pixel is None: return # outside plottable range
+
+        data, info = pixel
+        rbytes  = 1
+        answ    = self.dongle.askDongle(self.addr, data, rbytes, name=self.name, info=info, end="")
+        print()
+
+
+    async def HT16K33setPixelAsync(self, x, y, on = True):
+        """HT16K33setPixel for an asyncio event loop"""
+
+        pixel = self.__pixelData(x, y, on)
+        if pixel is None: return
+
+        data, info = pixel
+        await self.dongle.askDongleAsync(self.addr, data, 1, name=self.name, info=info, end="")
+        print()
+
+
+    def __pixelData(self, x, y, on):
+        """data and info to set pixel x,y; None outside the plottable range"""
+
         if y < 0 or y > 7 or x < 0 or x > 7:
             #print("setPixel outside range:", x, y)
-            return # outside plottable range
+            return None
         else:
             pass
             #print("x,y:",x,y)
@@ -115,27 +156,37 @@ class LEDHT16K33:
         if not on:
             iy = iy ^ 0xff # fails, need to know the other pics
 
-        data    = [0x00 + ix, iy]
-        rbytes  = 1
         stron   = "ON" if on else "OFF"
-        info    = "SetPix {}, {:1.0f} ({})".format(x, y, stron)
-        answ    = self.dongle.askDongle(self.addr, data, rbytes, name=self.name, info=info, end="")
-        print()
+
+        return [0x00 + ix, iy], "SetPix {}, {:1.0f} ({})".format(x, y, stron)
 
 
     def HT16K33setCol(self, x, y):
         """set pixel x,y to on (OFF not yet working);  x, y from 0...7"""
 
+        data, info = self.__colData(x, y)
+        rbytes  = 1
+        answ    = self.dongle.askDongle(self.addr, data, rbytes, name=self.name, info=info, end="")
+        print()
+
+
+    async def HT16K33setColAsync(self, x, y):
+        """HT16K33setCol for an asyncio event loop"""
+
+        data, info = self.__colData(x, y)
+        await self.dongle.askDongleAsync(self.addr, data, 1, name=self.name, info=info, end="")
+        print()
+
+
+    def __colData(self, x, y):
+        """data and info to light column x up to y"""
+
         ix      = round(x*2)
         iy      = 0x80
         for i in range(0, util.clamp(y, 0, 7)):
             iy += 2**i
 
-        data    = [0x00 + ix, iy]
-        rbytes  = 1
-        info    = "SetCol {}, {:1.0f}".format(x, y)
-        answ    = self.dongle.askDongle(self.addr, data, rbytes, name=self.name, info=info, end="")
-        print()
+        return [0x00 + ix, iy], "SetCol {}, {:1.0f}".format(x, y)
 
 
     def HT16K33runAllFunctions (self):
@@ -66,12 +66,26 @@ class SensorLM75:
             sys.exit()
 
 
+    def LM75cycle(self):
+        """ transactions for one measurement (for askDongleBatch or ELV macros) """
+
+        return [(self.addr, [0x00], 2, 0)]
+
+
     def LM75getTemp(self):
         """ Write to reg 00 and read the temp """
 
         data     = [0x00]
         rbytes   = 2
         answ     = self.dongle.askDongle(self.addr, data, rbytes, name=self.name, info="get Temp", end="")
+
+        return self.LM75parseTemp([answ])
+
+
+    def LM75parseTemp(self, answers):
+        """ temp from the answers to LM75cycle """
+
+        answ     = answers[0]
         msb, lsb = answ[0], answ[1]
         temp     = self.__calcTemperature(msb, lsb)
         util.ncprint("                       Result: T: {:6.3f}".format(temp), color=glob.TDEFAULT)
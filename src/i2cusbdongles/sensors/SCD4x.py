@@ -6,6 +6,8 @@ SCD40/SCD41 CO2/Temp/RH sensor
 """
 
 import sys, time
+import asyncio
+import concurrent.futures
 
 from i2cusbdongles import glob
 from i2cusbdongles import util
@@ -20,6 +22,13 @@ class SensorSCD4x:
     """Code for the SCD40/SCD41 sensors"""
     
     min_cycle = 5 # minimum time (in sec) between 2 measurements
+    low_power_cycle = 30 # time (in sec) between 2 measurements in low power periodic measurement
+    frc_settle = 3*60 # time (in sec) of periodic measurement before a forced recalibration
+
+    # schedule of the reads, see __schedule__
+    guard     = 0.1 # time (in sec) a measurement is read after it is expected, and between asks when it is late
+    late_max  = 1 # max time (in sec) between the last ask without and the ask with a late measurement, to lock onto it
+    probe     = 0.005 # part of the period, by which a measurement is expected earlier each time
     
     commands = {
                 'start_periodic_measurement': {'code':0x21b1, 'type':'send', 'rbytes':0, 'wait_ms':0,'during_meas':False},
@@ -49,7 +58,18 @@ class SensorSCD4x:
         self.addr    = SCD4x["addr"]    # addr:0x48 ... 0x4F
         self.subtype = SCD4x["type"]    # "LM75" or "LM75B"
         self.name    = SCD4x["name"]    # "LM75"
+        self.low_power = SCD4x.get("low_power", False) # 30 sec instead of 5 sec between measurements
         self.last_time = None
+        self.running   = False          # periodic measurement started
+        self.period    = None           # time between measurements, corrected for the clock of the sensor
+        self.tick      = None           # time of the last measurement (expected)
+        self.lock_time = None           # time of the last measurement seen to become ready
+        self.missed    = None           # time of the last ask without the expected measurement, while it is late
+        self.pending   = False          # a measurement found ready, not yet read
+        self.next_ready = None          # time when the next measurement is read, for planning of the main loop
+        self.frc_ppm   = None           # reference CO2 level of the pending forced recalibration
+        self.frc_due   = None           # time when it is performed
+        self.frc       = None           # Future with its CO2 offset, see SCD4xStartForcedRecalibration
 #
 #    def __split_2_bytes__(self, integer, order='big'):
 #        
@@ -58,11 +78,58 @@ class SensorSCD4x:
 
     @property
     def SCD4xready(self):
-        if (time.time() - self.last_time()) > self.min_cycle:
-            if self.SCD4xGetDataReady():
-                return True
-        return False
-        
+        """True if a measurement is there to be read (see SCD4xpoll); it is
+        then taken as read"""
+        ready, self.pending = self.pending or self.SCD4xpoll(), False
+
+        return ready
+
+
+    def SCD4xpoll(self):
+        """Asks the sensor once if the measurement expected at next_ready is
+        there, not before; a late one is asked for again after guard sec, by
+        the next call, without waiting here. main calls it between the cycles
+        while a measurement is late (missed is set)
+        returns True if a measurement is pending"""
+        if self.pending or self.next_ready is None or time.time() < self.next_ready: return self.pending
+
+        self.pending = self.__schedule__(self.SCD4xGetDataReady())
+
+        return self.pending
+
+
+    def __schedule__(self, ready):
+        """Sets next_ready from the answer to get_data_ready_status, so that
+        only one measurement per period is asked: the next one is expected a
+        period after the last one. A late measurement (not ready at
+        next_ready, ready within late_max of the last ask) shows when the
+        sensor measures, the schedule locks onto it and the period is
+        corrected by the time since the last lock; later than that its time
+        is unknown. A measurement ready in time is expected a little
+        earlier next time, so that a sensor faster than the period is found too"""
+        now = time.time()
+        if not ready:
+            self.missed     = now
+            self.next_ready = now + self.guard
+            return False
+
+        if self.missed is not None and now - self.missed > self.late_max:
+            self.tick, self.lock_time = now, None
+        elif self.missed is not None:
+            nominal = self.low_power_cycle if self.low_power else self.min_cycle
+            if self.lock_time is not None:
+                n = round((now - self.lock_time) / self.period)
+                if n > 0 and abs((now - self.lock_time) / n / nominal - 1) < 0.1:
+                    self.period = (now - self.lock_time) / n
+            self.tick, self.lock_time = now, now
+        else:
+            n = max(1, round((now - self.guard - self.tick) / self.period))
+            self.tick += n * self.period * (1 - self.probe)
+        self.missed     = None
+        self.next_ready = self.tick + self.period + self.guard
+
+        return True
+
 
     def __CRC__(self, data):
         """
@@ -84,6 +151,30 @@ class SensorSCD4x:
     def __I2Ccommand__(self, command_name, set_value=None, info=""):
         """General method for sending an I2C command to the SCD4x sensor"""
         command = self.commands[command_name]
+        data = self.__commandData__(command, set_value)
+        try:
+            answ = self.dongle.askDongle(self.addr, data, command['rbytes'], wait_time=command['wait_ms'], name=self.name, info=info)
+        except Exception as e:
+            util.exceptPrint(e, sys.exc_info(), "ERROR when '{}' (sensor {}, dongle {})".format(command_name, self.name, self.dongle))
+            util.ecprint("Is sensor connected? - Exiting")
+            sys.exit()
+        return answ
+
+    async def __I2CcommandAsync__(self, command_name, set_value=None, info=""):
+        """__I2Ccommand__ for an asyncio event loop; the execution time of a
+        'send' command is an asyncio.sleep (see Dongle.askDongleAsync)"""
+        command = self.commands[command_name]
+        data = self.__commandData__(command, set_value)
+        try:
+            answ = await self.dongle.askDongleAsync(self.addr, data, command['rbytes'], wait_time=command['wait_ms'], name=self.name, info=info)
+        except Exception as e:
+            util.exceptPrint(e, sys.exc_info(), "ERROR when '{}' (sensor {}, dongle {})".format(command_name, self.name, self.dongle))
+            util.ecprint("Is sensor connected? - Exiting")
+            sys.exit()
+        return answ
+
+    def __commandData__(self, command, set_value=None):
+        """Command code, followed by the value and CRC for writes"""
         data = list(command['code'].to_bytes(2, 'big'))
         if command['type'] in ['write', 'send_fetch']:
             if set_value is not None:
@@ -92,13 +183,7 @@ class SensorSCD4x:
                 data += [self.__CRC__(set_bytes)]
             else:
                 data += [self.__CRC__(data)]
-        try:
-            answ = self.dongle.askDongle(self.addr, data, command['rbytes'], wait_time=command['wait_ms'], name=self.name, info=info)
-        except Exception as e:
-            util.exceptPrint(e, sys.exc_info(), "ERROR when '{}' (sensor {}, dongle {})".format(command_name, self.name, self.dongle))
-            util.ecprint("Is sensor connected? - Exiting")
-            sys.exit()
-        return answ
+        return data
 
     def close(self):
         """Action to do when the util.shutdown() function is called """
@@ -106,11 +191,49 @@ class SensorSCD4x:
         self.SCD4xStopMeas()
         
 
+    def SCD4xgetAllIfReady(self):
+        """ Read all measurements, missing values while not ready; all in
+        one call, so that it can be queued on the worker of the dongle """
+
+        answ = self.SCD4xgetAll() if self.SCD4xready else [glob.missing_value]*3
+        self.SCD4xFRCstep()
+
+        return answ
+
+
+    async def SCD4xgetAllIfReadyAsync(self):
+        """ SCD4xgetAllIfReady for an asyncio event loop """
+
+        if not self.pending and self.next_ready is not None and time.time() >= self.next_ready:
+            self.pending = self.__schedule__(await self.SCD4xGetDataReadyAsync())
+        ready, self.pending = self.pending, False
+
+        answ = await self.SCD4xgetAllAsync() if ready else [glob.missing_value]*3
+        if self.frc_due is not None:
+            await asyncio.wrap_future(self.dongle.submit(self.SCD4xFRCstep))
+
+        return answ
+
+
     def SCD4xgetAll(self):
         """ Read all measurements """
 
         answ = self.__I2Ccommand__('read_measurement', info='Get All')
         
+        return self.__parseAll__(answ)
+
+
+    async def SCD4xgetAllAsync(self):
+        """ SCD4xgetAll for an asyncio event loop """
+
+        answ = await self.__I2CcommandAsync__('read_measurement', info='Get All')
+
+        return self.__parseAll__(answ)
+
+
+    def __parseAll__(self, answ):
+        """ CO2, T, RH from the answer to read_measurement """
+
         self.last_time = time.time()
         
         CO2 = (answ[0]<<8) + answ[1] #TODO: always return 0 ??
@@ -146,21 +269,48 @@ class SensorSCD4x:
         """Asks sensor if new data is available"""
         answ = self.__I2Ccommand__('get_data_ready_status', info='Is data ready?')
         
+        return self.__parseDataReady__(answ)
+
+    async def SCD4xGetDataReadyAsync(self):
+        """SCD4xGetDataReady for an asyncio event loop"""
+        answ = await self.__I2CcommandAsync__('get_data_ready_status', info='Is data ready?')
+
+        return self.__parseDataReady__(answ)
+
+    def __parseDataReady__(self, answ):
         #If the least significant 11 bits of word[0] are 0 → data not ready else → data ready for read-out
-        if answ[0]+answ[1]+(answ[2]&0x07) == 0:
+        if ((answ[0]<<8) + answ[1]) & 0x07ff == 0:
             util.ecprint("Data not ready")
             return False
         else:
             return True
         
-    def SCD4xStartMeas(self):
-        """Asks to start a periodic measurement"""
-        self.__I2Ccommand__('start_periodic_measurement', info='Start meas.')
+    def SCD4xStartMeas(self, low_power=None):
+        """Asks to start a periodic measurement, every 5 sec, or with
+        low_power every 30 sec; None: as before"""
+        if low_power is not None: self.low_power = low_power
+        if self.low_power:
+            self.__I2Ccommand__('start_low_power_periodic_measurement', info='Start low power')
+        else:
+            self.__I2Ccommand__('start_periodic_measurement', info='Start meas.')
         self.last_time = time.time()
+        self.running   = True
+
+        # the 1st measurement comes a period after the start
+        self.period     = self.low_power_cycle if self.low_power else self.min_cycle
+        self.tick       = self.last_time
+        self.lock_time  = None
+        self.missed     = None
+        self.pending    = False
+        self.next_ready = self.tick + self.period + self.guard
 
     def SCD4xStopMeas(self):
         """Returns the sensor to idle state"""
         self.__I2Ccommand__('stop_periodic_measurement', info='Stop meas.')
+        self.running   = False
+        self.missed    = None
+        self.pending   = False
+        self.next_ready = None
 
     def SCD4xFactoryReset(self):
         """
@@ -179,6 +329,11 @@ class SensorSCD4x:
         self.__I2Ccommand__('reinit', info='SCD4x reinit')
         time.sleep(1) #1000 ms required after soft restart
 
+    async def SCD4xReInitAsync(self):
+        """SCD4xReInit for an asyncio event loop"""
+        await self.__I2CcommandAsync__('reinit', info='SCD4x reinit')
+        await asyncio.sleep(1) #1000 ms required after soft restart
+
     
     def SCD4xSetSensorAltitude(self, altitude=0):
         """
@@ -225,7 +380,9 @@ class SensorSCD4x:
             
     def SCD4xPerformForcedRecalibration(self, ref_ppm=400, silent=False):
         """
-        Perform a forced recalibration by giving the sensor a reference CO2 level
+        Perform a forced recalibration by giving the sensor a reference CO2 level;
+        blocks for 3 min, see SCD4xStartForcedRecalibration for the one
+        done while the data logging goes on
         """
         if not silent:
             r = input("/!\ Calibration will block the current thread during 3 min. Continue anyway? (y/n):")
@@ -241,20 +398,76 @@ class SensorSCD4x:
         print("Acquiring data for 3 min before calibration")
         time.sleep(3*60)
         self.SCD4xStopMeas()
+        time.sleep(self.commands['stop_periodic_measurement']['wait_ms'] / 1000) #500 ms required after stop
         print("Forcing calibration with reference CO2 level of {:.0f}ppm".format(ref_ppm))
         answ = self.__I2Ccommand__('perform_forced_recalibration', set_value=ref_ppm, info='Forced calibr.')
+        FRC = self.__parseFRC__(answ)
+
+        if was_running: self.SCD4xStartMeas()
+        return FRC
+
+
+    def SCD4xStartForcedRecalibration(self, ref_ppm=400):
+        """
+        Forced recalibration without blocking: the periodic measurement keeps
+        running (and is started if needed) for frc_settle sec, then the next
+        SCD4xgetAllIfReady stops it, performs the recalibration and starts it
+        again (see SCD4xFRCstep)
+        returns a concurrent.futures.Future with the CO2 offset in ppm, None if failed
+        """
+        if self.frc is not None and not self.frc.done(): return self.frc
+
+        self.frc_ppm = ref_ppm
+        self.frc_due = time.time() + self.frc_settle
+        self.frc     = concurrent.futures.Future()
+        util.fncprint("{}: forced recalibration with {:.0f}ppm after {:.0f} sec of measurement".format(self.name, ref_ppm, self.frc_settle))
+
+        return self.frc
+
+
+    def SCD4xFRCstep(self):
+        """One step of the pending forced recalibration, done with each read"""
+
+        if self.frc_due is None: return
+
+        if not self.running:
+            self.SCD4xStartMeas()
+            self.frc_due = time.time() + self.frc_settle    # settling begins now
+            return
+        if time.time() < self.frc_due: return
+
+        util.fncprint("{}: forcing calibration with reference CO2 level of {:.0f}ppm".format(self.name, self.frc_ppm))
+        frc, self.frc, self.frc_due = self.frc, None, None
+        try:
+            self.SCD4xStopMeas()
+            time.sleep(self.commands['stop_periodic_measurement']['wait_ms'] / 1000) #500 ms required after stop
+            answ = self.__I2Ccommand__('perform_forced_recalibration', set_value=self.frc_ppm, info='Forced calibr.')
+        except BaseException as e:      # also the SystemExit of __I2Ccommand__, so that no one waits for frc forever
+            frc.set_exception(e)
+            raise
+        self.SCD4xStartMeas()
+
+        frc.set_result(self.__parseFRC__(answ))
+
+
+    def __parseFRC__(self, answ):
+        """CO2 offset in ppm from the answer to perform_forced_recalibration, None if failed"""
+        if answ is None:
+            print("Calibration not answered - please try again")
+            return None
         cal_bytes = [answ[0],answ[1]]
         CRC = answ[2]
         FRC = int.from_bytes(cal_bytes,'big')
-        if FRC == 0xff:
+        if FRC == 0xffff:
             print("Calibration has failed - please try again")
+            return None
         elif CRC != self.__CRC__(cal_bytes):
             print("Calibration CRC is incorrect - please try again")
-        else:
-            FRC = FRC - 0x8000
-            print("Calibration succeded! CO2 offset is {:.0f}ppm".format(FRC))            
-            
-        if was_running: self.SCD4xStartMeas()
+            return None
+
+        FRC = FRC - 0x8000
+        print("Calibration succeded! CO2 offset is {:.0f}ppm".format(FRC))
+
         return FRC
         
         
\ No newline at end of file
@@ -6,6 +6,7 @@ I2C module TSL2591 (Light Sensor, Visible + Infrared)
 """
 
 import time, sys
+import asyncio
 from i2cusbdongles import glob
 from i2cusbdongles import util
 from i2cusbdongles.dongles.Dongle import Dongle
@@ -79,6 +80,14 @@ class SensorTSL2591(Dongle):
                     "600ms":(0b101,    600),
                   }
 
+    # auto gain: always 600 ms integration time, and the gains in steps
+    autoIntgrl  = "600ms"
+    autoGain    = ("Low",       # Factor = 1
+                   "Med",       # Factor = 25
+                   "High",      # Factor = 428
+                   "Max",       # Factor = 9876
+                  )
+
 
     def __init__(self, TSL2591):
         self.dongle  = TSL2591["dngl"]    # A dongle object "ELVdongle", "IOW-DG", "ISSdongle"
@@ -94,7 +103,7 @@ class SensorTSL2591(Dongle):
         # ID Register (0x12) (Bit 7:0)
         data    = [self.CMD + 0x12]
         rbytes  = 1
-        answ    = glob.dongles[self.dongle].askDongle(self.dongle, self.addr, data, rbytes, name=self.name, info="get ID")
+        answ    = self.dongle.askDongle(self.addr, data, rbytes, name=self.name, info="get ID")
         if answ[0] == self.subtype:
             util.fncprint("Found Sensor TSL2591")
         else:
@@ -135,48 +144,59 @@ class SensorTSL2591(Dongle):
     def TSL2591getLumAuto(self):
         """ Function doc """
 
-        atime    = "600ms"      # so far always use 600 ms integration time
-        selector = ("Low",      # Factor = 1
-                    "Med",      # Factor = 25
-                    "High",     # Factor = 428
-                    "Max",      # Factor = 9876
-                   )
         selindex = 1            # start with Med; best chance for success in
                                 # fewest cycles
+        while True:
+            ret      = self.TSL2591getLum(gain = self.autoGain[selindex], intgrl = self.autoIntgrl)
+            selindex = self.__nextGain(selindex, ret[2])
+            if selindex is None: break
+
+        return ret
 
+
+    async def TSL2591getLumAutoAsync(self):
+        """ TSL2591getLumAuto for an asyncio event loop """
+
+        selindex = 1
         while True:
-            again = selector[selindex]
-            ret   = self.TSL2591getLum(gain = again, intgrl = atime)
-            vis, ir, visraw, irraw, gainFct, inttime = ret
-
-            # lower limit for autoscale must be <= min(2600, 3800, 2800)
-            # chosen is 2500
-            #        Name   Factor
-            #                                             104
-            #AGAIN = Low    1                            2600     152
-            #AGAIN = Med    25      1                   65000    3800     163
-            #AGAIN = High   428     17.12       1               65000    2800
-            #AGAIN = Max    9876    395.04      23,07                   65000
-
-            lastselindex = selindex
-            if visraw > 65000:              # too much light
-                selindex += -1              # one step down
-                if selindex < 0: break      # reached the bottom?
-                util.fncprint("Autodecrease Gain 1 step")
-
-            elif visraw < 152:              # allows two step up:
-                selindex += 2               # one step up
-                if selindex > 3: break      # broke the ceiling?
-                util.fncprint("Autoincrease Gain 2 steps")
-
-            elif visraw < 2500:             # allows one step up
-                selindex += 1               # one step up
-                if selindex > 3: break      # broke the ceiling?
-                util.fncprint("Autoincrease Gain 1 step")
-            else:
-                break                       # best value possible
-
-        return vis, ir, visraw, irraw, gainFct, inttime
+            ret      = await self.TSL2591getLumAsync(gain = self.autoGain[selindex], intgrl = self.autoIntgrl)
+            selindex = self.__nextGain(selindex, ret[2])
+            if selindex is None: break
+
+        return ret
+
+
+    def __nextGain(self, selindex, visraw):
+        """ index into autoGain for the next try, None if visraw is the
+        best value possible """
+
+        # lower limit for autoscale must be <= min(2600, 3800, 2800)
+        # chosen is 2500
+        #        Name   Factor
+        #                                             104
+        #AGAIN = Low    1                            2600     152
+        #AGAIN = Med    25      1                   65000    3800     163
+        #AGAIN = High   428     17.12       1               65000    2800
+        #AGAIN = Max    9876    395.04      23,07                   65000
+
+        if visraw > 65000:              # too much light
+            selindex += -1              # one step down
+            if selindex < 0: return None    # reached the bottom?
+            util.fncprint("Autodecrease Gain 1 step")
+
+        elif visraw < 152:              # allows two step up:
+            selindex += 2               # one step up
+            if selindex > 3: return None    # broke the ceiling?
+            util.fncprint("Autoincrease Gain 2 steps")
+
+        elif visraw < 2500:             # allows one step up
+            selindex += 1               # one step up
+            if selindex > 3: return None    # broke the ceiling?
+            util.fncprint("Autoincrease Gain 1 step")
+        else:
+            return None                 # best value possible
+
+        return selindex
 
 
     def TSL2591getLum(self, gain = 'Low', intgrl = "100ms"):
@@ -186,7 +206,6 @@ class SensorTSL2591(Dongle):
 
         intFV   = self.sensorint[intgrl][0]  # Field Value
         intTime = self.sensorint[intgrl][1]  # integration time in ms
-        intFct  = intTime / 100              # Gain Factor by integration time
 
         # Control Register (0x01) - Setting Gain Mode and Integration Time
         data    = [self.CMD + 0x01, gainFV << 4 | intFV ]
@@ -232,6 +251,45 @@ class SensorTSL2591(Dongle):
         rbytes  = 4
         answ    = self.dongle.askDongle(self.addr, data, rbytes, name=self.name, info="Get data", end="")
 
+        return self.__parseLum(answ, gainFct, intTime)
+
+
+    async def TSL2591getLumAsync(self, gain = 'Low', intgrl = "100ms"):
+        """ TSL2591getLum for an asyncio event loop; the integration time is
+        an asyncio.sleep """
+
+        gainFV,  gainFct = self.sensorgain[gain]
+        intFV,   intTime = self.sensorint[intgrl]
+
+        # Control Register (0x01), then cycle AEN in the Enable Register (0x00)
+        await self.dongle.askDongleAsync(self.addr, [self.CMD + 0x01, gainFV << 4 | intFV], 1, name=self.name, info="Gain:{}, Int:{} ms".format(gainFct, intTime))
+        await self.dongle.askDongleAsync(self.addr, [self.CMD + 0x00, 0x01], 1, name=self.name, info="Disable AEN")
+        await self.dongle.askDongleAsync(self.addr, [self.CMD + 0x00, 0x03], 1, name=self.name, info="Enable AEN")
+
+        start = time.time()
+        await asyncio.sleep(intTime / 1000)
+
+        # Status Register (0x13) until AVALID
+        answ    = await self.dongle.askDongleAsync(self.addr, [self.CMD + 0x13], 1, name=self.name, info="status", end="")
+        if answ[0] & 0x01:
+            util.ncprint("Data ready")
+        else:
+            util.ecprint("Data not ready", end="")
+            while not answ[0] & 0x01:
+                util.ecprint(".", end="")
+                answ = await self.dongle.askDongleAsync(self.addr, [self.CMD + 0x13], 1, name=self.name, info="status", doPrint = False)
+            util.ncprint("ready after {:3.2f}sec".format(time.time() - start))
+
+        # ALS Data Register (0x14 - 0x17)
+        answ    = await self.dongle.askDongleAsync(self.addr, [self.CMD + 0x14], 4, name=self.name, info="Get data", end="")
+
+        return self.__parseLum(answ, gainFct, intTime)
+
+
+    def __parseLum(self, answ, gainFct, intTime):
+        """ vis, ir, visraw, irraw, gainFct, intTime from the ALS Data """
+
+        intFct = intTime / 100              # Gain Factor by integration time
         visraw = answ[0] | (answ[1] << 8)
         irraw  = answ[2] | (answ[3] << 8)
         util.ncprint("              Result: Vis: {}, IR: {}".format(visraw, irraw), color=glob.TDEFAULT)
@@ -0,0 +1,4 @@
+# the package is not installed, it is imported from src/
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
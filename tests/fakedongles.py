@@ -0,0 +1,198 @@
+# Fake ELV and ISS dongles behind a pseudo terminal: the dongle classes open
+# the slave side with pyserial as if it were /dev/ttyUSB0, a thread answers
+# on the master side from the sensors of a SIMdongle bus.
+
+import os, select, threading, time, tty
+
+from i2cusbdongles.dongles import SIM
+from i2cusbdongles.dongles.ISS import (ISS_CMD, ISS_MODULE_ID, I2C_AD0, I2C_AD1, I2C_AD2, I2C_DIRECT, I2C_TEST,
+                                       I2C_START, I2C_RESTART, I2C_STOP, I2C_NACK, I2C_READ, I2C_WRITE)
+
+
+class FakeDongle:
+    """pty with a thread, which hands the received bytes to answer() and
+    writes its reply after latency sec"""
+
+    def __init__(self, bus=None, latency=0.02):
+        """bus: {7bit addr: SIMdevice}, default the sensors of a SIMdongle"""
+
+        self.bus     = bus if bus is not None else SIM.SIMdongle().bus
+        self.latency = latency
+        self.buffer  = b""
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port    = os.ttyname(self.slave)
+        self.stopped = threading.Event()
+        self.thread  = threading.Thread(target=self.run, name=type(self).__name__, daemon=True)
+        self.thread.start()
+
+
+    def run(self):
+
+        while not self.stopped.is_set():
+            if not select.select([self.master], [], [], 0.01)[0]: continue
+            try:
+                self.buffer += os.read(self.master, 4096)
+            except OSError:
+                break
+            reply = b""
+            while True:
+                used, answ = self.answer(self.buffer)
+                if used == 0: break
+                self.buffer = self.buffer[used:]
+                reply      += answ
+            if reply:
+                time.sleep(self.latency)
+                os.write(self.master, reply)
+
+
+    def answer(self, rec):
+        """returns the no of bytes used of the complete command at the start
+        of rec (0 if incomplete) and the reply to it"""
+
+        raise NotImplementedError
+
+
+    def read(self, addr, count):
+
+        return bytes(self.bus[addr].read(count)) if addr in self.bus else None
+
+
+    def write(self, addr, data):
+
+        if addr not in self.bus: return False
+        self.bus[addr].write(list(data))
+
+        return True
+
+
+    def close(self):
+
+        self.stopped.set()
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class FakeELV(FakeDongle):
+    """ASCII protocol: 'S EE F4 D6 P' writes, 'S EF 08 P' reads 8 bytes and
+    is answered with 'BE 6E ... \\r\\n'; '<', 'Y30', '?' of the admin, and
+    the macro memory: 'W' stores up to CR, 'U' dumps, '>' runs, 'Lnn' waits"""
+
+    banner = b"ELV USB-I2C-Interface v1.6 (Fake)\r\n"
+    macro  = b""
+
+    def answer(self, rec):
+
+        text = rec.lstrip()
+        skip = len(rec) - len(text)
+        if not text:                return skip, b""
+        if text[:1] == b"<":        return skip + 1, b""
+        if text[:1] == b"?":        return skip + 1, self.banner
+        if text[:1] == b"Y":        return (skip + 3, b"") if len(text) >= 3 else (0, b"")
+        if text[:1] == b"U":        return skip + 1, b"Macro:\r\n" + self.macro.ljust(255) + b"\r\nEnd\r\n"
+        if text[:1] == b"W":
+            end = text.find(b"\r")
+            if end < 0: return 0, b""
+            self.macro = text[1:end]
+            return skip + end + 1, b""
+        if text[:1] == b"L":
+            if len(text) < 3: return 0, b""
+            time.sleep(int(text[1:3], 16) / 1000)
+            return skip + 3, b""
+        if text[:1] == b">":
+            reply, macro = b"", self.macro
+            while macro:
+                used, answ = self.answer(macro)
+                macro      = macro[used:]
+                reply     += answ
+            return skip + 1, reply
+        if text[:1] != b"S":        return skip + 1, b"Err: unknown command\r\n"
+
+        end = text.find(b"P")
+        if end < 0: return 0, b""
+        data = bytes.fromhex(text[1:end].decode("ASCII"))
+        addr = data[0] >> 1
+        if data[0] & 1:
+            answ = self.read(addr, data[1])
+            return skip + end + 1, (b"Err: TWI READ\r\n" if answ is None else answ.hex(" ").upper().encode() + b" \r\n")
+        self.write(addr, data[1:])
+
+        return skip + end + 1, b""
+
+
+class FakeISS(FakeDongle):
+    """binary protocol of the USB-ISS: admin commands, the I2C_AD0/1/2
+    frames, I2C_DIRECT sequences and I2C_TEST"""
+
+    def __init__(self, bus=None, latency=0.02):
+
+        self.mode = 0x40
+        FakeDongle.__init__(self, bus=bus, latency=latency)
+
+
+    def answer(self, rec):
+
+        if not rec: return 0, b""
+        cmd = rec[0]
+
+        if cmd == ISS_CMD:
+            if len(rec) < 2:            return 0, b""
+            if rec[1] == 0x01:          return 2, bytes([ISS_MODULE_ID, 0x09, self.mode])
+            if rec[1] == 0x03:          return 2, b"00001234"
+            if rec[1] == 0x02:
+                if len(rec) < 4:        return 0, b""
+                self.mode = rec[2]
+                return 4, b"\xff\x00"
+            return 2, b"\x00\x00"
+
+        if cmd == I2C_TEST:
+            if len(rec) < 2:            return 0, b""
+            return 2, bytes([(rec[1] >> 1) in self.bus])
+
+        if cmd in (I2C_AD0, I2C_AD1, I2C_AD2):
+            nreg = cmd - I2C_AD0
+            if len(rec) < 3 + nreg:     return 0, b""
+            addr  = rec[1] >> 1
+            count = rec[2 + nreg]
+            if rec[1] & 1:                                  # register, then read
+                if nreg: self.write(addr, rec[2:2 + nreg])
+                answ = self.read(addr, count)
+                return 3 + nreg, answ if answ is not None else bytes(count)
+            if len(rec) < 3 + count:    return 0, b""      # I2C_AD0 write
+            return 3 + count, b"\xff" if self.write(addr, rec[3:3 + count]) else b"\x00"
+
+        if cmd == I2C_DIRECT:
+            return self.direct(rec)
+
+        return 1, b""
+
+
+    def direct(self, rec):
+        """ I2C_DIRECT up to I2C_STOP: answered with ACK, count, data """
+
+        pos, addr, ack, data, answ = 1, None, True, b"", b""
+        while True:
+            if pos >= len(rec): return 0, b""
+            sub  = rec[pos]
+            pos += 1
+            if sub in (I2C_START, I2C_RESTART, I2C_STOP):
+                if addr is not None and data: ack &= self.write(addr >> 1, data)
+                addr, data = None, b""
+                if sub == I2C_STOP: break
+            elif sub == I2C_NACK:
+                pass
+            elif I2C_WRITE <= sub < I2C_WRITE + 16:
+                n = sub - I2C_WRITE + 1
+                if pos + n > len(rec): return 0, b""
+                wrt  = rec[pos:pos + n]
+                pos += n
+                if addr is None: addr, wrt = wrt[0], wrt[1:]
+                data += wrt
+            elif I2C_READ <= sub < I2C_READ + 16:
+                n    = sub - I2C_READ + 1
+                read = self.read(addr >> 1, n) if addr is not None else None
+                ack &= read is not None
+                answ += read if read is not None else bytes(n)
+
+        return pos, bytes([0xff if ack else 0x00, len(answ)]) + answ
@@ -0,0 +1,117 @@
+# the asyncio reads of the sensors against fake ELV and ISS dongles on a pty:
+# the serial I/O runs on the worker threads of the dongles, so that the event
+# loop goes on while a dongle is waiting for its answer
+
+import asyncio, time
+
+import pytest
+
+pytest.importorskip("serial")
+
+from i2cusbdongles import glob
+from i2cusbdongles.dongles import SIM
+from i2cusbdongles.dongles.ELV import ELVdongle
+from i2cusbdongles.dongles.ISS import ISSdongle
+from i2cusbdongles.sensors.BME280 import SensorBME280
+from i2cusbdongles.sensors.SCD4x import SensorSCD4x
+
+from fakedongles import FakeELV, FakeISS
+
+LATENCY = 0.1                   # sec the fake dongles take for each answer
+
+
+@pytest.fixture
+def bus():
+
+    return {0x77: SIM.SIMsensorBME280(noise=False), 0x62: SIM.SIMsensorSCD4x(clock=0.01)}
+
+
+@pytest.fixture
+def elv(bus):
+
+    fake   = FakeELV(bus, latency=LATENCY)
+    dongle = ELVdongle(usbport=fake.port)
+    yield dongle
+    dongle.close()
+    fake.close()
+
+
+@pytest.fixture
+def iss(bus):
+
+    fake   = FakeISS(bus, latency=LATENCY)
+    dongle = ISSdongle(usbport=fake.port)
+    yield dongle
+    dongle.close()
+    fake.close()
+
+
+@pytest.fixture
+def bme280(elv, monkeypatch):
+
+    monkeypatch.setattr(glob, "calibrationCache", None)
+    sensor = SensorBME280(dict(glob.BME280, dngl=elv, osrs=(1, 1, 1)))
+    sensor.BME280Init()
+
+    return sensor
+
+
+@pytest.fixture
+def scd41(iss):
+
+    sensor = SensorSCD4x(dict(glob.SCD41, dngl=iss))
+    sensor.SCD4xStartMeas()
+    sensor.period = 0.05        # the SIM sensor measures every 5 sec * clock
+
+    return sensor
+
+
+async def ticker(done, gaps):
+    """ ticks every 5 ms until done, and keeps the longest time between ticks """
+
+    last = time.monotonic()
+    while not done.is_set():
+        await asyncio.sleep(0.005)
+        now  = time.monotonic()
+        gaps.append(now - last)
+        last = now
+
+
+def test_bme280_async(bme280):
+
+    t, p, h = asyncio.run(bme280.BME280getTPHAsync())[:3]
+
+    assert (round(t, 2), round(p, 2), round(h)) == (21.49, 1002.50, 45)
+
+
+def test_scd4x_async(scd41):
+
+    time.sleep(0.06)
+    scd41.next_ready = time.time()
+    co2, t, rh = asyncio.run(scd41.SCD4xgetAllIfReadyAsync())
+
+    assert (co2, round(t, 1), round(rh, 1)) == (612, 22.3, 44.5)
+
+
+def test_concurrent_reads_do_not_block(bme280, scd41):
+
+    async def reads():
+        done = asyncio.Event()
+        gaps = []
+        tick = asyncio.ensure_future(ticker(done, gaps))
+        scd41.next_ready = time.time()
+        t0 = time.monotonic()
+        tph, co2trh = await asyncio.gather(bme280.BME280getTPHAsync(), scd41.SCD4xgetAllIfReadyAsync())
+        elapsed = time.monotonic() - t0
+        done.set()
+        await tick
+
+        return tph, co2trh, elapsed, gaps
+
+    time.sleep(0.06)
+    tph, co2trh, elapsed, gaps = asyncio.run(reads())
+
+    assert round(tph[0], 2) == 21.49 and co2trh[0] == 612
+    # several answers of LATENCY were waited for, but never by the event loop
+    assert elapsed > 3 * LATENCY
+    assert max(gaps) < LATENCY / 2
@@ -0,0 +1,68 @@
+# compensateArrays must agree to the bit with compensate, for every raw value
+
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from i2cusbdongles.sensors.BME280 import BME280Compensation
+
+CAL1 = bytes.fromhex("BE 6E 9A 69 32 00 77 92 CE D6 D0 0B 00 22 A4 FF F9 FF AC 26 0A D8 BD 10")
+CAL2 = bytes([0x4B])
+CAL3 = bytes.fromhex("6B 01 00 13 2D 03 1E")
+
+
+def raw_values(n, seed=280):
+    """n random raw P, T, H over the whole 20 bit / 16 bit range"""
+
+    rnd = random.Random(seed)
+    pres = [rnd.randrange(1 << 20) for i in range(n)]
+    temp = [rnd.randrange(1 << 20) for i in range(n)]
+    hum  = [rnd.randrange(1 << 16) for i in range(n)]
+
+    return pres, temp, hum
+
+
+def assert_bit_equal(comp, pres, temp, hum):
+    """compensate one by one and as arrays, compare the bits"""
+
+    arrays = comp.compensateArrays(pres, temp, hum)
+    for i in range(len(pres)):
+        single = comp.compensate(pres[i], temp[i], hum[i])
+        for value, array in zip(single, arrays):
+            assert np.float64(value).tobytes() == array[i].tobytes(), (i, pres[i], temp[i], hum[i])
+
+    return arrays
+
+
+def test_known_measurement():
+    comp = BME280Compensation(CAL1, CAL2, CAL3)
+    t, p, h = comp.compensate(303958, 520295, 28446)
+
+    assert round(t, 2) == 21.49
+    assert round(p, 2) == 1002.50
+    assert 44 < h < 46
+
+
+def test_random_raw_values():
+    comp = BME280Compensation(CAL1, CAL2, CAL3)
+    t, p, h = assert_bit_equal(comp, *raw_values(5000))
+
+    # the random values reach both clamps of the humidity
+    assert (h == 100).any() and (h == 0).any()
+
+
+def test_humidity_clamps():
+    comp = BME280Compensation(CAL1, CAL2, CAL3)
+    t, p, h = assert_bit_equal(comp, [303958] * 3, [520295] * 3, [0, 28446, 65535])
+
+    assert h[0] == 0 and 0 < h[1] < 100 and h[2] == 100
+
+
+def test_pressure_without_dig_P1():
+    cal1 = CAL1[:6] + b"\x00\x00" + CAL1[8:]    # dig_P1 = 0 gives var1 == 0
+    comp = BME280Compensation(cal1, CAL2, CAL3)
+    t, p, h = assert_bit_equal(comp, *raw_values(100))
+
+    assert (p == 0).all()
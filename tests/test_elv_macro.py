@@ -0,0 +1,72 @@
+# the cycle of a sensor as ELV macro: compiled, uploaded, read back and run
+# against the fake ELV dongle on a pty
+
+import pytest
+
+pytest.importorskip("serial")
+
+from i2cusbdongles import glob
+from i2cusbdongles.dongles import SIM
+from i2cusbdongles.dongles.ELV import ELVdongle
+from i2cusbdongles.sensors.BME280 import SensorBME280
+
+from fakedongles import FakeELV
+
+
+@pytest.fixture
+def fake():
+
+    fake = FakeELV({0x77: SIM.SIMsensorBME280(noise=False)}, latency=0.005)
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def elv(fake):
+
+    dongle = ELVdongle(usbport=fake.port)
+    yield dongle
+    dongle.close()
+
+
+@pytest.fixture
+def bme280(elv, monkeypatch):
+
+    monkeypatch.setattr(glob, "calibrationCache", None)
+    sensor = SensorBME280(dict(glob.BME280, dngl=elv, osrs=(1, 1, 1)))
+    sensor.BME280Init()
+
+    return sensor
+
+
+def test_compile(elv, bme280):
+
+    macro, rlist = elv.ELVcompileMacro(bme280.BME280cycle())
+
+    assert macro == b"S EE F4 25 P S EF 01 P S EE F7 P L0A S EF 08 P"
+    assert rlist == [1, 8]
+
+
+def test_compile_too_long(elv):
+
+    macro, rlist = elv.ELVcompileMacro([(0x77, [0xf7], 8, 0)] * 20)
+
+    assert macro is None
+
+
+def test_upload_and_run(elv, fake, bme280):
+
+    assert elv.ELVuploadMacro(bme280.BME280cycle())
+    assert fake.macro.startswith(b"S EE F4 25 P")
+
+    for i in range(2):
+        t, p, h = bme280.BME280parseTPH(elv.ELVrunMacro())[:3]
+        assert (round(t, 2), round(p, 2), round(h)) == (21.49, 1002.50, 45)
+
+
+def test_upload_not_stored(elv, fake, bme280):
+
+    elv.macroWrite = b"Q"               # a command the dongle does not know
+
+    assert not elv.ELVuploadMacro(bme280.BME280cycle())
+    assert elv.macro_rlist == []
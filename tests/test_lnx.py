@@ -0,0 +1,80 @@
+# the I2C_RDWR transfers of the LNX dongle, with SIMi2cdev in place of the
+# ioctl of /dev/i2c-N
+
+import time
+
+import pytest
+
+from i2cusbdongles.dongles import SIM, LNX
+
+
+class CountingI2Cdev(SIM.SIMi2cdev):
+    """keeps (addr, flags, len) of the messages of each transfer"""
+
+    def __init__(self, dongle=None):
+
+        SIM.SIMi2cdev.__init__(self, dongle)
+        self.transfers = []
+
+
+    def __call__(self, fd, request, arg):
+
+        self.transfers.append([(msg.addr, msg.flags, msg.len) for msg in arg.msgs[:arg.nmsgs]])
+
+        return SIM.SIMi2cdev.__call__(self, fd, request, arg)
+
+
+@pytest.fixture
+def i2cdev():
+
+    dongle = SIM.SIMdongle()
+    dongle.bus = {0x77: SIM.SIMsensorBME280(noise=False)}
+
+    return CountingI2Cdev(dongle)
+
+
+@pytest.fixture
+def lnx(i2cdev):
+
+    dongle = LNX.LNXdongle(fd=0, ioctl=i2cdev)
+    yield dongle
+    dongle.close()
+
+
+def test_combined_read(lnx, i2cdev):
+
+    answ = lnx.askDongle(0x77, [0xD0], 1)
+
+    assert answ == [0x60]
+    assert i2cdev.transfers == [[(0x77, 0, 1), (0x77, LNX.I2C_M_RD, 1)]]
+
+
+def test_batch_max_msgs(lnx, i2cdev):
+
+    answers = lnx.askDongleBatch([(0x77, [0xD0], 1, 0)] * 30)
+
+    assert answers == [[0x60]] * 30
+    assert [len(msgs) for msgs in i2cdev.transfers] == [LNX.I2C_RDWR_MAX_MSGS, 60 - LNX.I2C_RDWR_MAX_MSGS]
+
+
+def test_batch_noack(lnx, i2cdev):
+
+    key     = (lnx.name, "test", "NoACK")
+    before  = lnx.stats.failures[key]
+    answers = lnx.askDongleBatch([(0x77, [0xD0], 1, 0), (0x50, [0x00], 2, 0), (0x77, [0xF2], 1, 0)], name="test")
+
+    assert answers == [[0x60], None, [0x00]]
+    assert lnx.stats.failures[key] > before
+    # the combined transfer, then each transaction on its own
+    assert len(i2cdev.transfers[0]) == 6 and i2cdev.transfers[1] == [(0x77, 0, 1), (0x77, LNX.I2C_M_RD, 1)]
+    assert i2cdev.transfers[-1] == [(0x77, 0, 1), (0x77, LNX.I2C_M_RD, 1)]
+
+
+def test_noack_before_wait(lnx, i2cdev):
+
+    t0   = time.monotonic()
+    answ = lnx.askDongle(0x50, [0x00], 2, wait_time=1000)
+
+    assert answ is None
+    assert time.monotonic() - t0 < 1
+    assert all(msgs == [(0x50, 0, 1)] for msgs in i2cdev.transfers)
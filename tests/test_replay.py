@@ -0,0 +1,32 @@
+# recording of the transactions of a SIM dongle by a RECdongle
+
+import pytest
+
+from i2cusbdongles.dongles import SIM
+from i2cusbdongles.dongles.Replay import RECdongle, RECload
+
+
+@pytest.fixture
+def rec(tmp_path):
+
+    dongle = SIM.SIMdongle()
+    rec    = RECdongle(dongle, str(tmp_path / "sim.rec"))
+    yield rec
+    rec.close()
+
+
+def test_recorded_while_open(rec, tmp_path):
+
+    answ = rec.askDongle(0x77, [0xD0], 1, name="BME280", info="get ID")
+    rec.askDongleBatch([(0x77, [0xF2, 0x01], 0, 0), (0x77, [0xF2], 1, 0)], name="BME280", info="ctrl_hum")
+
+    transactions = RECload(str(tmp_path / "sim.rec"))
+    assert [(t[3], t[5], list(t[8]), t[9]) for t in transactions] == [("BME280", 0x77, [0xD0],       answ),
+                                                                      ("BME280", 0x77, [0xF2, 0x01], None),
+                                                                      ("BME280", 0x77, [0xF2],       [0x01])]
+
+
+def test_specific_functions_not_forwarded(rec):
+
+    assert rec.name == rec.dongle.name
+    assert not hasattr(rec, "SIMshowInfo")
@@ -0,0 +1,58 @@
+# askDongleBatch of the ELV and ISS dongles against the fakes on a pty
+
+import time
+
+import pytest
+
+pytest.importorskip("serial")
+
+from i2cusbdongles.dongles import SIM
+from i2cusbdongles.dongles.ELV import ELVdongle
+from i2cusbdongles.dongles.ISS import ISSdongle
+
+from fakedongles import FakeELV, FakeISS
+
+
+def values(answers):
+    """ the answers as lists of int, the ELV answers bytes """
+
+    return [None if a is None else list(a) for a in answers]
+
+
+@pytest.fixture(params=[(FakeELV, ELVdongle), (FakeISS, ISSdongle)], ids=["ELV", "ISS"])
+def dongle(request):
+
+    fake_class, dongle_class = request.param
+    fake   = fake_class({0x77: SIM.SIMsensorBME280(noise=False)}, latency=0.005)
+    dongle = dongle_class(usbport=fake.port)
+    yield dongle
+    dongle.close()
+    fake.close()
+
+
+def test_batch(dongle):
+
+    answers = dongle.askDongleBatch([(0x77, [0xD0], 1, 0), (0x77, [0xF2, 0x01], 0, 0), (0x77, [0xF2], 1, 0)])
+
+    assert values(answers) == [[0x60], None, [0x01]]
+
+
+@pytest.mark.parametrize("rbytes", [0, 1])
+def test_batch_waits(dongle, rbytes):
+
+    t0      = time.monotonic()
+    answers = dongle.askDongleBatch([(0x77, [0xF4, 0x25], rbytes, 300), (0x77, [0xD0], 1, 0)])
+
+    assert time.monotonic() - t0 >= 0.3
+    assert list(answers[1]) == [0x60]
+
+
+def test_batch_failed(dongle):
+
+    key     = (dongle.name, "test", "NoACK")
+    before  = dongle.stats.failures[key]
+    answers = dongle.askDongleBatch([(0x77, [0xD0], 1, 0), (0x50, [0x00], 2, 5), (0x77, [0xF2], 1, 0)], name="test")
+
+    assert values(answers) == [[0x60], None, [0x00]]
+    # the NoACK in the batch, then again in askDongle
+    assert dongle.stats.failures[key] >= before + 2